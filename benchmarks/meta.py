@@ -0,0 +1,171 @@
+"""GitHub /meta 条件请求和连接复用的基准测试
+
+使用本地HTTP服务模拟 /meta 接口: 返回合成的网段列表并带ETag和Last-Modified
+支持条件请求 可让前几次请求返回503以验证重试 不访问真实网络
+
+python benchmarks/meta.py --cidrs 5000 --flaky 1
+"""
+import argparse
+import email.utils
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def synthetic_meta(cidrs: int, seed: int) -> dict:
+    """生成与 /meta 结构相同的合成数据 地址取自基准测试保留网段198.18.0.0/15"""
+    rng = random.Random(seed)
+    services = ("hooks", "web", "api", "git", "packages", "pages", "importer", "actions")
+    meta = {"verifiable_password_authentication": False}
+    for i, service in enumerate(services):
+        count = cidrs // len(services)
+        meta[service] = [f"198.{18 + (i & 1)}.{rng.randrange(256)}.{rng.randrange(0, 256, 16)}/28"
+                         for _ in range(count)]
+        meta[service].append(f"2001:db8:{i:x}::/48")
+    return meta
+
+
+class MetaServer:
+    """在后台线程中运行的 /meta 模拟服务 统计请求数、连接数和响应字节数"""
+
+    def __init__(self, meta: dict, flaky=0):
+        self.body = json.dumps(meta).encode('utf-8')
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:16] + '"'
+        self.last_modified = email.utils.formatdate(usegmt=True)
+        # 每个新请求序列的前flaky次请求返回503
+        self.flaky = flaky
+        self.stats = {"requests": 0, "connections": 0, "not_modified": 0, "errors": 0, "bytes": 0}
+        self._failures = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.stats["connections"] += 1
+
+            def do_GET(self):
+                with server._lock:
+                    server.stats["requests"] += 1
+                    fail = server._failures < server.flaky
+                    if fail:
+                        server._failures += 1
+                        server.stats["errors"] += 1
+                if fail:
+                    self._reply(503, b"", {"Retry-After": "0"})
+                    return
+                if (self.headers.get("If-None-Match") == server.etag
+                        or self.headers.get("If-Modified-Since") == server.last_modified):
+                    with server._lock:
+                        server.stats["not_modified"] += 1
+                    self._reply(304, b"", {"ETag": server.etag})
+                    return
+                self._reply(200, server.body, {"ETag": server.etag,
+                                               "Last-Modified": server.last_modified,
+                                               "Content-Type": "application/json"})
+
+            def _reply(self, status, body, headers):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                if status != 304:
+                    self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server.stats["bytes"] += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> "MetaServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/meta"
+
+    def reset(self, flaky=None):
+        """重置失败计数 下一个请求重新开始按flaky返回503"""
+        with self._lock:
+            self._failures = 0
+            if flaky is not None:
+                self.flaky = flaky
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return result, round((time.perf_counter() - started) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cidrs", type=int, default=5000, help="合成网段数量")
+    parser.add_argument("--refreshes", type=int, default=20, help="条件请求刷新次数")
+    parser.add_argument("--flaky", type=int, default=1, help="首次请求前返回503的次数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # 数据目录指向临时目录 不影响本机保存的meta.json
+        os.environ["HOME"] = os.environ["APPDATA"] = directory
+        from github import GitHubAPI
+
+        with MetaServer(synthetic_meta(args.cidrs, args.seed), flaky=args.flaky) as server:
+            api = GitHubAPI(api_url=server.url)
+            ranges, first_ms = timed(api.get_github_ranges)
+            if sum(len(v) for v in ranges.values()) < args.cidrs:
+                raise RuntimeError("首次获取的网段数量不足")
+            first = dict(server.stats)
+
+            server.reset(flaky=0)
+            refresh_ms = []
+            for _ in range(args.refreshes):
+                api.meta_fetched = 0
+                _, elapsed = timed(api.get_github_networks)
+                refresh_ms.append(elapsed)
+
+            # 新进程冷启动: 从磁盘读取上次结果 仍只发送条件请求
+            cold = GitHubAPI(api_url=server.url)
+            _, cold_ms = timed(cold.get_github_networks)
+            if cold.meta_networks.keys() != api.meta_networks.keys():
+                raise RuntimeError("从磁盘加载的网段与内存中不一致")
+            stats = dict(server.stats)
+
+    refresh_ms.sort()
+    print(json.dumps({
+        "cidrs": args.cidrs,
+        "first": {"ms": first_ms, "requests": first["requests"], "errors": first["errors"],
+                  "bytes": first["bytes"]},
+        "refresh": {"count": args.refreshes, "median_ms": refresh_ms[len(refresh_ms) // 2],
+                    "max_ms": refresh_ms[-1]},
+        "cold_start_ms": cold_ms,
+        "server": stats,
+        "body_bytes_after_first": stats["bytes"] - first["bytes"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
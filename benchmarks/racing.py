@@ -0,0 +1,130 @@
+"""逐轮淘汰调度与穷举测试的对比
+
+在延迟轨迹上回放两种调度 比较每个域名选出的IP和发出的探测次数
+
+python benchmarks/racing.py --record trace.json     # 对真实网络录制轨迹
+python benchmarks/racing.py --trace trace.json      # 回放录制的轨迹
+python benchmarks/racing.py                         # 没有轨迹时使用固定种子生成的轨迹
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import ProbeScheduler, RacingScheduler  # noqa: E402
+
+
+class TraceTester:
+    """按顺序回放轨迹样本的PingTester替身 null表示丢包"""
+
+    def __init__(self, samples: Dict[str, List[float]], count=1, timeout=3):
+        self.samples = samples
+        self.count = count
+        self.timeout = timeout
+        self.cancelled = False
+        self.position = {ip: 0 for ip in samples}
+        self.probes = 0
+
+    def test_ips(self, ips, sni=None, use_cache=True, on_sample=None) -> Dict[str, float]:
+        results = {}
+        for ip in ips:
+            delays = []
+            for _ in range(self.count):
+                trace = self.samples[ip]
+                value = trace[self.position[ip] % len(trace)]
+                self.position[ip] += 1
+                self.probes += 1
+                if value is not None:
+                    delays.append(value)
+            results[ip] = sum(delays) / len(delays) if delays else float('inf')
+        return results
+
+
+def synthetic_trace(seed=1, domains=6, ips_per_domain=12, length=8) -> dict:
+    """生成固定种子的轨迹 每个IP有基础延迟、抖动和丢包率"""
+    rng = random.Random(seed)
+    trace = {"domains": {}, "samples": {}}
+    for d in range(domains):
+        ips = []
+        for i in range(ips_per_domain):
+            ip = f"10.{d}.{i}.1"
+            base = rng.choice([rng.uniform(20, 60), rng.uniform(80, 200), rng.uniform(200, 400)])
+            jitter = base * rng.uniform(0.02, 0.15)
+            loss = rng.choice([0, 0, 0, 0.1, 0.6])
+            trace["samples"][ip] = [None if rng.random() < loss else max(1.0, rng.gauss(base, jitter))
+                                    for _ in range(length)]
+            ips.append(ip)
+        trace["domains"][f"d{d}.example"] = ips
+    return trace
+
+
+def record_trace(path: str, length: int):
+    """对推荐域名录制真实的延迟轨迹"""
+    from github import GitHubAPI
+    from ping import PingTester
+
+    api = GitHubAPI()
+    domain_ips = {d: sorted(ips) for d, ips in api.resolve_many(api.get_recommended_domains()).items() if ips}
+    tester = PingTester(count=1)
+    ips = sorted({ip for values in domain_ips.values() for ip in values})
+    samples = {ip: [] for ip in ips}
+    for _ in range(length):
+        for ip, delay in tester.test_ips(ips, use_cache=False).items():
+            samples[ip].append(None if delay == float('inf') else delay)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"domains": domain_ips, "samples": samples}, f, indent=1)
+
+
+def compare(trace: dict, rounds: int) -> dict:
+    domain_ips = trace["domains"]
+
+    exhaustive_tester = TraceTester(trace["samples"])
+    exhaustive = ProbeScheduler(exhaustive_tester, budget=rounds)
+    exhaustive.run(domain_ips)
+
+    racing_tester = TraceTester(trace["samples"])
+    racing = RacingScheduler(racing_tester, max_rounds=rounds)
+    racing.run(domain_ips)
+
+    same = sum(1 for d in domain_ips if exhaustive.winners.get(d) == racing.winners.get(d))
+    return {
+        "domains": len(domain_ips),
+        "same_winner": same,
+        "exhaustive_probes": exhaustive_tester.probes,
+        "racing_probes": racing_tester.probes,
+        "probe_ratio": round(racing_tester.probes / max(exhaustive_tester.probes, 1), 3),
+        "racing_rounds": racing.stats["rounds"],
+        # 选择不同时 以穷举测得的均值计算多出的延迟
+        "mismatches": {d: {"exhaustive": exhaustive.winners.get(d),
+                           "racing": racing.winners.get(d),
+                           "regret_ms": round(exhaustive.results.get(racing.winners.get(d), float('inf'))
+                                              - exhaustive.results[exhaustive.winners[d]], 2)}
+                       for d in domain_ips if exhaustive.winners.get(d) != racing.winners.get(d)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", help="回放的轨迹文件")
+    parser.add_argument("--record", help="录制轨迹并保存到文件")
+    parser.add_argument("--rounds", type=int, default=4, help="每个IP最多探测次数")
+    parser.add_argument("--seed", type=int, default=1, help="生成轨迹的随机种子")
+    args = parser.parse_args()
+
+    if args.record:
+        record_trace(args.record, args.rounds)
+        return
+    if args.trace:
+        with open(args.trace, 'r', encoding='utf-8') as f:
+            trace = json.load(f)
+    else:
+        trace = synthetic_trace(args.seed, length=args.rounds)
+    print(json.dumps(compare(trace, args.rounds), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""多进程分片探测的吞吐量和限速基准测试
+
+探测引擎替身不发包 但完整执行每个回显请求的报文构造、校验和、回复解析和样本回传
+延迟取自固定种子的模拟网络 不同进程数下每个IP的样本完全相同 合并后的排序应一致
+
+python benchmarks/shard.py --ips 200000 --workers 1,2,4
+python benchmarks/shard.py --ips 20000 --workers 2 --rate 5000
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from icmp import ICMP_ECHO_REPLY, ICMPProber, RateLimiter, _checksum  # noqa: E402
+from shard import ShardedPingTester  # noqa: E402
+from suite import FakeNetwork  # noqa: E402
+
+
+class LoopbackProber(ICMPProber):
+    """把回显请求原样当作回复处理的ICMP探测引擎 用于衡量单核的处理能力"""
+
+    def __init__(self, mode="icmp", timeout=3, interval=0.0, port=443, rate=None, seed=1):
+        super().__init__(timeout=timeout, interval=interval, rate=rate)
+        self.network = FakeNetwork(seed)
+
+    def open(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    async def probe_many(self, ips: List[str], count=1,
+                         on_sample: Callable[[str, float], None] = None,
+                         sni: Dict[str, str] = None,
+                         cancel: threading.Event = None) -> Dict[str, List[float]]:
+        self._samples = {ip: [] for ip in ips}
+        self._on_sample = on_sample
+        limiter = RateLimiter(self.rate)
+        for _ in range(count):
+            for i, ip in enumerate(ips):
+                if cancel is not None and cancel.is_set():
+                    break
+                await limiter.wait()
+                self._seq = (self._seq + 1) & 0xffff
+                packet = bytearray(self._build_packet(self._seq))
+                # 模拟内核回送: 改为回复类型并重新计算校验和 再按接收路径解析
+                packet[0], packet[2:4] = ICMP_ECHO_REPLY, b'\x00\x00'
+                packet[2:4] = struct.pack('!H', _checksum(bytes(packet)))
+                icmp_type, _, _, _, seq = struct.unpack('!BBHHH', packet[:8])
+                if icmp_type == ICMP_ECHO_REPLY and seq == self._seq and _checksum(bytes(packet)) == 0:
+                    self._record(ip, self.network.sample(ip))
+                if i % 256 == 0:
+                    await asyncio.sleep(0)
+        self._on_sample = None
+        return self._samples
+
+
+def synthetic_ips(count: int) -> List[str]:
+    """基准测试保留网段198.18.0.0/15中的地址"""
+    return [f"198.{18 + i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(count)]
+
+
+def run(ips: List[str], workers: int, count: int, rate: float, seed: int) -> dict:
+    tester = ShardedPingTester(count=count, interval=0, rate=rate, workers=workers,
+                               prober_factory=functools.partial(LoopbackProber, seed=seed))
+    tester.prober = LoopbackProber(rate=rate, seed=seed)
+    received = 0
+
+    def on_sample(ip: str, delay: float):
+        nonlocal received
+        received += 1
+
+    started = time.perf_counter()
+    results = tester.test_ips(ips, use_cache=False, on_sample=on_sample)
+    elapsed = time.perf_counter() - started
+    ranked = sorted((delay, ip) for ip, delay in results.items() if delay != float('inf'))
+    return {
+        "workers": workers,
+        "shards": len(tester.shard_stats) or 1,
+        "seconds": round(elapsed, 3),
+        "probes_per_second": round(received / elapsed),
+        "samples": received,
+        "top": [ip for _, ip in ranked[:20]],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ips", type=int, default=200000, help="候选IP数量")
+    parser.add_argument("--count", type=int, default=1, help="每个IP的探测次数")
+    parser.add_argument("--workers", default="1,2,4", help="逗号分隔的进程数")
+    parser.add_argument("--rate", type=float, help="合计每秒探测数上限")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    ips = synthetic_ips(args.ips)
+    runs = [run(ips, int(workers), args.count, args.rate, args.seed)
+            for workers in args.workers.split(",")]
+    base, top = runs[0]["probes_per_second"], runs[0]["top"]
+    for item in runs:
+        item["speedup"] = round(item["probes_per_second"] / base, 2)
+        item["same_ranking"] = item.pop("top") == top
+        if args.rate:
+            item["within_rate"] = item["probes_per_second"] <= args.rate * 1.05
+    print(json.dumps({"ips": args.ips, "count": args.count, "cpus": os.cpu_count(),
+                      "rate": args.rate, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""界面程序的冷启动基准测试
+
+1. 导入main模块的耗时明细 并检查网络相关模块没有在启动时导入
+2. 从启动进程到窗口显示、载入上次结果和后台组件就绪的时间 需要图形界面
+3. 载入上次测速结果的耗时
+
+数据目录指向临时目录 其中预先写入合成的上次结果 不影响本机数据
+
+python benchmarks/startup.py --budget-ms 1500
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from store import SampleStore  # noqa: E402
+
+# 这些模块导入较慢 只应在窗口显示后的后台线程中导入
+DEFERRED = ("requests", "urllib3", "ping3", "asyncio", "ssl", "sqlite3", "numpy",
+            "concurrent.futures", "http.server", "github", "icmp", "scheduler")
+
+WINDOW_SCRIPT = """
+import json, sys, time
+import tkinter as tk
+import main
+root = tk.Tk()
+app = main.GitHubAccelerator(root)
+root.update()
+marks = {"window": time.time()}
+def check():
+    if app.latency_results and "last_results" not in marks:
+        marks["last_results"] = time.time()
+    if app.backend_ready:
+        marks["backend"] = time.time()
+        print(json.dumps(marks))
+        root.destroy()
+    else:
+        root.after(5, check)
+root.after(0, check)
+root.mainloop()
+"""
+
+
+def import_breakdown(env: dict, top: int) -> dict:
+    """用 -X importtime 统计导入main的耗时 返回总耗时和自身耗时最多的模块"""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True).stderr
+    modules = []
+    total = 0
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        modules.append((int(self_us), name.strip()))
+        if name.strip() == "main":
+            total = int(cumulative)
+    loaded = {name for _, name in modules}
+    return {
+        "total_ms": round(total / 1000, 1),
+        "slowest": [{"module": name, "self_ms": round(us / 1000, 1)}
+                    for us, name in sorted(modules, reverse=True)[:top]],
+        "eager": [name for name in DEFERRED if name in loaded],
+    }
+
+
+def window_times(env: dict) -> dict:
+    """启动界面进程 返回从创建进程起到各阶段的毫秒数 没有图形界面时返回错误信息"""
+    started = time.time()
+    result = subprocess.run([sys.executable, "-c", WINDOW_SCRIPT], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr else "失败"}
+    marks = json.loads(result.stdout.strip().splitlines()[-1])
+    return {f"{name}_ms": round((mark - started) * 1000, 1) for name, mark in marks.items()}
+
+
+def write_last_results(path: str, domains: list, ips_per_domain: int, seed: int):
+    """写入合成的上次测速结果"""
+    rng = random.Random(seed)
+    store = SampleStore(width=2)
+    for d, domain in enumerate(domains):
+        ips = [f"198.18.{d}.{i + 1}" for i in range(ips_per_domain)]
+        for ip in ips:
+            for _ in range(2):
+                store.add(ip, rng.uniform(20, 300))
+        store.set_domain(domain, ips)
+    store.save(path)
+
+
+def load_last_results(path: str) -> float:
+    """与界面相同的方式载入上次结果 返回毫秒数"""
+    started = time.perf_counter()
+    store = SampleStore.load(path)
+    domain_ips = {domain: store.domain_ips(domain) for domain in store.members}
+    store.results()
+    store.close()
+    if not domain_ips:
+        raise RuntimeError("没有载入任何域名")
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=1500,
+                        help="从启动进程到窗口显示的时间上限")
+    parser.add_argument("--ips-per-domain", type=int, default=16, help="上次结果中每个域名的IP数")
+    parser.add_argument("--top", type=int, default=10, help="输出导入最慢的模块数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, HOME=directory, APPDATA=directory)
+        os.environ.update(HOME=directory, APPDATA=directory)
+        from cache import get_data_dir
+        from profiles import load_profiles, profile_domains
+        samples_path = os.path.join(get_data_dir(), "samples.bin")
+        write_last_results(samples_path, profile_domains(load_profiles()), args.ips_per_domain, 1)
+
+        imports = import_breakdown(env, args.top)
+        window = window_times(env)
+        last_ms = load_last_results(samples_path)
+
+    window_ms = window.get("window_ms")
+    failures = []
+    if imports["eager"]:
+        failures.append(f"启动时导入了应延迟的模块: {', '.join(imports['eager'])}")
+    if window_ms is not None and window_ms > args.budget_ms:
+        failures.append(f"窗口显示耗时 {window_ms}ms 超过 {args.budget_ms}ms")
+
+    print(json.dumps({
+        "budget_ms": args.budget_ms,
+        "imports": imports,
+        "window": window,
+        "last_results_load_ms": last_ms,
+        "failures": failures,
+    }, indent=2, ensure_ascii=False))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
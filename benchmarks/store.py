@@ -0,0 +1,115 @@
+"""字典存储与列存储的内存和排序耗时对比
+
+python benchmarks/store.py --ips 300000 --samples 8
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import store as store_module  # noqa: E402
+from store import SampleStore  # noqa: E402
+
+
+def synthetic(ips: int, samples: int, domains: int, seed: int):
+    rng = random.Random(seed)
+    addresses = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(ips)]
+    domain_ips = {f"d{d}.example": addresses[d::domains] for d in range(domains)}
+    # 先转换为float32 两种存储中的样本值完全相同
+    values = [array('f', (float('inf') if rng.random() < 0.05 else rng.uniform(10, 400)
+                          for _ in range(samples))) for _ in range(ips)]
+    return addresses, domain_ips, values
+
+
+def build_dicts(addresses, domain_ips, values):
+    samples = {ip: list(row) for ip, row in zip(addresses, values)}
+    return {domain: list(ips) for domain, ips in domain_ips.items()}, samples
+
+
+def rank_dicts(domains, samples):
+    means = {}
+    for ip, row in samples.items():
+        received = [x for x in row if x != float('inf')]
+        means[ip] = sum(received) / len(received) if received else float('inf')
+    return {domain: sorted((ip for ip in ips if means[ip] != float('inf')), key=means.get)
+            for domain, ips in domains.items()}
+
+
+def build_store(addresses, domain_ips, values, width):
+    store = SampleStore(width=width)
+    for ip, row in zip(addresses, values):
+        for delay in row:
+            store.add(ip, delay)
+    for domain, ips in domain_ips.items():
+        store.set_domain(domain, ips)
+    return store
+
+
+def rank_store(store):
+    column = store.column()
+    return {domain: [ip for ip, _ in store.rank(domain, column=column)] for domain in store.members}
+
+
+def allocated(fn, *args):
+    """运行并返回结果占用的内存(MiB)"""
+    tracemalloc.start()
+    result = fn(*args)
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, round(current / 1024 / 1024, 2)
+
+
+def timed(fn, *args):
+    """运行并返回耗时(ms) tracemalloc会拖慢运行 不能与内存统计同时进行"""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, round((time.perf_counter() - started) * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ips", type=int, default=300000, help="候选IP数量")
+    parser.add_argument("--samples", type=int, default=8, help="每个IP的样本数")
+    parser.add_argument("--domains", type=int, default=30, help="域名数量")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    addresses, domain_ips, values = synthetic(args.ips, args.samples, args.domains, args.seed)
+
+    (domains, samples), dict_mib = allocated(build_dicts, addresses, domain_ips, values)
+    dict_ranked, dict_rank_ms = timed(rank_dicts, domains, samples)
+    del domains, samples
+
+    store, store_mib = allocated(build_store, addresses, domain_ips, values, args.samples)
+    store_ranked, store_rank_ms = timed(rank_store, store)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "samples.bin")
+        store.save(path)
+        started = time.perf_counter()
+        loaded = SampleStore.load(path)
+        load_ms = round((time.perf_counter() - started) * 1000, 2)
+        loaded_ranked = rank_store(loaded)
+        size_mib = round(os.path.getsize(path) / 1024 / 1024, 2)
+        loaded.close()
+
+    print(json.dumps({
+        "ips": args.ips,
+        "samples": args.samples,
+        "numpy": store_module.get_numpy() is not None,
+        "dict": {"memory_mib": dict_mib, "rank_ms": dict_rank_ms},
+        "store": {"memory_mib": store_mib, "rank_ms": store_rank_ms,
+                  "file_mib": size_mib, "load_ms": load_ms},
+        "same_order": dict_ranked == store_ranked == loaded_ranked,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
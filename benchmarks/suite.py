@@ -0,0 +1,313 @@
+"""解析、测速和hosts写入的可复现基准测试
+
+使用模拟网络: 本地DNS服务按固定种子返回合成域名的A记录 探测引擎按每个IP的延迟、
+抖动和丢包配置模拟应答 hosts文件为指定行数的合成文件 不访问真实网络
+
+python benchmarks/suite.py                                  # 运行并输出各阶段的结果
+python benchmarks/suite.py --save-baseline baseline.json    # 保存为基线
+python benchmarks/suite.py --baseline baseline.json         # 与基线对比 变慢时返回1
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dnsserver import DNSProxy  # noqa: E402
+from github import GitHubAPI  # noqa: E402
+from host import HostsManager  # noqa: E402
+from icmp import wait_any  # noqa: E402
+from ping import PingTester  # noqa: E402
+
+
+class FakeNetwork:
+    """按固定种子为每个IP生成基础延迟、抖动和丢包率 相同种子的样本序列完全相同"""
+
+    def __init__(self, seed=1, latency=(20.0, 400.0), jitter=0.1, loss=0.05):
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.profiles: Dict[str, tuple] = {}
+        self.counters: Dict[str, int] = {}
+
+    def profile(self, ip: str) -> tuple:
+        """IP的(基础延迟, 抖动标准差, 丢包率)"""
+        profile = self.profiles.get(ip)
+        if profile is None:
+            rng = random.Random(f"{self.seed}:{ip}")
+            base = rng.uniform(*self.latency)
+            profile = (base, base * self.jitter * rng.random(), self.loss * rng.random() * 2)
+            self.profiles[ip] = profile
+        return profile
+
+    def sample(self, ip: str) -> float:
+        """IP的下一个延迟样本(ms) 丢包为inf"""
+        n = self.counters.get(ip, 0)
+        self.counters[ip] = n + 1
+        base, jitter, loss = self.profile(ip)
+        rng = random.Random(f"{self.seed}:{ip}:{n}")
+        if rng.random() < loss:
+            return float('inf')
+        return max(1.0, rng.gauss(base, jitter))
+
+
+class FakeProber:
+    """与ICMPProber接口相同的模拟探测引擎 按time_scale缩放后真实等待"""
+
+    def __init__(self, network: FakeNetwork, timeout=3, interval=0.0, time_scale=0.01):
+        self.network = network
+        self.timeout = timeout
+        self.interval = interval
+        self.time_scale = time_scale
+        self.phases: Dict[str, List[Dict[str, float]]] = {}
+        self.sent = 0
+
+    def open(self) -> bool:
+        return True
+
+    def close(self):
+        pass
+
+    async def _probe(self, ip: str, samples: Dict[str, List[float]], on_sample):
+        self.sent += 1
+        delay = self.network.sample(ip)
+        wait = self.timeout if delay == float('inf') else delay / 1000
+        if self.time_scale:
+            await asyncio.sleep(wait * self.time_scale)
+        if delay != float('inf'):
+            samples[ip].append(delay)
+        if on_sample:
+            on_sample(ip, delay)
+
+    async def probe_many(self, ips: List[str], count=1,
+                         on_sample: Callable[[str, float], None] = None,
+                         sni: Dict[str, str] = None,
+                         cancel: threading.Event = None) -> Dict[str, List[float]]:
+        samples: Dict[str, List[float]] = {ip: [] for ip in ips}
+        for i in range(count):
+            if cancel is not None and cancel.is_set():
+                break
+            await asyncio.gather(*(self._probe(ip, samples, on_sample) for ip in ips))
+            if i < count - 1 and self.interval:
+                await wait_any([asyncio.sleep(self.interval)], cancel=cancel)
+        return samples
+
+
+class FakeDNSServer:
+    """在后台线程中运行只应答合成域名的本地DNS服务"""
+
+    def __init__(self, domain_ips: Dict[str, List[str]]):
+        # 上游指向不会应答的本地端口 合成域名之外的查询都会超时
+        self.proxy = DNSProxy("127.0.0.1", 9, timeout=0.5)
+        self.proxy.update(domain_ips)
+        self.loop = asyncio.SelectorEventLoop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self) -> "FakeDNSServer":
+        self.loop.run_until_complete(self.proxy.start("127.0.0.1", 0))
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.proxy.close()
+        self.loop.close()
+
+    @property
+    def server(self) -> str:
+        host, port = self.proxy.address
+        return f"{host}:{port}"
+
+    @property
+    def queries(self) -> int:
+        return self.proxy.stats["queries"]
+
+
+def synthetic_domains(seed: int, domains: int, ips_per_domain: int) -> Dict[str, List[str]]:
+    """生成合成域名及其IP 地址取自基准测试保留网段198.18.0.0/15 部分IP被多个域名共享"""
+    rng = random.Random(seed)
+    pool = [f"198.{18 + i // 65536}.{i // 256 % 256}.{i % 256}"
+            for i in range(1, max(domains * ips_per_domain * 3 // 4, ips_per_domain) + 1)]
+    return {f"bench{i}.github.test": rng.sample(pool, ips_per_domain) for i in range(domains)}
+
+
+def synthetic_hosts(path: str, lines: int, seed: int):
+    """写入指定行数的合成hosts文件 包含注释、空行和多域名条目"""
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("127.0.0.1\tlocalhost\n::1\tlocalhost\n")
+        for i in range(lines - 2):
+            kind = rng.random()
+            if kind < 0.05:
+                f.write(f"# comment {i}\n")
+            elif kind < 0.08:
+                f.write("\n")
+            elif kind < 0.15:
+                f.write(f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}\thost{i}.lan host{i} # alias\n")
+            else:
+                f.write(f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}\thost{i}.example.com\n")
+
+
+def measure(setup: Callable, run: Callable, repeat: int) -> dict:
+    """运行repeat次取墙钟和CPU时间的中位数 另运行一次统计峰值内存
+
+    setup在计时之外为每次运行准备状态 run返回本次发出的探测或查询次数
+    """
+    walls, cpus = [], []
+    probes = 0
+    for _ in range(repeat):
+        state = setup()
+        wall, cpu = time.perf_counter(), time.process_time()
+        probes = run(state)
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+
+    # tracemalloc会明显拖慢运行 只在单独的一次运行中开启
+    state = setup()
+    tracemalloc.start()
+    try:
+        run(state)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "wall_ms": round(statistics.median(walls) * 1000, 2),
+        "cpu_ms": round(statistics.median(cpus) * 1000, 2),
+        "probes": probes,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def run_suite(args) -> dict:
+    domain_ips = synthetic_domains(args.seed, args.domains, args.ips_per_domain)
+    domains = list(domain_ips)
+    stages = {}
+
+    with FakeDNSServer(domain_ips) as dns:
+        def resolve_setup():
+            return GitHubAPI(resolvers=[dns.server]), dns.queries
+
+        def resolve_run(state):
+            api, before = state
+            resolved = api.resolve_many(domains)
+            missing = [d for d in domains if set(domain_ips[d]) != resolved.get(d)]
+            if missing:
+                raise RuntimeError(f"模拟DNS解析结果不一致: {missing[:3]}")
+            return dns.queries - before
+
+        stages["resolve"] = measure(resolve_setup, resolve_run, args.repeat)
+
+    ips = list(dict.fromkeys(ip for values in domain_ips.values() for ip in values))
+
+    def probe_setup():
+        tester = PingTester(timeout=args.timeout, count=args.count, interval=0)
+        tester.prober = FakeProber(FakeNetwork(args.seed, jitter=args.jitter, loss=args.loss),
+                                   timeout=args.timeout, time_scale=args.time_scale)
+        return tester
+
+    def probe_run(tester):
+        tester.test_ips(ips, use_cache=False)
+        return tester.prober.sent
+
+    stages["probe"] = measure(probe_setup, probe_run, args.repeat)
+
+    tester = probe_setup()
+    latencies = tester.test_ips(ips, use_cache=False)
+    best = {domain: min(values, key=lambda ip: latencies.get(ip, float('inf')))
+            for domain, values in domain_ips.items()}
+
+    with tempfile.TemporaryDirectory() as directory:
+        hosts_path = os.path.join(directory, "hosts")
+
+        def hosts_setup():
+            synthetic_hosts(hosts_path, args.hosts_lines, args.seed)
+            return HostsManager(hosts_path, snapshot_dir=os.path.join(directory, "snapshots"))
+
+        def hosts_run(manager):
+            if not manager.update_github_hosts(best):
+                raise RuntimeError("写入hosts文件失败")
+            return 0
+
+        stages["hosts"] = measure(hosts_setup, hosts_run, args.repeat)
+
+    return {
+        "config": {
+            "seed": args.seed,
+            "domains": args.domains,
+            "ips_per_domain": args.ips_per_domain,
+            "unique_ips": len(ips),
+            "count": args.count,
+            "loss": args.loss,
+            "jitter": args.jitter,
+            "time_scale": args.time_scale,
+            "hosts_lines": args.hosts_lines,
+        },
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "stages": stages,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """与基线对比 返回变慢或探测次数增加的阶段说明"""
+    regressions = []
+    if current["config"] != baseline.get("config"):
+        print("警告: 基线的配置与本次不同 对比结果仅供参考", file=sys.stderr)
+    for name, stage in current["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None:
+            continue
+        for key in ("wall_ms", "cpu_ms", "peak_kib"):
+            if base[key] and stage[key] > base[key] * (1 + threshold):
+                regressions.append(f"{name}.{key}: {base[key]} -> {stage[key]}")
+            stage[f"{key}_ratio"] = round(stage[key] / base[key], 3) if base[key] else None
+        if stage["probes"] > base["probes"]:
+            regressions.append(f"{name}.probes: {base['probes']} -> {stage['probes']}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=1, help="模拟网络的随机种子")
+    parser.add_argument("--domains", type=int, default=200, help="合成域名数量")
+    parser.add_argument("--ips-per-domain", type=int, default=8, help="每个域名的A记录数量")
+    parser.add_argument("--count", type=int, default=2, help="每个IP的探测次数")
+    parser.add_argument("--timeout", type=float, default=3, help="模拟的探测超时(秒)")
+    parser.add_argument("--loss", type=float, default=0.05, help="平均丢包率")
+    parser.add_argument("--jitter", type=float, default=0.1, help="抖动相对基础延迟的最大比例")
+    parser.add_argument("--time-scale", type=float, default=0.01,
+                        help="模拟延迟的时间缩放 0表示不等待")
+    parser.add_argument("--hosts-lines", type=int, default=100000, help="合成hosts文件的行数")
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段的重复次数")
+    parser.add_argument("--baseline", help="对比的基线文件")
+    parser.add_argument("--save-baseline", help="将本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定变慢的相对阈值")
+    args = parser.parse_args()
+
+    result = run_suite(args)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        result["regressions"] = regressions
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+"""写入hosts后验证与回滚的端到端测试
+
+在127.0.0.0/8的多个回环地址上启动本地TLS服务模拟不同质量的IP:
+正常、响应慢、证书与域名不匹配、返回503、端口未监听
+先在临时hosts中写入原来的映射 再应用新映射并验证 检查最终的hosts是否只保留了可用且没有变慢的条目
+需要openssl命令生成自签名证书 不访问真实网络
+
+python benchmarks/verify.py --slow-ms 400
+"""
+import argparse
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from host import HostsManager  # noqa: E402
+from verify import HostsVerifier  # noqa: E402
+
+DOMAINS = ["github.com", "api.github.com", "raw.githubusercontent.com",
+           "codeload.github.com", "objects.githubusercontent.com", "gist.github.com"]
+
+# 地址 -> (证书中的域名, 响应前等待的秒数, 状态码) 为None时不监听
+SERVERS = {
+    "127.0.0.2": ("github", 0, 200),
+    "127.0.0.3": ("github", None, 200),
+    "127.0.0.4": ("other", 0, 200),
+    "127.0.0.5": ("github", 0, 503),
+    "127.0.0.7": ("github", 0, 301),
+}
+REFUSED = "127.0.0.6"
+PREVIOUS = "127.0.0.7"
+
+# 新映射 以及验证后期望的结果
+NEW_MAPPING = {
+    "github.com": "127.0.0.2",
+    "api.github.com": "127.0.0.3",
+    "raw.githubusercontent.com": "127.0.0.4",
+    "codeload.github.com": "127.0.0.5",
+    "objects.githubusercontent.com": REFUSED,
+    "gist.github.com": "127.0.0.4",
+}
+EXPECTED = {
+    "github.com": "127.0.0.2",
+    "api.github.com": PREVIOUS,
+    "raw.githubusercontent.com": PREVIOUS,
+    "codeload.github.com": PREVIOUS,
+    "objects.githubusercontent.com": PREVIOUS,
+}
+
+
+def make_certificate(directory: str, name: str, domains: list) -> tuple:
+    """用openssl生成包含指定域名的自签名证书 返回(证书路径, 私钥路径)"""
+    cert = os.path.join(directory, f"{name}.pem")
+    key = os.path.join(directory, f"{name}.key")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-keyout", key, "-out", cert, "-subj", f"/CN={domains[0]}",
+                    "-addext", "subjectAltName=" + ",".join(f"DNS:{d}" for d in domains),
+                    "-addext", "basicConstraints=critical,CA:TRUE"],
+                   check=True, capture_output=True)
+    return cert, key
+
+
+class StandInServer:
+    """在指定回环地址上运行的HTTPS服务 记录收到的请求数"""
+
+    def __init__(self, host: str, port: int, context: ssl.SSLContext, delay: float, status: int):
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_HEAD(self):
+                server.requests += 1
+                time.sleep(delay)
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        # 握手放到处理线程中 证书被拒绝时不阻塞其他连接
+        self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True,
+                                                do_handshake_on_connect=False)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def start_servers(certificates: dict, slow: float) -> tuple:
+    """在各地址上使用同一个端口启动服务 返回(端口, 服务列表)"""
+    servers = []
+    port = 0
+    for host, (certificate, delay, status) in SERVERS.items():
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*certificates[certificate])
+        server = StandInServer(host, port, context, slow if delay is None else delay, status)
+        port = server.port
+        servers.append(server)
+    return port, servers
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--slow-ms", type=float, default=400, help="慢速服务每次响应前的等待")
+    parser.add_argument("--margin", type=float, default=150, help="比原来的IP慢多少毫秒时回滚")
+    parser.add_argument("--timeout", type=float, default=3, help="每次请求的超时(秒)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        certificates = {
+            "github": make_certificate(directory, "github", DOMAINS),
+            "other": make_certificate(directory, "other", ["example.invalid"]),
+        }
+        cafile = os.path.join(directory, "ca.pem")
+        with open(cafile, "w") as f:
+            for cert, _ in certificates.values():
+                with open(cert) as c:
+                    f.write(c.read())
+
+        hosts_path = os.path.join(directory, "hosts")
+        with open(hosts_path, "w") as f:
+            f.write("127.0.0.1\tlocalhost\n")
+        hosts = HostsManager(hosts_path, snapshot_dir=os.path.join(directory, "snapshots"))
+        hosts.update_github_hosts({domain: PREVIOUS for domain in EXPECTED})
+
+        port, servers = start_servers(certificates, args.slow_ms / 1000)
+        try:
+            verifier = HostsVerifier(timeout=args.timeout, port=port, margin=args.margin,
+                                     cafile=cafile)
+            started = time.perf_counter()
+            report = verifier.apply(hosts, NEW_MAPPING)
+            elapsed = time.perf_counter() - started
+            final = hosts.get_mapping(DOMAINS)
+        finally:
+            for server in servers:
+                server.close()
+
+    failures = []
+    if final != EXPECTED:
+        failures.append(f"最终hosts与预期不一致: {final}")
+    # 并发验证时总耗时接近最慢的一个 而不是所有请求之和
+    serial = args.slow_ms / 1000 * verifier.attempts * 2
+    if elapsed >= serial:
+        failures.append(f"验证耗时 {elapsed:.2f}s 没有并发执行")
+
+    print(json.dumps({
+        "seconds": round(elapsed, 3),
+        "reverted": report["reverted"],
+        "domains": {domain: {"ok": entry["ok"], "reason": entry["reason"],
+                             "ms": [check["ms"] for check in entry["checks"]]}
+                    for domain, entry in report["domains"].items()},
+        "hosts": final,
+        "failures": failures,
+    }, indent=2, ensure_ascii=False))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
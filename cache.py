@@ -0,0 +1,196 @@
+import json
+import os
+import platform
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+
+def get_data_dir() -> str:
+    """获取本地数据目录"""
+    if platform.system() == "Windows":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+        path = os.path.join(base, "GitHubAcce")
+    else:
+        path = os.path.join(os.path.expanduser("~"), ".githubacce")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class ResultCache:
+    """持久化的DNS解析与延迟缓存 基于SQLite 按TTL和最近使用时间淘汰"""
+
+    def __init__(self, path: str = None, default_ttl=300, latency_ttl=600,
+                 history_size=20, history_age=7 * 86400, max_domains=500, max_networks=20):
+        self.path = path or os.path.join(get_data_dir(), "cache.db")
+        self.default_ttl = default_ttl
+        self.latency_ttl = latency_ttl
+        self.history_size = history_size
+        self.history_age = history_age
+        self.max_domains = max_domains
+        self.max_networks = max_networks
+        self.lock = threading.Lock()
+        # get_data_dir在启动时就会用到 sqlite3只在打开缓存时导入
+        import sqlite3
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS dns (
+                domain TEXT NOT NULL,
+                ip TEXT NOT NULL,
+                expires REAL NOT NULL,
+                last_used REAL NOT NULL,
+                versions TEXT NOT NULL DEFAULT '4',
+                PRIMARY KEY (domain, ip)
+            );
+            CREATE TABLE IF NOT EXISTS latency (
+                ip TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                delay REAL NOT NULL,
+                ts REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS latency_ip_ts ON latency (ip, mode, ts);
+            CREATE TABLE IF NOT EXISTS networks (
+                network TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                last_seen REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS network_ips (
+                network TEXT NOT NULL,
+                domain TEXT NOT NULL,
+                ips TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (network, domain)
+            );
+        """)
+        # 旧版本的缓存没有记录查询过的协议族 当时只查询过A记录之外的情况无法区分 按只有IPv4处理
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(dns)")]
+        if "versions" not in columns:
+            self.conn.execute("ALTER TABLE dns ADD COLUMN versions TEXT NOT NULL DEFAULT '4'")
+            self.conn.commit()
+        self.evict()
+
+    def close(self):
+        """关闭数据库"""
+        with self.lock:
+            self.conn.close()
+
+    def get_domain_ips(self, domain: str, versions: Sequence[int] = (4,)) -> Optional[Set[str]]:
+        """获取未过期的域名解析结果 只返回versions中协议族的IP
+
+        不存在、已过期或解析时没有查询全部versions中的协议族时返回None
+        """
+        now = time.time()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT ip, versions FROM dns WHERE domain = ? AND expires > ?", (domain, now)).fetchall()
+            if not rows or not set(versions) <= {int(v) for v in rows[0][1].split()}:
+                return None
+            self.conn.execute("UPDATE dns SET last_used = ? WHERE domain = ?", (now, domain))
+            self.conn.commit()
+        return {ip for ip, _ in rows if (6 if ':' in ip else 4) in versions}
+
+    def put_domain_ips(self, domain: str, ips: Iterable[str], ttl: int = None,
+                       versions: Sequence[int] = (4,)):
+        """保存域名解析结果 versions为解析时查询的协议族"""
+        now = time.time()
+        expires = now + (ttl if ttl is not None else self.default_ttl)
+        queried = ' '.join(str(v) for v in sorted(versions))
+        with self.lock:
+            self.conn.execute("DELETE FROM dns WHERE domain = ?", (domain,))
+            self.conn.executemany(
+                "INSERT INTO dns (domain, ip, expires, last_used, versions) VALUES (?, ?, ?, ?, ?)",
+                [(domain, ip, expires, now, queried) for ip in ips])
+            self.conn.commit()
+
+    def get_latencies(self, ips: Iterable[str], mode="icmp", max_age: float = None) -> Dict[str, float]:
+        """获取指定探测模式下仍然新鲜的最近一次延迟 超时结果同样会被缓存为inf"""
+        since = time.time() - (max_age if max_age is not None else self.latency_ttl)
+        result = {}
+        with self.lock:
+            for ip in ips:
+                row = self.conn.execute(
+                    "SELECT delay FROM latency WHERE ip = ? AND mode = ? AND ts > ? "
+                    "ORDER BY ts DESC LIMIT 1", (ip, mode, since)).fetchone()
+                if row is not None:
+                    result[ip] = row[0]
+        return result
+
+    def get_history(self, ip: str, mode="icmp") -> list:
+        """获取IP的延迟历史 按时间从旧到新返回(ts, delay)"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT ts, delay FROM latency WHERE ip = ? AND mode = ? ORDER BY ts",
+                (ip, mode)).fetchall()
+        return [(ts, delay) for ts, delay in rows]
+
+    def add_latencies(self, results: Dict[str, float], mode="icmp"):
+        """记录一批延迟结果"""
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT INTO latency (ip, mode, delay, ts) VALUES (?, ?, ?, ?)",
+                [(ip, mode, delay, now) for ip, delay in results.items()])
+            self.conn.commit()
+
+    def get_network_profile(self, network: str) -> Dict[str, List[str]]:
+        """获取某个网络下各域名的候选IP 每个列表的第一个为上次选用的IP"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT domain, ips FROM network_ips WHERE network = ? ORDER BY domain",
+                (network,)).fetchall()
+        return {domain: ips.split() for domain, ips in rows}
+
+    def put_network_profile(self, network: str, fingerprint: dict, domain_ips: Dict[str, List[str]]):
+        """保存某个网络下各域名的候选IP 只替换本次给出的域名"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO networks (network, fingerprint, last_seen) VALUES (?, ?, ?)",
+                (network, json.dumps(fingerprint, sort_keys=True), now))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO network_ips (network, domain, ips, updated) VALUES (?, ?, ?, ?)",
+                [(network, domain, ' '.join(ips), now) for domain, ips in domain_ips.items() if ips])
+            self.conn.commit()
+
+    def list_networks(self) -> List[dict]:
+        """列出保存过结果的网络 最近出现的在前"""
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT n.network, n.fingerprint, n.last_seen, COUNT(i.domain)
+                FROM networks n LEFT JOIN network_ips i ON i.network = n.network
+                GROUP BY n.network ORDER BY n.last_seen DESC""").fetchall()
+        return [{"network": network, "fingerprint": json.loads(fingerprint),
+                 "last_seen": last_seen, "domains": domains}
+                for network, fingerprint, last_seen, domains in rows]
+
+    def evict(self):
+        """淘汰过期数据 限制每个IP的历史长度、域名数量和网络数量"""
+        now = time.time()
+        with self.lock:
+            # 过期较久的解析结果 保留一个TTL周期以便离线时参考
+            self.conn.execute("DELETE FROM dns WHERE expires < ?", (now - self.default_ttl,))
+            self.conn.execute("DELETE FROM latency WHERE ts < ?", (now - self.history_age,))
+            # 只保留最近history_size条延迟记录
+            self.conn.execute("""
+                DELETE FROM latency WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (PARTITION BY ip, mode ORDER BY ts DESC) AS n
+                        FROM latency
+                    ) WHERE n > ?
+                )""", (self.history_size,))
+            # 按最近使用时间淘汰多余的域名
+            self.conn.execute("""
+                DELETE FROM dns WHERE domain IN (
+                    SELECT domain FROM dns GROUP BY domain
+                    ORDER BY MAX(last_used) DESC LIMIT -1 OFFSET ?
+                )""", (self.max_domains,))
+            # 只保留最近出现过的max_networks个网络的结果
+            self.conn.execute("""
+                DELETE FROM networks WHERE network IN (
+                    SELECT network FROM networks ORDER BY last_seen DESC LIMIT -1 OFFSET ?
+                )""", (self.max_networks,))
+            self.conn.execute(
+                "DELETE FROM network_ips WHERE network NOT IN (SELECT network FROM networks)")
+            self.conn.commit()
@@ -0,0 +1,98 @@
+import ipaddress
+import random
+from typing import Dict, Iterable, Iterator, List, Union
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+# GitHub /meta 中各服务对应的加速域名
+META_SERVICE_DOMAINS = {
+    "web": ["github.com", "gist.github.com", "codeload.github.com"],
+    "api": ["api.github.com"],
+    "git": ["github.com"],
+    "pages": ["github.io"],
+}
+
+# IPv6网段极其稀疏 只在每个子块开头的低位地址中抽样
+IPV6_BLOCK_PREFIX = 48
+IPV6_HOST_RANGE = 256
+
+
+def sample_network(network: Network, per_block=1, block_prefix=24,
+                   max_samples=256, rng: random.Random = None) -> Iterator[str]:
+    """分层抽样网段中的主机地址
+
+    将网段按block_prefix划分为若干子块 子块过多时再均匀分组
+    每组随机取per_block个地址 跳过子块的首尾地址 全程不展开整个网段
+    IPv6网段按/48划分 只在子块的前256个地址中抽样
+    """
+    rng = rng or random.Random()
+    address = ipaddress.IPv4Address if network.version == 4 else ipaddress.IPv6Address
+    if network.version == 6:
+        block_prefix = IPV6_BLOCK_PREFIX
+    if network.prefixlen >= block_prefix:
+        block_size = network.num_addresses
+        blocks = 1
+    else:
+        block_size = 1 << (network.max_prefixlen - block_prefix)
+        blocks = 1 << (block_prefix - network.prefixlen)
+
+    strata = min(blocks, max(1, max_samples // per_block))
+    stride = blocks / strata
+    base = int(network.network_address)
+
+    for i in range(strata):
+        block = int(i * stride + rng.random() * stride)
+        block_start = base + block * block_size
+        if block_size <= 2:
+            yield str(address(block_start))
+            continue
+        usable = block_size - 2
+        if network.version == 6:
+            usable = min(usable, IPV6_HOST_RANGE - 1)
+        for offset in rng.sample(range(usable), min(per_block, usable)):
+            yield str(address(block_start + 1 + offset))
+
+
+def compile_ranges(ranges: Dict[str, List[str]]) -> Dict[str, List[Network]]:
+    """预先解析各服务的CIDR字符串 无效的网段被忽略"""
+    compiled = {}
+    for service, cidrs in ranges.items():
+        networks = []
+        for cidr in cidrs:
+            try:
+                networks.append(ipaddress.ip_network(cidr, strict=False))
+            except ValueError:
+                continue
+        compiled[service] = networks
+    return compiled
+
+
+def iter_candidates(ranges: Dict[str, List[Union[str, Network]]], services: Iterable[str] = None,
+                    per_block=1, max_per_prefix=256, seed: Union[int, str] = None,
+                    versions: Iterable[int] = (4,)) -> Iterator[str]:
+    """按服务遍历/meta网段并生成候选IP 重复的网段只抽样一次 versions为包含的IP版本
+
+    网段可以是CIDR字符串或compile_ranges预先解析的网段对象
+    指定seed时每个网段用seed和网段本身单独播种 同一网段无论属于哪些服务、排在第几个都得到相同的候选
+    """
+    rng = random.Random()
+    seen_networks = set()
+    for service in services or ranges.keys():
+        for cidr in ranges.get(service, []):
+            if isinstance(cidr, str):
+                try:
+                    network = ipaddress.ip_network(cidr, strict=False)
+                except ValueError:
+                    continue
+            else:
+                network = cidr
+            if network.version not in versions or network in seen_networks:
+                continue
+            seen_networks.add(network)
+            yield from sample_network(network, per_block=per_block, max_samples=max_per_prefix,
+                                      rng=rng if seed is None else random.Random(f"{seed}/{network}"))
+
+
+def services_for_domain(domain: str) -> List[str]:
+    """获取域名对应的/meta服务"""
+    return [service for service, domains in META_SERVICE_DOMAINS.items() if domain in domains]
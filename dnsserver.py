@@ -0,0 +1,211 @@
+import asyncio
+import random
+import socket
+import struct
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from resolver import QTYPE_A, QTYPE_AAAA, parse_response, read_name
+
+RCODE_SERVFAIL = 2
+
+
+class DNSProxy:
+    """本地DNS转发服务 加速域名按延迟返回多个A/AAAA记录 其余查询转发到上游并缓存"""
+
+    def __init__(self, upstream="1.1.1.1", upstream_port=53, ttl=30, timeout=3,
+                 cache_size=10000):
+        self.upstream = (upstream, upstream_port)
+        self.ttl = ttl
+        self.timeout = timeout
+        self.cache_size = cache_size
+        # 域名 -> {查询类型: 预先编码好的应答区(记录数, 字节)}
+        self.answers: Dict[str, Dict[int, Tuple[int, bytes]]] = {}
+        self.cache: "OrderedDict[bytes, Tuple[float, bytes]]" = OrderedDict()
+        self.stats = {"queries": 0, "local": 0, "cache_hits": 0, "forwarded": 0}
+        self._pending: Dict[int, tuple] = {}
+        self._upstream_transport = None
+        self._udp_transport = None
+        self._tcp_server = None
+
+    def update(self, domain_ips: Dict[str, List[str]]):
+        """更新加速域名的IP列表 列表应按延迟从低到高排列 IPv4和IPv6地址分别作为A和AAAA记录"""
+        answers = {}
+        for domain, ips in domain_ips.items():
+            records = {QTYPE_A: (0, b''), QTYPE_AAAA: (0, b'')}
+            for ip in ips:
+                if ':' in ip:
+                    qtype, rdata = QTYPE_AAAA, socket.inet_pton(socket.AF_INET6, ip)
+                else:
+                    qtype, rdata = QTYPE_A, socket.inet_aton(ip)
+                count, data = records[qtype]
+                data += b'\xc0\x0c' + struct.pack('!HHIH', qtype, 1, self.ttl, len(rdata)) + rdata
+                records[qtype] = (count + 1, data)
+            answers[domain.lower().rstrip('.')] = records
+        # 整体替换 其他线程调用时无需加锁
+        self.answers = answers
+
+    def _parse_question(self, data: bytes) -> Optional[Tuple[str, int, int]]:
+        """解析查询 返回(域名, 类型, 问题区结束偏移)"""
+        try:
+            if len(data) < 12 or struct.unpack('!H', data[4:6])[0] != 1:
+                return None
+            name, offset = read_name(data, 12)
+            qtype = struct.unpack('!H', data[offset:offset + 2])[0]
+            return name, qtype, offset + 4
+        except (IndexError, ValueError, struct.error):
+            return None
+
+    def _local_answer(self, data: bytes, name: str, qtype: int, end: int) -> Optional[bytes]:
+        """为加速域名构造应答 没有对应地址的类型返回空应答 避免客户端绕过"""
+        entry = self.answers.get(name)
+        if entry is None:
+            return None
+        count, records = entry.get(qtype, (0, b''))
+        flags = 0x8180 | (struct.unpack('!H', data[2:4])[0] & 0x0100)
+        return data[:2] + struct.pack('!HHHHH', flags, 1, count, 0, 0) + data[12:end] + records
+
+    def _error(self, txid: bytes, rcode: int) -> bytes:
+        """构造只有头部的错误应答"""
+        return txid + struct.pack('!H', 0x8180 | rcode) + b'\x00' * 8
+
+    def handle(self, data: bytes) -> Tuple[Optional[bytes], Optional[bytes]]:
+        """处理一个查询 返回(可直接返回的应答, 需要转发时的缓存键)"""
+        self.stats["queries"] += 1
+        question = self._parse_question(data)
+        if question is None:
+            return None, None
+        name, qtype, end = question
+
+        response = self._local_answer(data, name, qtype, end)
+        if response is not None:
+            self.stats["local"] += 1
+            return response, None
+
+        key = name.encode() + data[end - 4:end]
+        cached = self.cache.get(key)
+        if cached is not None:
+            expires, payload = cached
+            if expires > time.monotonic():
+                self.cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return data[:2] + payload[2:], None
+            del self.cache[key]
+        return None, key
+
+    def _store(self, key: bytes, response: bytes):
+        """缓存上游应答 TTL取应答中的最小值"""
+        try:
+            _, rcode, answers = parse_response(response)
+        except (IndexError, ValueError, struct.error):
+            return
+        if rcode != 0 or not answers or response[2] & 0x02:
+            return
+        ttl = min(answer[2] for answer in answers)
+        self.cache[key] = (time.monotonic() + ttl, response)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def _forward(self, data: bytes, key: bytes, reply):
+        """通过UDP转发到上游 reply为收到应答后的回调"""
+        self.stats["forwarded"] += 1
+        while True:
+            txid = random.randint(0, 0xffff)
+            if txid not in self._pending:
+                break
+        loop = asyncio.get_running_loop()
+        timer = loop.call_later(self.timeout, self._expire, txid)
+        self._pending[txid] = (data[:2], key, reply, timer)
+        self._upstream_transport.sendto(struct.pack('!H', txid) + data[2:], self.upstream)
+
+    def _expire(self, txid: int):
+        entry = self._pending.pop(txid, None)
+        if entry is not None:
+            original_id, _, reply, _ = entry
+            reply(self._error(original_id, RCODE_SERVFAIL))
+
+    def _on_upstream(self, data: bytes):
+        if len(data) < 12:
+            return
+        entry = self._pending.pop(struct.unpack('!H', data[:2])[0], None)
+        if entry is None:
+            return
+        original_id, key, reply, timer = entry
+        timer.cancel()
+        self._store(key, data)
+        reply(original_id + data[2:])
+
+    async def start(self, host="127.0.0.1", port=53):
+        """启动UDP和TCP服务"""
+        loop = asyncio.get_running_loop()
+        proxy = self
+
+        class Upstream(asyncio.DatagramProtocol):
+            def datagram_received(self, data, addr):
+                proxy._on_upstream(data)
+
+        class UDPServer(asyncio.DatagramProtocol):
+            def connection_made(self, transport):
+                self.transport = transport
+
+            def datagram_received(self, data, addr):
+                response, key = proxy.handle(data)
+                if response is not None:
+                    self.transport.sendto(response, addr)
+                elif key is not None:
+                    proxy._forward(data, key, lambda r, a=addr: self.transport.sendto(r, a))
+
+        family = socket.AF_INET6 if ':' in self.upstream[0] else socket.AF_INET
+        self._upstream_transport, _ = await loop.create_datagram_endpoint(Upstream, family=family)
+        self._udp_transport, _ = await loop.create_datagram_endpoint(UDPServer, local_addr=(host, port))
+        # TCP与UDP使用同一端口 port为0时取UDP实际分配的端口
+        self._tcp_server = await asyncio.start_server(self._handle_tcp, host, self.address[1])
+
+    async def _handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """TCP查询 每条消息带两字节长度前缀"""
+        try:
+            while True:
+                length = struct.unpack('!H', await reader.readexactly(2))[0]
+                data = await reader.readexactly(length)
+                response, key = self.handle(data)
+                if response is None and key is not None:
+                    response = await self._forward_tcp(data, key)
+                if response is None:
+                    break
+                writer.write(struct.pack('!H', len(response)) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def _forward_tcp(self, data: bytes, key: bytes) -> bytes:
+        """通过TCP转发 用于应答可能被截断的TCP查询"""
+        self.stats["forwarded"] += 1
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(*self.upstream), self.timeout)
+            writer.write(struct.pack('!H', len(data)) + data)
+            length = struct.unpack('!H', await asyncio.wait_for(reader.readexactly(2), self.timeout))[0]
+            response = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+            self._store(key, response)
+            return response
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return self._error(data[:2], RCODE_SERVFAIL)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._udp_transport.get_extra_info('sockname')[:2]
+
+    def close(self):
+        for transport in (self._udp_transport, self._upstream_transport):
+            if transport is not None:
+                transport.close()
+        if self._tcp_server is not None:
+            self._tcp_server.close()
@@ -1,131 +1,224 @@
-import requests
 import json
-from typing import Dict, List, Set
-import ipaddress
-import socket
-from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Set, Tuple
+import os
+import time
+from cache import ResultCache, get_data_dir
+from candidates import Network, compile_ranges, iter_candidates, services_for_domain
+from icmp import run_sync
+from metrics import metrics
+from profiles import DomainProfile, group_domains, load_profiles, profile_domains, recommended_domains
+from resolver import QTYPE_A, QTYPE_AAAA, DNSResolver
+from session import create_session
 
 class GitHubAPI:
-    def __init__(self):
-        self.api_url = "https://api.github.com/meta"
+    def __init__(self, cache: ResultCache = None, resolvers: List[str] = None, ipv6=False,
+                 api_url="https://api.github.com/meta", session=None,
+                 profiles: Dict[str, DomainProfile] = None):
+        self.api_url = api_url
+        self._session = session
+        self.cache = cache
+        self.resolver = DNSResolver(resolvers)
+        self.set_ipv6(ipv6)
+        self.meta_ranges: Dict[str, List[str]] = {}
+        # 预先解析的网段 内容未变化时不再重复解析
+        self.meta_networks: Dict[str, List[Network]] = {}
+        # /meta 中各产品的域名 用于补充域名配置
+        self.meta_domains: Dict[str, List[str]] = {}
+        self.meta_etag = None
+        self.meta_last_modified = None
+        self.meta_fetched = 0.0
         self.domain_ips: Dict[str, Set[str]] = {}
-        
-        # GitHub域名
-        self.static_domains = [
-            "github.com",
-            "github.global.ssl.fastly.net",
-            "gist.github.com",
-            "help.github.com",
-            "status.github.com",
-            "training.github.com",
-            "github.io",
-            "github.community",
-            "github.dev",
-            "api.github.com",
-            "collector.github.com",
-            "pipelines.actions.githubusercontent.com",
-            "media.githubusercontent.com",
-            "codeload.github.com",
-            "cloud.githubusercontent.com",
-            "objects.githubusercontent.com",
-            "raw.githubusercontent.com",
-            "user-images.githubusercontent.com",
-            "favicons.githubusercontent.com",
-            "avatars.githubusercontent.com",
-            "avatars0.githubusercontent.com",
-            "avatars1.githubusercontent.com",
-            "avatars2.githubusercontent.com",
-            "avatars3.githubusercontent.com",
-            "github.githubassets.com",
-            "alive.github.com",
-            "central.github.com",
-            "live.github.com",
-            "githubapp.com",
-            "githubstatus.com"
-        ]
+        self.domain_expires: Dict[str, float] = {}
+        # 解析时查询过的协议族 切换IPv6后没有查询过的协议族需要重新解析
+        self.domain_versions: Dict[str, Tuple[int, ...]] = {}
+        self.profiles = profiles if profiles is not None else load_profiles()
+        # 最近一次分组的结果 每组的第一个域名作为代表
+        self.domain_groups: List[List[str]] = []
     
-    def get_github_ips(self) -> Dict[str, List[str]]:
-        """从GitHub API获取所有IP地址"""
+    @property
+    def session(self):
+        """复用连接的HTTP会话 第一次使用时创建"""
+        if self._session is None:
+            self._session = create_session()
+        return self._session
+    
+    def set_ipv6(self, enabled: bool):
+        """启用后同时解析AAAA记录并从IPv6网段中抽样候选"""
+        self.ipv6 = enabled
+        self.versions = (4, 6) if enabled else (4,)
+        self.resolver.ipv6 = enabled
+        self.resolver.qtypes = (QTYPE_A, QTYPE_AAAA) if enabled else (QTYPE_A,)
+    
+    def get_github_ranges(self) -> Dict[str, List[str]]:
+        """获取GitHub /meta 中各服务的网段
+
+        使用ETag和Last-Modified发送条件请求 未变化时服务端返回304 不下载也不重新解析
+        """
+        if self.meta_ranges and time.time() - self.meta_fetched < 3600:
+            return self.meta_ranges
+        
+        meta_path = os.path.join(get_data_dir(), "meta.json")
+        if not self.meta_ranges:
+            self._load_meta(meta_path)
+        
         try:
-            response = requests.get(self.api_url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            result = {}
-            for key, values in data.items():
-                if key == "verifiable_password_authentication":
-                    continue
-                
-                ipv4_list = []
-                for item in values:
-                    try:
-                        network = ipaddress.ip_network(item, strict=False)
-                        if network.version == 4:
-                            ipv4_list.append(str(network.network_address))
-                    except ValueError:
-                        try:
-                            ip = ipaddress.ip_address(item)
-                            if ip.version == 4:
-                                ipv4_list.append(item)
-                        except ValueError:
-                            continue
-                
-                result[key] = ipv4_list
-            
-            return result
+            headers = {}
+            if self.meta_etag:
+                headers["If-None-Match"] = self.meta_etag
+            if self.meta_last_modified:
+                headers["If-Modified-Since"] = self.meta_last_modified
+            with metrics.timer("stage", stage="meta"):
+                response = self.session.get(self.api_url, headers=headers, timeout=10)
+            metrics.inc("meta_requests", status=response.status_code)
+            if response.status_code != 304 or not self.meta_ranges:
+                response.raise_for_status()
+                data = response.json()
+                self._set_meta(data, response.headers.get("ETag"),
+                               response.headers.get("Last-Modified"))
+                self._save_meta(meta_path, data)
         except Exception as e:
             print(f"获取GitHub IP失败: {e}")
-            return {}
+            metrics.inc("meta_failures", cause=type(e).__name__)
+        
+        self.meta_fetched = time.time()
+        return self.meta_ranges
+    
+    def _set_meta(self, data: dict, etag: str = None, last_modified: str = None):
+        self.meta_ranges = {key: values for key, values in data.items() if isinstance(values, list)}
+        self.meta_networks = compile_ranges(self.meta_ranges)
+        domains = data.get("domains")
+        self.meta_domains = domains if isinstance(domains, dict) else {}
+        self.meta_etag = etag
+        self.meta_last_modified = last_modified
+    
+    def _load_meta(self, meta_path: str):
+        """读取上次保存的/meta内容和校验头"""
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            self._set_meta(cached["data"], cached.get("etag"), cached.get("last_modified"))
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+    
+    def _save_meta(self, meta_path: str, data: dict):
+        """先写临时文件再替换 避免中断时留下不完整的文件"""
+        tmp_path = meta_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"etag": self.meta_etag, "last_modified": self.meta_last_modified,
+                           "data": data}, f)
+            os.replace(tmp_path, meta_path)
+        except OSError as e:
+            print(f"保存GitHub /meta失败: {e}")
+    
+    @property
+    def candidate_seed(self) -> str:
+        """抽样候选IP的种子 由/meta的版本决定
+
+        共用服务的域名从同一网段抽到相同的候选 可以跨域名去重 /meta不变时每次运行也相同
+        """
+        return self.meta_etag or self.meta_last_modified or ""
+    
+    def get_github_networks(self) -> Dict[str, List[Network]]:
+        """各服务预先解析的网段"""
+        self.get_github_ranges()
+        return self.meta_networks
+    
+    def get_github_ips(self) -> Dict[str, List[str]]:
+        """从GitHub API获取所有IP地址 每个网段取一个可用主机"""
+        result = {}
+        for key, networks in self.get_github_networks().items():
+            result[key] = list(iter_candidates({key: networks}, max_per_prefix=1,
+                                               seed=self.candidate_seed, versions=self.versions))
+        return result
+    
+    def get_candidate_ips(self, domain: str, per_block=1, max_per_prefix=16) -> List[str]:
+        """从域名对应服务的/meta网段中抽样候选IP"""
+        services = services_for_domain(domain)
+        if not services:
+            return []
+        networks = self.get_github_networks()
+        return list(iter_candidates(networks, services, per_block=per_block, versions=self.versions,
+                                    max_per_prefix=max_per_prefix, seed=self.candidate_seed))
     
     def get_domain_ips(self, domain: str) -> Set[str]:
         """获取指定域名的IP地址"""
-        if domain in self.domain_ips:
-            return self.domain_ips[domain]
+        return self.resolve_many([domain]).get(domain, set())
+    
+    def resolve_many(self, domains: List[str]) -> Dict[str, Set[str]]:
+        """批量解析域名 未过期的缓存直接返回 其余同时向所有上游查询"""
+        result = {}
+        pending = []
+        now = time.time()
+        for domain in domains:
+            if (domain in self.domain_ips and self.domain_expires.get(domain, 0) > now
+                    and set(self.versions) <= set(self.domain_versions.get(domain, ()))):
+                # 缓存可能来自启用IPv6时的解析
+                cached = self._filter(self.domain_ips[domain])
+                if cached:
+                    result[domain] = cached
+                    continue
+            cached = self.cache.get_domain_ips(domain, self.versions) if self.cache else None
+            if cached:
+                self._remember(domain, cached)
+                result[domain] = cached
+                continue
+            pending.append(domain)
+        
+        metrics.inc("dns_cache_hits", len(result))
+        metrics.inc("dns_cache_misses", len(pending))
+        if not pending:
+            return result
         
         try:
-            ips = set()
-            # 使用多线程DNS解析
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                futures = []
-                for record_type in [socket.AF_INET]:  # 只获取IPv4
-                    future = executor.submit(self._resolve_dns, domain, record_type)
-                    futures.append(future)
-                
-                for future in futures:
-                    try:
-                        result = future.result(timeout=5)
-                        if result:
-                            ips.update(result)
-                    except:
-                        continue
-            
-            self.domain_ips[domain] = ips
-            return ips
+            with metrics.timer("stage", stage="resolve"):
+                answers = run_sync(self.resolver.resolve_many(pending))
         except Exception as e:
-            print(f"获取域名 {domain} 的IP失败: {e}")
-            return set()
+            print(f"批量解析域名失败: {e}")
+            metrics.inc("dns_failures", upstream="all", cause=type(e).__name__)
+            answers = {}
+        
+        for domain in pending:
+            ips, ttl = answers.get(domain, (set(), 0))
+            result[domain] = ips
+            if ips:
+                self._remember(domain, ips, ttl)
+                if self.cache:
+                    self.cache.put_domain_ips(domain, ips, ttl, self.versions)
+            else:
+                metrics.inc("dns_unresolved")
+        return result
     
-    def _resolve_dns(self, domain: str, record_type: int) -> Set[str]:
-        """DNS解析"""
-        try:
-            ips = set()
-            for info in socket.getaddrinfo(domain, 0, record_type):
-                ips.add(info[4][0])
-            return ips
-        except:
-            return set()
+    def _remember(self, domain: str, ips: Set[str], ttl: int = None):
+        """记录到内存缓存"""
+        if ttl is None:
+            ttl = self.cache.default_ttl if self.cache else 300
+        self.domain_ips[domain] = ips
+        self.domain_expires[domain] = time.time() + ttl
+        self.domain_versions[domain] = self.versions
+
+    def _filter(self, ips: Set[str]) -> Set[str]:
+        """只保留当前启用的协议族的IP"""
+        return {ip for ip in ips if (6 if ':' in ip else 4) in self.versions}
+    
+    def get_profile_domains(self, names: Iterable[str] = None) -> List[str]:
+        """指定配置中的域名 未指定时使用所有启用的配置 已获取过/meta时包含其中列出的域名"""
+        return profile_domains(self.profiles, names, self.meta_domains)
+    
+    def group_domains(self, domains: List[str]) -> List[List[str]]:
+        """解析域名并按CNAME链和IP集合分组 同组域名可以共用一次测速结果和一行hosts
+        
+        缓存命中的域名没有CNAME链 只按IP集合分组
+        """
+        resolved = self.resolve_many(domains)
+        self.domain_groups = group_domains({domain: resolved.get(domain, set()) for domain in domains},
+                                           self.resolver.cnames)
+        return self.domain_groups
     
     def get_all_domains(self) -> List[str]:
         """获取所有支持的域名列表"""
-        return self.static_domains
+        return self.get_profile_domains()
     
     def get_recommended_domains(self) -> List[str]:
         """获取推荐加速的域名"""
-        return [
-            "github.com",
-            "github.global.ssl.fastly.net",
-            "raw.githubusercontent.com",
-            "objects.githubusercontent.com",
-            "avatars.githubusercontent.com",
-            "github.githubassets.com"
-        ]
\ No newline at end of file
+        return recommended_domains(self.profiles)
\ No newline at end of file
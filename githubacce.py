@@ -0,0 +1,495 @@
+"""无界面命令行入口
+
+python -m githubacce run --domains recommended --interval 30m
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Dict, List
+
+from cache import ResultCache, get_data_dir
+from dnsserver import DNSProxy
+from github import GitHubAPI
+from host import HostsManager
+from icmp import run_sync
+from metrics import metrics
+from network import NetworkWatcher, best_candidates, profile_mapping
+from ping import PingTester, PROBE_MODES
+from resolver import DEFAULT_RESOLVERS, DNSResolver
+from scheduler import ProbeScheduler, RacingScheduler
+from shard import ShardedPingTester
+from verify import HostsVerifier
+
+
+def parse_interval(text: str) -> float:
+    """解析时间间隔 支持 90 / 90s / 30m / 1h"""
+    units = {"s": 1, "m": 60, "h": 3600}
+    text = text.strip().lower()
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def select_domains(api: GitHubAPI, spec: str) -> List[str]:
+    """解析域名参数 recommended/all 或逗号分隔的域名和域名配置名称"""
+    if spec == "recommended":
+        return api.get_recommended_domains()
+    if spec == "all":
+        return api.get_all_domains()
+    domains = {}
+    for item in (item.strip() for item in spec.split(",")):
+        if item in api.profiles:
+            domains.update(dict.fromkeys(api.get_profile_domains([item])))
+        elif item:
+            domains[item] = None
+    return list(domains)
+
+
+class Optimizer:
+    """无界面的优化流程 复用GitHubAPI/PingTester/HostsManager"""
+
+    def __init__(self, domains: List[str], mode="icmp", hysteresis=20.0, count=2, timeout=3,
+                 hosts_path: str = None, dry_run=False, scan=False, resolvers: List[str] = None,
+                 race=False, ipv6=False, workers=1, rate: float = None, group=False,
+                 per_network=True, verify=True):
+        self.cache = ResultCache()
+        self.github_api = GitHubAPI(cache=self.cache, resolvers=resolvers, ipv6=ipv6)
+        if workers > 1:
+            self.ping_tester = ShardedPingTester(timeout=timeout, count=count, mode=mode,
+                                                 cache=self.cache, rate=rate, workers=workers)
+        else:
+            self.ping_tester = PingTester(timeout=timeout, count=count, mode=mode,
+                                          cache=self.cache, rate=rate)
+        if race:
+            self.scheduler = RacingScheduler(self.ping_tester, max_rounds=max(count, 2))
+        else:
+            self.scheduler = ProbeScheduler(self.ping_tester)
+        self.hosts_manager = HostsManager(hosts_path)
+        self.domains = domains
+        self.hysteresis = hysteresis
+        self.dry_run = dry_run
+        self.scan = scan
+        self.ipv6 = ipv6
+        self.group = group
+        # 按网络指纹保存各域名的最佳IP 回到已知网络时立即恢复
+        self.network = NetworkWatcher() if per_network else None
+        self._applied_network = None
+        # 写入hosts后验证新IP 失败或变慢的条目回滚
+        self.verifier = HostsVerifier() if verify else None
+        self.verification: dict = None
+        # 验证失败被回滚的IP 之后不再选用 切换网络时清空
+        self.rejected: Dict[str, set] = {}
+
+    def _dual_stack(self, domain: str, ip: str):
+        """启用IPv6时同时写入另一协议族中最快的IP 否则系统仍会用DNS解析另一协议族"""
+        if not self.ipv6 or not ip:
+            return ip
+        for candidate, _ in self.scheduler.store.rank(domain):
+            if (':' in candidate) != (':' in ip):
+                return [ip, candidate]
+        return ip
+
+    def _choose(self, best_ip: str, current_ip: str, results: Dict[str, float]) -> dict:
+        """选出域名的IP 当前IP仍可用且差距不超过滞后阈值时保持不变"""
+        current = results.get(current_ip, float('inf')) if current_ip else float('inf')
+        # 没有测出有效延迟的IP不能作为胜出者
+        if best_ip and results.get(best_ip, float('inf')) == float('inf'):
+            best_ip = None
+        if not best_ip:
+            return {"ip": current_ip, "latency": None, "previous": current_ip, "changed": False}
+
+        best = results[best_ip]
+        changed = best_ip != current_ip and (current == float('inf') or current - best > self.hysteresis)
+        ip = best_ip if changed else current_ip
+        latency = best if changed else current
+        return {"ip": ip, "latency": round(latency, 1), "previous": current_ip, "changed": changed}
+
+    def probe(self, known: Dict[str, List[str]] = None) -> tuple:
+        """解析并测速所有域名 返回(域名->IP列表, 当前hosts映射, 测速结果)
+
+        known中有候选IP的域名直接测速这些IP 不再解析和扫描
+        延迟缓存不区分网络 给出known时是在切换网络后重新测速 不使用缓存的延迟
+        """
+        use_cache = not known
+        known = known or {}
+        domain_ips = {domain: list(known[domain]) for domain in self.domains if known.get(domain)}
+        missing = [domain for domain in self.domains if domain not in domain_ips]
+        resolved = {domain: list(ips) for domain, ips in
+                    self.github_api.resolve_many(missing).items() if ips} if missing else {}
+        domain_ips.update(resolved)
+        if self.scan:
+            for domain, ips in resolved.items():
+                # 候选可能有数十万个 用字典去重并保持顺序
+                domain_ips[domain] = list(dict.fromkeys(ips + self.github_api.get_candidate_ips(domain)))
+
+        # 当前hosts中的IP也参与测速 用于滞后比较
+        current = self.hosts_manager.get_mapping(self.domains)
+        for domain, ips in domain_ips.items():
+            if current.get(domain) and current[domain] not in ips:
+                ips.append(current[domain])
+
+        groups = self._groups(domain_ips)
+        if groups:
+            # 同组域名合并候选 只以代表域名调度 再把结果分给组内其他域名
+            for group in groups:
+                merged = list(dict.fromkeys(ip for domain in group for ip in domain_ips[domain]))
+                for domain in group:
+                    domain_ips[domain] = merged
+            self.scheduler.run({group[0]: domain_ips[group[0]] for group in groups}, use_cache=use_cache)
+            self.scheduler.stats["groups"] = len(groups)
+            for group in groups:
+                for domain in group[1:]:
+                    self.scheduler.store.set_domain(domain, domain_ips[domain])
+                    if group[0] in self.scheduler.winners:
+                        self.scheduler.winners[domain] = self.scheduler.winners[group[0]]
+        else:
+            self.scheduler.run(domain_ips, use_cache=use_cache)
+        try:
+            # 保存本轮的全部样本 可以用SampleStore.load直接映射查看
+            self.scheduler.store.save(os.path.join(get_data_dir(), "samples.bin"))
+        except OSError as e:
+            print(f"保存测速样本失败: {e}", file=sys.stderr)
+        return domain_ips, current, self.scheduler.results
+
+    def _groups(self, domain_ips: Dict[str, List[str]]) -> List[List[str]]:
+        """启用分组时按DNS关系分组 只包含有候选IP的域名"""
+        if not self.group:
+            return []
+        return self.github_api.group_domains(list(domain_ips))
+
+    def rank(self) -> Dict[str, List[str]]:
+        """每个域名的可用IP 按延迟从低到高排列"""
+        domain_ips, _, _ = self.probe()
+        return self._ranked(domain_ips)
+
+    def _ranked(self, domain_ips: Dict[str, List[str]]) -> Dict[str, List[str]]:
+        """按最近一轮测速结果排列每个域名的可用IP"""
+        store = self.scheduler.store
+        column = store.column()
+        ranked = {}
+        for domain in domain_ips:
+            ranked[domain] = [ip for ip, _ in store.rank(domain, column=column)]
+            # 逐轮淘汰时胜出者不一定是均值最低的 放在首位
+            winner = self.scheduler.winners.get(domain)
+            if winner in ranked[domain]:
+                ranked[domain].remove(winner)
+                ranked[domain].insert(0, winner)
+        return ranked
+
+    def write(self, mapping: Dict[str, object]) -> bool:
+        """写入hosts 启用验证时回滚失败或变慢的条目 验证结果保存在verification中"""
+        if not self.verifier:
+            return self.hosts_manager.update_github_hosts(mapping)
+        self.verification = self.verifier.apply(self.hosts_manager, mapping)
+        return self.verification["written"]
+
+    def check_network(self) -> bool:
+        """重新计算网络指纹 切换到另一个网络时返回True"""
+        if self.network and self.network.check():
+            self.rejected.clear()
+            return True
+        return False
+
+    def reapply(self) -> bool:
+        """当前网络有保存的结果且还没有应用时 立即写入hosts 返回是否写入"""
+        if not self.network or not self.network.key or self._applied_network == self.network.key:
+            return False
+        self._applied_network = self.network.key
+        profile = self.cache.get_network_profile(self.network.key)
+        mapping = profile_mapping({domain: profile[domain] for domain in self.domains
+                                   if domain in profile}, self.ipv6)
+        if not mapping or self.dry_run:
+            return False
+        current = self.hosts_manager.get_mapping(self.domains)
+        first = {domain: ips if isinstance(ips, str) else ips[0] for domain, ips in mapping.items()}
+        if all(current.get(domain) == ip for domain, ip in first.items()):
+            return False
+        written = self.write(mapping)
+        metrics.inc("network_reapplied")
+        return written
+
+    def remember(self, report: Dict[str, dict], domain_ips: Dict[str, List[str]]):
+        """把本轮选用的IP和排名靠前的候选保存到当前网络"""
+        if not self.network or not self.network.key:
+            return
+        ranked = self._ranked(domain_ips)
+        profile = {domain: best_candidates(info["ip"], ranked.get(domain, []))
+                   for domain, info in report.items()
+                   if info["ip"] and info["latency"] not in (None, float('inf'))}
+        self.cache.put_network_profile(self.network.key, self.network.fingerprint, profile)
+        self._applied_network = self.network.key
+
+    def run_once(self, refine=False) -> dict:
+        """执行一轮解析 测速 并在必要时更新hosts
+
+        当前网络有保存的结果时先立即写入 refine时只重新测速保存的候选IP 不做完整的解析和扫描
+        """
+        started = time.time()
+        if self.network and self.network.key is None:
+            self.check_network()
+        reapplied = self.reapply()
+        known = {}
+        if refine and self.network and self.network.key:
+            known = self.cache.get_network_profile(self.network.key)
+        domain_ips, current, results = self.probe(known)
+
+        report = {}
+        for domain in self.domains:
+            best = self.scheduler.winners.get(domain)
+            rejected = self.rejected.get(domain, ())
+            if best in rejected:
+                best = next((ip for ip, _ in self.scheduler.store.rank(domain)
+                             if ip not in rejected), None)
+            report[domain] = self._choose(best, current.get(domain), results)
+
+        mapping = {domain: self._dual_stack(domain, info["ip"])
+                   for domain, info in report.items() if info["ip"]}
+        changed = any(info["changed"] for info in report.values())
+        written = False
+        self.verification = None
+        if changed and not self.dry_run:
+            written = self.write(mapping)
+            if written and self.verification:
+                # 被回滚的域名保持原来的IP
+                for domain in self.verification["reverted"]:
+                    self.rejected.setdefault(domain, set()).add(report[domain]["ip"])
+                    previous = report[domain]["previous"]
+                    report[domain].update(
+                        ip=previous, changed=False,
+                        latency=round(results.get(previous, float('inf')), 1) if previous else None,
+                        reverted=self.verification["domains"][domain]["reason"])
+        metrics.inc("ip_changes", sum(1 for info in report.values() if info["changed"]))
+        metrics.observe("stage", time.time() - started, stage="run")
+        self.remember(report, domain_ips)
+
+        return {
+            "timestamp": int(started),
+            "duration": round(time.time() - started, 3),
+            "mode": self.ping_tester.mode,
+            "network": self.network.key if self.network else None,
+            "reapplied": reapplied,
+            "refined": bool(known),
+            "probes": self.scheduler.stats,
+            "domains": report,
+            "changed": changed,
+            "written": written,
+            "verification": self._verification_summary(),
+        }
+
+    def _verification_summary(self) -> dict:
+        """每个域名新IP的验证结果和耗时"""
+        if not self.verification or not self.verification["domains"]:
+            return None
+        return {domain: {"ok": entry["ok"], "ms": [check["ms"] for check in entry["checks"]],
+                         "reverted": entry["reverted"], "reason": entry["reason"]}
+                for domain, entry in self.verification["domains"].items()}
+
+    def wait(self, seconds: float, poll: float = None) -> bool:
+        """等待下一轮 每隔poll秒检测网络 切换网络时提前返回True"""
+        deadline = time.time() + seconds
+        poll = poll if poll is not None and self.network else 0
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            time.sleep(min(poll, remaining) if poll > 0 else remaining)
+            if poll > 0 and self.check_network():
+                return True
+
+
+def manage_backups(hosts_manager: HostsManager, action: str, version: str = None) -> int:
+    """hosts版本管理子命令"""
+    if action == "list":
+        print(json.dumps(hosts_manager.list_backups(), ensure_ascii=False, indent=2))
+        return 0
+    if action == "diff":
+        if not version:
+            print("需要指定版本", file=sys.stderr)
+            return 1
+        print(hosts_manager.diff_backup(version), end="")
+        return 0
+    return 0 if hosts_manager.restore_backup(version) else 1
+
+
+def show_profiles(api: GitHubAPI, discover=False) -> int:
+    """输出域名配置 discover时获取/meta补充域名 并按DNS关系输出分组"""
+    if discover:
+        api.get_github_ranges()
+    result = {"profiles": {name: {"enabled": profile.enabled, "description": profile.description,
+                                  "domains": api.get_profile_domains([name])}
+                           for name, profile in api.profiles.items()}}
+    if discover:
+        result["groups"] = [group for group in api.group_domains(api.get_all_domains())
+                            if len(group) > 1]
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+def show_networks(cache: ResultCache) -> int:
+    """输出当前网络的指纹和保存过结果的网络"""
+    watcher = NetworkWatcher()
+    watcher.check()
+    networks = cache.list_networks()
+    for entry in networks:
+        entry["current"] = entry["network"] == watcher.key
+        entry["ips"] = cache.get_network_profile(entry["network"])
+    print(json.dumps({"current": {"network": watcher.key, "fingerprint": watcher.fingerprint},
+                      "networks": networks}, ensure_ascii=False, indent=2))
+    return 0
+
+
+def run_dns_proxy(args) -> int:
+    """运行本地DNS服务 并定期用最新测速结果更新应答"""
+    host, _, port = args.listen.rpartition(":")
+    host = host.strip("[]")
+    upstream, upstream_port = DNSResolver._parse_server(args.upstream)
+    # 系统解析器可能已指向本服务 不能再作为上游
+    resolvers = args.resolver or [r for r in DEFAULT_RESOLVERS if r != "system"]
+    optimizer = Optimizer([], mode=args.mode, resolvers=resolvers, dry_run=True, ipv6=args.ipv6)
+    optimizer.domains = select_domains(optimizer.github_api, args.domains)
+    proxy = DNSProxy(upstream, upstream_port)
+
+    def top(ips: List[str]) -> List[str]:
+        """每个协议族各取前records个 分别作为A和AAAA记录"""
+        v4 = [ip for ip in ips if ':' not in ip]
+        v6 = [ip for ip in ips if ':' in ip]
+        return v4[:args.records] + v6[:args.records]
+
+    interval = parse_interval(args.interval)
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        await proxy.start(host, int(port))
+        print(json.dumps({"listen": args.listen, "domains": optimizer.domains}), flush=True)
+        while True:
+            # 测速在线程中执行 不阻塞DNS服务
+            ranked = await loop.run_in_executor(None, optimizer.rank)
+            proxy.update({domain: top(ips) for domain, ips in ranked.items() if ips})
+            print(json.dumps({"timestamp": int(time.time()), "domains": ranked,
+                              "stats": proxy.stats}, ensure_ascii=False), flush=True)
+            await asyncio.sleep(interval)
+
+    try:
+        run_sync(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.close()
+    return 0
+
+
+def setup_metrics(args):
+    """按命令行参数启用指标接口和追踪文件 都未指定时不记录任何指标"""
+    if args.trace:
+        metrics.enable(args.trace)
+    if args.metrics:
+        host, _, port = args.metrics.rpartition(":")
+        metrics.serve(host or "127.0.0.1", int(port))
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="githubacce", description="GitHub加速工具 命令行模式")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="解析 测速并更新hosts")
+    run.add_argument("--domains", default="recommended",
+                     help="recommended / all / 逗号分隔的域名或域名配置名称(如 core,actions)")
+    run.add_argument("--interval", help="定期重新优化的间隔 如 30m 不指定则只运行一次")
+    run.add_argument("--mode", choices=PROBE_MODES, default="icmp", help="探测方式")
+    run.add_argument("--hysteresis", type=float, default=20.0,
+                     help="新IP至少快多少毫秒才替换当前IP")
+    run.add_argument("--count", type=int, default=2, help="每个IP的探测次数")
+    run.add_argument("--timeout", type=float, default=3, help="探测超时(秒)")
+    run.add_argument("--hosts-file", help="hosts文件路径 默认使用系统hosts")
+    run.add_argument("--resolver", action="append", help="上游DNS 可重复指定")
+    run.add_argument("--scan", action="store_true", help="从GitHub网段中抽样更多候选IP")
+    run.add_argument("--dry-run", action="store_true", help="只输出结果 不写入hosts")
+    run.add_argument("--race", action="store_true",
+                     help="逐轮淘汰明显较慢的IP 只对有竞争力的IP追加探测")
+    run.add_argument("--ipv6", action="store_true",
+                     help="同时解析和探测IPv6地址 hosts中为每个域名写入两种地址")
+    run.add_argument("--group", action="store_true",
+                     help="按CNAME链和解析结果把共用CDN的域名分组 每组只测速一次")
+    run.add_argument("--workers", type=int, default=1,
+                     help="分片探测的进程数 候选IP较多时(如配合--scan)可按CPU核数设置")
+    run.add_argument("--rate", type=float, help="所有进程合计每秒最多发出的探测数 默认不限制")
+    run.add_argument("--no-verify", dest="verify", action="store_false",
+                     help="写入hosts后不通过新IP发起HTTPS请求验证 也不自动回滚")
+    run.add_argument("--no-network-profiles", dest="per_network", action="store_false",
+                     help="不按网络保存和恢复结果")
+    run.add_argument("--network-poll", default="10s",
+                     help="定期运行时检测网络切换的间隔 切换后立即恢复该网络保存的结果 0为不检测")
+    run.add_argument("--metrics", help="Prometheus指标接口的监听地址 如 127.0.0.1:9464")
+    run.add_argument("--trace", help="以JSON lines格式追加写入各阶段耗时的文件")
+
+    serve = subparsers.add_parser("serve", help="运行本地DNS服务 代替修改hosts")
+    serve.add_argument("--domains", default="recommended",
+                       help="recommended / all / 逗号分隔的域名或域名配置名称(如 core,actions)")
+    serve.add_argument("--listen", default="127.0.0.1:53", help="监听地址")
+    serve.add_argument("--upstream", default="1.1.1.1", help="转发其他查询的上游DNS")
+    serve.add_argument("--interval", default="10m", help="重新测速的间隔")
+    serve.add_argument("--records", type=int, default=4, help="每个域名返回的A记录数量")
+    serve.add_argument("--mode", choices=PROBE_MODES, default="icmp", help="探测方式")
+    serve.add_argument("--resolver", action="append", help="上游DNS 可重复指定")
+    serve.add_argument("--ipv6", action="store_true", help="同时解析和探测IPv6地址 返回AAAA记录")
+    serve.add_argument("--metrics", help="Prometheus指标接口的监听地址 如 127.0.0.1:9464")
+    serve.add_argument("--trace", help="以JSON lines格式追加写入各阶段耗时的文件")
+
+    backups = subparsers.add_parser("backups", help="查看 对比或恢复hosts历史版本")
+    backups.add_argument("action", choices=["list", "diff", "restore"])
+    backups.add_argument("version", nargs="?", help="版本ID或其前缀")
+    backups.add_argument("--hosts-file", help="hosts文件路径 默认使用系统hosts")
+
+    profiles = subparsers.add_parser("profiles", help="查看域名配置")
+    profiles.add_argument("--discover", action="store_true",
+                          help="获取/meta中的新域名 并输出共用CDN的域名分组")
+    profiles.add_argument("--resolver", action="append", help="上游DNS 可重复指定")
+
+    subparsers.add_parser("networks", help="查看当前网络的指纹和各网络保存的结果")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "networks":
+        return show_networks(ResultCache())
+    if args.command == "profiles":
+        return show_profiles(GitHubAPI(resolvers=args.resolver), args.discover)
+    if args.command == "backups":
+        return manage_backups(HostsManager(args.hosts_file), args.action, args.version)
+    setup_metrics(args)
+    if args.command == "serve":
+        return run_dns_proxy(args)
+
+    optimizer = Optimizer([], mode=args.mode, hysteresis=args.hysteresis, count=args.count,
+                          timeout=args.timeout, hosts_path=args.hosts_file, dry_run=args.dry_run,
+                          scan=args.scan, resolvers=args.resolver, race=args.race, ipv6=args.ipv6,
+                          workers=args.workers, rate=args.rate, group=args.group,
+                          per_network=args.per_network, verify=args.verify)
+    optimizer.domains = select_domains(optimizer.github_api, args.domains)
+
+    if not args.interval:
+        report = optimizer.run_once()
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        failed = report["changed"] and not report["written"] and not args.dry_run
+        return 1 if failed or not any(info["ip"] for info in report["domains"].values()) else 0
+
+    interval = parse_interval(args.interval)
+    poll = parse_interval(args.network_poll)
+    refine = False
+    try:
+        while True:
+            report = optimizer.run_once(refine)
+            print(json.dumps(report, ensure_ascii=False), flush=True)
+            # 切换网络后立即开始下一轮 只重新测速该网络保存的候选IP
+            refine = optimizer.wait(max(interval - report["duration"], 0), poll)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    # 打包后的程序启动分片子进程时需要
+    multiprocessing.freeze_support()
+    sys.exit(main())
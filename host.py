@@ -1,13 +1,28 @@
+import hashlib
 import os
 import tempfile
 import platform
 import shutil
-from typing import Dict, List
+from typing import Dict, Iterable, List, Union
+from cache import get_data_dir
+from metrics import metrics
+from snapshot import SnapshotStore
+
+# 加速配置块的起止标记
+BLOCK_START = "# GitHub加速配置"
+BLOCK_END = "# GitHub加速配置结束"
+# Windows的hosts每行只识别有限个主机名 合并的条目按此拆分
+NAMES_PER_LINE = 8
 
 class HostsManager:
-    def __init__(self):
+    def __init__(self, hosts_path: str = None, snapshot_dir: str = None):
         self.system = platform.system()
-        self.hosts_path = self._get_hosts_path()
+        self.hosts_path = hosts_path or self._get_hosts_path()
+        if snapshot_dir is None:
+            # 不同的hosts文件各自保存版本
+            key = hashlib.sha1(os.path.abspath(self.hosts_path).encode('utf-8')).hexdigest()[:12]
+            snapshot_dir = os.path.join(get_data_dir(), "snapshots", key)
+        self.snapshots = SnapshotStore(snapshot_dir)
     
     def _get_hosts_path(self) -> str:
         """获取系统hosts文件路径"""
@@ -23,70 +38,200 @@ class HostsManager:
                 return f.readlines()
         except Exception as e:
             print(f"读取hosts文件失败: {e}")
+            metrics.inc("hosts_failures", operation="read", cause=type(e).__name__)
             return []
     
+    def get_mapping(self, domains: List[str]) -> Dict[str, str]:
+        """获取hosts文件中指定域名当前指向的IP 同时有IPv4和IPv6条目时取第一条"""
+        wanted = set(domains)
+        mapping = {}
+        for line in self.read_hosts():
+            parts = line.split('#', 1)[0].split()
+            for domain in parts[1:]:
+                if domain in wanted:
+                    mapping.setdefault(domain, parts[0])
+        return mapping
+    
+    def get_entries(self, domains: List[str]) -> Dict[str, List[str]]:
+        """获取hosts文件中指定域名的所有IP 按出现顺序排列"""
+        wanted = set(domains)
+        entries: Dict[str, List[str]] = {}
+        for line in self.read_hosts():
+            parts = line.split('#', 1)[0].split()
+            for domain in parts[1:]:
+                if domain in wanted and parts[0] not in entries.setdefault(domain, []):
+                    entries[domain].append(parts[0])
+        return entries
+    
+    def get_block(self, lines: List[str] = None) -> Dict[str, List[str]]:
+        """获取加速配置块中每个域名的所有IP 按出现顺序排列 lines为已经读取的hosts内容"""
+        entries: Dict[str, List[str]] = {}
+        in_block = False
+        for line in self.read_hosts() if lines is None else lines:
+            stripped = line.strip()
+            if stripped in (BLOCK_START, BLOCK_END):
+                in_block = stripped == BLOCK_START
+                continue
+            if not in_block:
+                continue
+            parts = line.split('#', 1)[0].split()
+            for domain in parts[1:]:
+                if parts[0] not in entries.setdefault(domain, []):
+                    entries[domain].append(parts[0])
+        return entries
+    
     def write_hosts(self, lines: List[str]) -> bool:
-        """写入hosts文件"""
+        """写入hosts文件 内容未变化时跳过"""
         try:
-            # 创建备份
-            self._create_backup()
+            content = ''.join(lines)
+            if content == ''.join(self.read_hosts()):
+                metrics.inc("hosts_writes", result="unchanged")
+                return True
             
-            # 写入新文件
-            with open(self.hosts_path, 'w', encoding='utf-8') as f:
-                f.writelines(lines)
+            with metrics.timer("stage", stage="hosts_write"):
+                # 创建备份
+                self._create_backup()
+                
+                self._atomic_write(content)
+            metrics.inc("hosts_writes", result="written")
             return True
         except Exception as e:
             print(f"写入hosts文件失败: {e}")
+            metrics.inc("hosts_failures", operation="write", cause=type(e).__name__)
             return False
     
+    def _atomic_write(self, content: str):
+        """先写入同目录下的临时文件再重命名 避免写到一半的hosts文件"""
+        directory = os.path.dirname(self.hosts_path) or '.'
+        fd, tmp_path = tempfile.mkstemp(prefix='.hosts.', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(self.hosts_path):
+                shutil.copymode(self.hosts_path, tmp_path)
+            try:
+                os.replace(tmp_path, self.hosts_path)
+            except OSError:
+                # 容器中挂载的hosts等无法替换的文件 退回原地写入
+                metrics.inc("hosts_inplace_writes")
+                with open(self.hosts_path, 'w', encoding='utf-8') as f:
+                    f.write(content)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    
     def _create_backup(self):
-        """创建hosts文件备份"""
+        """将当前hosts文件保存为一个版本"""
         try:
-            backup_path = self.hosts_path + ".backup"
-            shutil.copy2(self.hosts_path, backup_path)
-        except:
-            pass
+            with open(self.hosts_path, 'r', encoding='utf-8') as f:
+                self.snapshots.save(f.read())
+        except Exception as e:
+            print(f"保存hosts版本失败: {e}")
+            metrics.inc("hosts_failures", operation="backup", cause=type(e).__name__)
+    
+    def list_backups(self) -> List[Dict]:
+        """列出已保存的hosts版本 最新的在前"""
+        return self.snapshots.list()
+    
+    def diff_backup(self, version: str) -> str:
+        """对比指定版本与当前hosts文件"""
+        old = self.snapshots.read(version)
+        if old is None:
+            return ""
+        return self.snapshots.diff(old, ''.join(self.read_hosts()),
+                                   f"hosts@{version[:12]}", self.hosts_path)
     
-    def update_github_hosts(self, domain_ips: Dict[str, str]) -> bool:
-        """更新hosts文件中的GitHub相关条目"""
+    def update_github_hosts(self, domain_ips: Dict[str, Union[str, List[str]]],
+                            remove: Iterable[str] = ()) -> bool:
+        """更新hosts文件中的GitHub加速配置块 只替换标记之间的内容
+
+        值可以是IP列表 每个IP写一行 用于同时提供IPv4和IPv6地址
+        只替换给出的域名 配置块中的其他域名保持不变 remove中的域名从配置块中移除
+        """
+        with metrics.timer("stage", stage="hosts_update"):
+            return self._update_github_hosts(domain_ips, remove)
+    
+    def _update_github_hosts(self, domain_ips: Dict[str, Union[str, List[str]]],
+                             remove: Iterable[str] = ()) -> bool:
         lines = self.read_hosts()
+        block_ips: Dict[str, Union[str, List[str]]] = dict(self.get_block(lines))
+        for domain in remove:
+            block_ips.pop(domain, None)
+        block_ips.update(domain_ips)
+        github_domains = set(block_ips)
         
-        # 移除现有的GitHub相关条目
         new_lines = []
-        github_domains = set(domain_ips.keys())
-        
+        insert_at = None
+        in_block = False
         for line in lines:
-            if line.strip().startswith('#'):
-                new_lines.append(line)
+            stripped = line.strip()
+            if stripped == BLOCK_START:
+                in_block = True
+                if insert_at is None:
+                    insert_at = len(new_lines)
+                continue
+            if stripped == BLOCK_END:
+                in_block = False
+                continue
+            if in_block:
                 continue
             
-            parts = line.split()
-            if len(parts) >= 2:
-                domain = parts[1]
-                if not any(g_domain in domain for g_domain in github_domains):
-                    new_lines.append(line)
-            else:
-                new_lines.append(line)
+            # 配置块之外与加速域名完全相同的条目会与配置块冲突 需要移除
+            entry, sep, comment = line.partition('#')
+            parts = entry.split()
+            if len(parts) >= 2 and any(name in github_domains for name in parts[1:]):
+                names = [name for name in parts[1:] if name not in github_domains]
+                if not names:
+                    continue
+                line = '\t'.join([parts[0]] + names) + (f" #{comment}" if sep else "\n")
+                if not line.endswith('\n'):
+                    line += '\n'
+            new_lines.append(line)
         
-        # 添加新的GitHub条目
-        new_lines.append("\n# GitHub加速配置\n")
-        for domain, ip in domain_ips.items():
-            new_lines.append(f"{ip}\t{domain}\n")
-        new_lines.append("# GitHub加速配置结束\n")
+        if new_lines and not new_lines[-1].endswith('\n'):
+            new_lines[-1] += '\n'
+        block = self.generate_hosts_content(block_ips).splitlines(keepends=True)
+        if insert_at is None:
+            if new_lines and new_lines[-1].strip():
+                new_lines.append('\n')
+            new_lines.extend(block)
+        else:
+            new_lines[insert_at:insert_at] = block
         
         return self.write_hosts(new_lines)
     
-    def generate_hosts_content(self, domain_ips: Dict[str, str]) -> str:
-        """生成hosts文件内容字符串"""
-        content = "# GitHub加速配置\n"
-        for domain, ip in domain_ips.items():
-            content += f"{ip}\t{domain}\n"
-        content += "# GitHub加速配置结束\n"
+    def generate_hosts_content(self, domain_ips: Dict[str, Union[str, List[str]]]) -> str:
+        """生成hosts文件内容字符串 IP列表完全相同的域名合并为一行"""
+        merged: Dict[tuple, List[str]] = {}
+        for domain, ips in domain_ips.items():
+            merged.setdefault(tuple([ips] if isinstance(ips, str) else ips), []).append(domain)
+        content = f"{BLOCK_START}\n"
+        for ips, domains in merged.items():
+            for ip in ips:
+                for i in range(0, len(domains), NAMES_PER_LINE):
+                    content += f"{ip}\t{' '.join(domains[i:i + NAMES_PER_LINE])}\n"
+        content += f"{BLOCK_END}\n"
         return content
     
-    def restore_backup(self) -> bool:
-        """恢复备份"""
+    def restore_backup(self, version: str = None) -> bool:
+        """恢复到指定版本 未指定时恢复到最近一个与当前内容不同的版本"""
         try:
+            if version is None:
+                current = ''.join(self.read_hosts())
+                for entry in self.snapshots.list():
+                    if self.snapshots.read(entry["id"]) != current:
+                        version = entry["id"]
+                        break
+            
+            if version is not None:
+                content = self.snapshots.read(version)
+                if content is None:
+                    return False
+                return self.write_hosts(content.splitlines(keepends=True))
+            
+            # 兼容旧版本留下的单个备份文件
             backup_path = self.hosts_path + ".backup"
             if os.path.exists(backup_path):
                 shutil.copy2(backup_path, self.hosts_path)
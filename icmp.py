@@ -0,0 +1,249 @@
+import asyncio
+import os
+import socket
+import struct
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from metrics import metrics
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+
+
+def _checksum(data: bytes) -> int:
+    """计算ICMP校验和"""
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def run_sync(coro):
+    """在独立的Selector事件循环中运行协程 兼容Windows"""
+    loop = asyncio.SelectorEventLoop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def wait_cancelled(cancel: threading.Event, poll=0.05):
+    """轮询取消标志 被设置后返回"""
+    while not cancel.is_set():
+        await asyncio.sleep(poll)
+
+
+async def wait_any(aws, timeout: float = None, cancel: threading.Event = None):
+    """等待任意一个协程完成、超时或被取消 其余协程会被取消"""
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    if cancel is not None:
+        tasks.append(asyncio.ensure_future(wait_cancelled(cancel)))
+    try:
+        await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class RateLimiter:
+    """按固定速率放行探测 rate为每秒次数 为空时不限制
+
+    每次调用预约下一个时间槽 sleep唤醒偏晚时在burst秒内追回 空闲更久时不累积额度
+    """
+
+    def __init__(self, rate: float = None, burst=0.05):
+        self.rate = rate
+        self.burst = burst
+        self._next: Optional[float] = None
+
+    async def wait(self):
+        if not self.rate:
+            return
+        now = asyncio.get_running_loop().time()
+        slot = now if self._next is None else max(self._next, now - self.burst)
+        self._next = slot + 1 / self.rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class ICMPProber:
+    """基于asyncio的ICMP探测引擎 IPv4和IPv6各使用一个socket 在同一事件循环中发送所有回显请求"""
+
+    def __init__(self, timeout=3, interval=0.1, rate: float = None):
+        self.timeout = timeout
+        self.interval = interval
+        # 每秒最多发送的回显请求数 为空时不限制
+        self.rate = rate
+        self.identifier = os.getpid() & 0xffff
+        self.sock: Optional[socket.socket] = None
+        self.raw = False
+        # 没有IPv6网络时为None 此时IPv6地址直接记为超时
+        self.sock6: Optional[socket.socket] = None
+        self.raw6 = False
+        self._seq = 0
+        self._pending: Dict[Tuple[str, int], float] = {}
+        self._samples: Dict[str, List[float]] = {}
+        self._on_sample: Optional[Callable[[str, float], None]] = None
+        self._done: Optional[asyncio.Event] = None
+
+    @staticmethod
+    def _open_socket(family: int, proto: int) -> Tuple[Optional[socket.socket], bool]:
+        """打开ICMP socket 优先使用无需管理员权限的DGRAM类型 返回(socket, 是否为RAW)"""
+        for sock_type in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+            try:
+                sock = socket.socket(family, sock_type, proto)
+            except (OSError, AttributeError):
+                continue
+            sock.setblocking(False)
+            return sock, sock_type == socket.SOCK_RAW
+        return None, False
+
+    def open(self) -> bool:
+        """打开IPv4和IPv6的ICMP socket IPv4不可用时返回False"""
+        if self.sock is not None:
+            return True
+        self.sock, self.raw = self._open_socket(socket.AF_INET, socket.IPPROTO_ICMP)
+        if self.sock is None:
+            return False
+        if socket.has_ipv6:
+            self.sock6, self.raw6 = self._open_socket(socket.AF_INET6,
+                                                      getattr(socket, "IPPROTO_ICMPV6", 58))
+        return True
+
+    def close(self):
+        """关闭socket"""
+        for sock in (self.sock, self.sock6):
+            if sock is not None:
+                sock.close()
+        self.sock = self.sock6 = None
+
+    def _build_packet(self, seq: int, v6=False) -> bytes:
+        """构造回显请求报文 ICMPv6的校验和包含伪头部 由内核计算"""
+        payload = b'GitHubAcce'.ljust(32, b'\x00')
+        if v6:
+            return struct.pack('!BBHHH', ICMPV6_ECHO_REQUEST, 0, 0, self.identifier, seq) + payload
+        header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, self.identifier, seq)
+        checksum = _checksum(header + payload)
+        header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, self.identifier, seq)
+        return header + payload
+
+    def _record(self, ip: str, delay: float):
+        """记录一次探测结果 超时记为inf"""
+        if delay != float('inf'):
+            self._samples.setdefault(ip, []).append(delay)
+        if self._on_sample:
+            self._on_sample(ip, delay)
+
+    def _on_readable(self, loop: asyncio.AbstractEventLoop, v6=False):
+        """读取所有已到达的回复 按来源IP和序列号匹配请求"""
+        sock = self.sock6 if v6 else self.sock
+        raw = self.raw6 if v6 else self.raw
+        reply_type = ICMPV6_ECHO_REPLY if v6 else ICMP_ECHO_REPLY
+        while True:
+            try:
+                data, addr = sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break
+
+            # IPv4的RAW socket和部分系统的DGRAM socket会带上IP头 IPv6不会
+            if not v6 and len(data) >= 20 and data[0] >> 4 == 4:
+                data = data[(data[0] & 0x0f) * 4:]
+            if len(data) < 8:
+                continue
+
+            icmp_type, _, _, ident, seq = struct.unpack('!BBHHH', data[:8])
+            if icmp_type != reply_type:
+                continue
+            # DGRAM socket的标识符由内核改写并过滤 只有RAW需要校验
+            if raw and ident != self.identifier:
+                continue
+
+            sent = self._pending.pop((addr[0], seq), None)
+            if sent is None:
+                continue
+            self._record(addr[0], (loop.time() - sent) * 1000)
+
+        if not self._pending and self._done is not None:
+            self._done.set()
+
+    async def _send(self, loop: asyncio.AbstractEventLoop, ip: str):
+        """发送一个回显请求 发送缓冲区满时让出事件循环"""
+        self._seq = (self._seq + 1) & 0xffff
+        seq = self._seq
+        v6 = ':' in ip
+        sock = self.sock6 if v6 else self.sock
+        if sock is None:
+            metrics.inc("probe_failures", mode="icmp", cause="unsupported")
+            self._record(ip, float('inf'))
+            return
+        packet = self._build_packet(seq, v6)
+        while True:
+            try:
+                self._pending[(ip, seq)] = loop.time()
+                sock.sendto(packet, (ip, 0))
+                return
+            except (BlockingIOError, InterruptedError):
+                self._pending.pop((ip, seq), None)
+                await asyncio.sleep(0.001)
+            except OSError:
+                # 网络不可达等错误直接记为超时
+                self._pending.pop((ip, seq), None)
+                metrics.inc("probe_failures", mode="icmp", cause="unreachable")
+                self._record(ip, float('inf'))
+                return
+
+    async def probe_many(self, ips: List[str], count=1,
+                         on_sample: Callable[[str, float], None] = None,
+                         sni: Dict[str, str] = None,
+                         cancel: threading.Event = None) -> Dict[str, List[float]]:
+        """并发探测所有IP 返回每个IP的延迟样本列表(ms) ICMP不使用sni
+
+        on_sample在每次探测完成时调用 超时记为inf cancel被设置后尽快停止
+        """
+        if not self.open():
+            raise OSError("无法创建ICMP socket")
+
+        loop = asyncio.get_running_loop()
+        limiter = RateLimiter(self.rate)
+        self._pending = {}
+        self._samples = {ip: [] for ip in ips}
+        self._on_sample = on_sample
+        self._done = asyncio.Event()
+
+        loop.add_reader(self.sock.fileno(), self._on_readable, loop)
+        if self.sock6 is not None:
+            loop.add_reader(self.sock6.fileno(), self._on_readable, loop, True)
+        try:
+            for i in range(count):
+                for ip in ips:
+                    if cancel is not None and cancel.is_set():
+                        break
+                    await limiter.wait()
+                    await self._send(loop, ip)
+                if i < count - 1:
+                    await wait_any([asyncio.sleep(self.interval)], cancel=cancel)
+
+            # 等待剩余回复 最后一轮发送后最多等待timeout秒
+            if self._pending:
+                self._done.clear()
+                await wait_any([self._done.wait()], self.timeout, cancel)
+
+            metrics.inc("probe_failures", len(self._pending), mode="icmp", cause="timeout")
+            for ip, _ in list(self._pending):
+                self._record(ip, float('inf'))
+            self._pending = {}
+        finally:
+            loop.remove_reader(self.sock.fileno())
+            if self.sock6 is not None:
+                loop.remove_reader(self.sock6.fileno())
+            self._on_sample = None
+            self._done = None
+
+        return self._samples
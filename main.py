@@ -1,10 +1,15 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
+import os
 import threading
 import time
-from github import GitHubAPI
-from ping import PingTester
-from host import HostsManager
+from cache import get_data_dir
+from ping import PROBE_MODES
+from profiles import load_profiles, profile_domains, recommended_domains
+from resultview import ResultView
+
+# 每个域名都有IP低于该延迟(ms)时可提前结束测试
+GOOD_ENOUGH_MS = 100
 
 class GitHubAccelerator:
     def __init__(self, root):
@@ -13,17 +18,159 @@ class GitHubAccelerator:
         self.root.geometry("720x600")
         self.root.resizable(False, False)
         
-        self.github_api = GitHubAPI()
-        self.ping_tester = PingTester()
-        self.hosts_manager = HostsManager()
+        # 网络相关的组件导入较慢 窗口显示后在后台线程中创建 见_init_backend
+        self.profiles = load_profiles()
+        self.cache = None
+        self.github_api = None
+        self.ping_tester = None
+        self.hosts_manager = None
+        self.speed_tester = None
+        self.scheduler = None
+        self.verifier = None
+        self.backend_ready = False
+        self.monitor = None
+        self.network_watcher = None
         
         self.domain_vars = {}
         self.domain_ips = {}
         self.selected_ips = {}
+        self.latency_results = {}
         self.testing = False
+        # 测速完成后自动应用 用于切换网络后的重新测速
+        self._auto_apply = False
         
         self.setup_ui()
         self.load_domains()
+        # 进入主循环后再启动 保证窗口先绘制出来
+        self.root.after_idle(lambda: threading.Thread(target=self._init_backend, daemon=True).start())
+    
+    def _init_backend(self):
+        """后台线程: 先载入上次的测速结果 再导入网络相关模块并创建各组件"""
+        try:
+            last = self._load_last_results()
+            if last:
+                self.root.after(0, lambda: self._show_last_results(*last))
+            
+            from cache import ResultCache
+            from github import GitHubAPI
+            from host import HostsManager
+            from network import NetworkWatcher
+            from ping import PingTester
+            from scheduler import ProbeScheduler
+            from speed import SpeedTester
+            from verify import HostsVerifier
+            self.cache = ResultCache()
+            self.github_api = GitHubAPI(cache=self.cache, profiles=self.profiles)
+            self.ping_tester = PingTester(cache=self.cache)
+            self.hosts_manager = HostsManager()
+            self.speed_tester = SpeedTester()
+            self.scheduler = ProbeScheduler(self.ping_tester)
+            self.verifier = HostsVerifier()
+        except Exception as e:
+            message = f"初始化失败: {e}"
+            self.root.after(0, lambda: self.status_var.set(message))
+            return
+        self.root.after(0, self._on_backend_ready)
+        # 先识别当前网络 载入该网络保存的结果 之后在后台检测网络切换
+        self.network_watcher = NetworkWatcher(on_change=self._on_network_change)
+        self.network_watcher.check()
+        self.network_watcher.start()
+    
+    def _on_backend_ready(self):
+        """后台组件创建完成 启用依赖它们的按钮"""
+        self.backend_ready = True
+        self.get_ips_btn.config(state='normal')
+        self.restore_btn.config(state='normal')
+        if self.domain_ips:
+            self.test_btn.config(state='normal')
+        if self.latency_results:
+            self.apply_btn.config(state='normal')
+            self.gen_btn.config(state='normal')
+    
+    def _load_last_results(self):
+        """读取上次保存的测速样本 返回(域名->IP列表, IP->延迟) 没有时返回None
+        
+        样本文件通过mmap直接映射 不需要解析 也不依赖网络相关模块
+        """
+        from store import SampleStore
+        store = SampleStore.load(os.path.join(get_data_dir(), "samples.bin"))
+        if store is None:
+            return None
+        try:
+            domain_ips = {domain: store.domain_ips(domain) for domain in store.members
+                          if domain in self.domain_vars}
+            results = store.results()
+        finally:
+            store.close()
+        return (domain_ips, results) if domain_ips else None
+    
+    def _show_last_results(self, domain_ips, results):
+        """显示上次的测速结果 用户已经开始获取IP时不覆盖"""
+        if self.domain_ips or self.testing:
+            return
+        self.domain_ips = domain_ips
+        self._update_ip_display()
+        self._update_latency_display(results)
+        self._update_stats()
+        self.status_var.set("已载入上次的测速结果")
+        if self.backend_ready:
+            self._on_backend_ready()
+    
+    def _on_network_change(self, key, fingerprint):
+        """检测线程发现网络切换后的回调"""
+        self.root.after(0, lambda: self._use_network_profile(key))
+    
+    def _use_network_profile(self, key):
+        """载入该网络保存的候选IP 已经应用过hosts且开启自动切换时立即写入并在后台重新测速"""
+        if self.testing:
+            return
+        profile = {domain: ips for domain, ips in self.cache.get_network_profile(key).items()
+                   if domain in self.domain_vars and ips}
+        if not profile:
+            if self.selected_ips:
+                self.status_var.set("已切换到新的网络 建议重新获取IP并测速")
+            return
+        
+        self.domain_ips = profile
+        self.latency_results = {}
+        self._update_ip_display()
+        self.view.clear_selection()
+        for domain, ips in profile.items():
+            self.view.select((domain, ips[0]))
+        self.view.refresh()
+        self._update_stats()
+        self.test_btn.config(state='normal')
+        self.apply_btn.config(state='normal')
+        self.gen_btn.config(state='normal')
+        
+        if not (self.monitor_var.get() and self.selected_ips):
+            self.status_var.set("已载入当前网络保存的结果")
+            return
+        from network import profile_mapping
+        # 旧网络的监控数据已经失效 测速完成后重新开始
+        if self.monitor:
+            # 监控线程会通过root.after回调界面 在界面线程中join可能互相等待
+            self.monitor.stop(join=False)
+            self.monitor = None
+        self.selected_ips = {domain: ips[0] for domain, ips in profile.items()}
+        if self.hosts_manager.update_github_hosts(profile_mapping(profile, self.ipv6_var.get())):
+            self.status_var.set("已恢复该网络保存的hosts 正在重新测速")
+        self._auto_apply = True
+        # 延迟缓存不区分网络 缓存中还是上一个网络的结果
+        self.test_latency(use_cache=False)
+    
+    def _remember_network(self):
+        """把应用的IP和延迟靠前的候选保存到当前网络"""
+        if not self.network_watcher or not self.network_watcher.key:
+            return
+        from network import best_candidates
+        profile = {}
+        for domain, ip in self.selected_ips.items():
+            ranked = sorted((candidate for candidate in self.domain_ips.get(domain, [])
+                             if self.latency_results.get(candidate, float('inf')) != float('inf')),
+                            key=self.latency_results.get)
+            profile[domain] = best_candidates(ip, ranked)
+        self.cache.put_network_profile(self.network_watcher.key, self.network_watcher.fingerprint, profile)
     
     def setup_ui(self):
         # 顶部标题区域
@@ -70,7 +217,7 @@ class GitHubAccelerator:
         right_frame.pack(side=tk.RIGHT, fill=tk.Y, padx=(5, 0))
         
         # 操作按钮
-        self.get_ips_btn = ttk.Button(right_frame, text="获取IP", command=self.get_ips, width=12)
+        self.get_ips_btn = ttk.Button(right_frame, text="获取IP", command=self.get_ips, state='disabled', width=12)
         self.get_ips_btn.pack(pady=5)
         
         self.test_btn = ttk.Button(right_frame, text="测试延迟", command=self.test_latency, state='disabled', width=12)
@@ -82,7 +229,35 @@ class GitHubAccelerator:
         self.gen_btn = ttk.Button(right_frame, text="生成Hosts", command=self.generate_hosts, state='disabled', width=12)
         self.gen_btn.pack(pady=5)
         
-        ttk.Button(right_frame, text="恢复备份", command=self.restore_backup, width=12).pack(pady=5)
+        self.restore_btn = ttk.Button(right_frame, text="恢复备份", command=self.restore_backup, state='disabled', width=12)
+        self.restore_btn.pack(pady=5)
+        
+        # 探测模式 ICMP被过滤时可改用TCP/TLS
+        ttk.Label(right_frame, text="测速方式", font=('Arial', 8)).pack(pady=(10, 0))
+        self.mode_var = tk.StringVar(value="icmp")
+        ttk.Combobox(right_frame, textvariable=self.mode_var, values=PROBE_MODES,
+                     state='readonly', width=10).pack(pady=2)
+        
+        # 从GitHub官方网段中抽样更多候选IP
+        self.scan_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(right_frame, text="扫描IP段", variable=self.scan_var).pack(pady=2)
+        
+        # 同时解析和测试IPv6地址
+        self.ipv6_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(right_frame, text="IPv6", variable=self.ipv6_var).pack(pady=2)
+        
+        # 对大文件下载域名追加带宽测试
+        self.speed_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(right_frame, text="下载测速", variable=self.speed_var).pack(pady=2)
+        
+        # 所有域名都找到足够快的IP后提前结束测试
+        self.early_stop_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(right_frame, text="达标即停", variable=self.early_stop_var).pack(pady=2)
+        
+        # 应用后持续监控 当前IP变差时自动切换到备用IP
+        self.monitor_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(right_frame, text="自动切换", variable=self.monitor_var,
+                        command=self._toggle_monitor).pack(pady=2)
         
         # 统计信息
         stats_frame = ttk.Frame(right_frame)
@@ -97,9 +272,10 @@ class GitHubAccelerator:
         ip_frame = ttk.LabelFrame(self.root, text="IP地址信息", padding=5)
         ip_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(5, 10))
         
-        # 创建Treeview
+        # 创建虚拟化的结果列表 只渲染可见行
         columns = ("domain", "ip", "latency", "status")
-        self.tree = ttk.Treeview(ip_frame, columns=columns, show="headings", height=8)
+        self.view = ResultView(ip_frame, columns, height=8)
+        self.tree = self.view.tree
         
         self.tree.heading("domain", text="域名")
         self.tree.heading("ip", text="IP地址")
@@ -112,9 +288,9 @@ class GitHubAccelerator:
         self.tree.column("status", width=80)
         
         # 添加滚动条
-        scrollbar_tree_y = ttk.Scrollbar(ip_frame, orient="vertical", command=self.tree.yview)
+        scrollbar_tree_y = self.view.scrollbar
         scrollbar_tree_x = ttk.Scrollbar(ip_frame, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscrollcommand=scrollbar_tree_y.set, xscrollcommand=scrollbar_tree_x.set)
+        self.tree.configure(xscrollcommand=scrollbar_tree_x.set)
         
         self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
         scrollbar_tree_y.grid(row=0, column=1, sticky=(tk.N, tk.S))
@@ -149,7 +325,7 @@ class GitHubAccelerator:
     
     def select_recommended(self):
         """选择推荐域名"""
-        recommended = self.github_api.get_recommended_domains()
+        recommended = recommended_domains(self.profiles)
         for domain, var in self.domain_vars.items():
             var.set(domain in recommended)
         self._update_stats()
@@ -163,13 +339,13 @@ class GitHubAccelerator:
     
     def load_domains(self):
         """加载域名列表"""
-        domains = self.github_api.get_all_domains()
+        domains = profile_domains(self.profiles)
         
         for widget in self.domain_frame.winfo_children():
             widget.destroy()
         
         self.domain_vars = {}
-        recommended = self.github_api.get_recommended_domains()
+        recommended = recommended_domains(self.profiles)
         
         # 创建2列的网格布局
         for i, domain in enumerate(domains):
@@ -203,15 +379,20 @@ class GitHubAccelerator:
     def _get_ips_thread(self, selected_domains):
         """获取IP的线程"""
         self.domain_ips = {}
-        total = len(selected_domains)
+        self.github_api.set_ipv6(self.ipv6_var.get())
+        self.root.after(0, lambda: self.status_var.set(f"正在解析 {len(selected_domains)} 个域名"))
         
-        for i, domain in enumerate(selected_domains):
-            self.root.after(0, lambda d=domain, idx=i+1, tot=total: 
-                          self.status_var.set(f"正在解析 {d} ({idx}/{tot})"))
-            ips = self.github_api.get_domain_ips(domain)
+        for domain, ips in self.github_api.resolve_many(selected_domains).items():
             if ips:
                 self.domain_ips[domain] = list(ips)
-            time.sleep(0.1)
+        
+        if self.scan_var.get():
+            self.root.after(0, lambda: self.status_var.set("正在抽样GitHub网段"))
+            for domain in selected_domains:
+                candidates = self.github_api.get_candidate_ips(domain)
+                if candidates:
+                    ips = self.domain_ips.setdefault(domain, [])
+                    ips.extend(ip for ip in candidates if ip not in ips)
         
         self.root.after(0, self._update_ip_display)
         self.root.after(0, lambda: self.status_var.set("IP地址获取完成"))
@@ -221,48 +402,114 @@ class GitHubAccelerator:
     
     def _update_ip_display(self):
         """更新IP显示"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        for domain, ips in self.domain_ips.items():
-            for ip in ips:
-                self.tree.insert("", "end", values=(domain, ip, "未测试", "等待"))
+        self.view.set_rows((domain, ip, "未测试", "等待")
+                           for domain, ips in self.domain_ips.items() for ip in ips)
     
-    def test_latency(self):
+    def test_latency(self, use_cache=True):
         """测试延迟"""
         if not self.domain_ips:
             return
+        self._use_cache = use_cache
+        
+        # 多个域名共享的IP只探测一次
+        self._ip_domains = self.scheduler.build_index(self.domain_ips)
+        
+        # 实时进度 每完成一次探测前进一格
+        self._live_samples = {}
+        self._good_domains = set()
+        self._samples_done = 0
+        self._samples_total = len(self._ip_domains) * self.ping_tester.count
+        self._early_stop = self.early_stop_var.get()
         
         self.testing = True
-        self.progress.start()
+        self.progress.stop()
+        self.progress.config(mode='determinate', maximum=max(self._samples_total, 1), value=0)
         self.status_var.set("正在测试延迟...")
-        self.test_btn.config(state='disabled')
-        
-        all_ips = []
-        for ips in self.domain_ips.values():
-            all_ips.extend(ips)
+        self.test_btn.config(text="停止测试", command=self.ping_tester.cancel)
+        self.get_ips_btn.config(state='disabled')
         
-        threading.Thread(target=self._test_latency_thread, args=(all_ips,), daemon=True).start()
+        self.ping_tester.set_mode(self.mode_var.get())
+        threading.Thread(target=self._test_latency_thread, daemon=True).start()
+        self._poll_progress()
+    
+    def _on_sample(self, ip, delay):
+        """探测线程每完成一次探测的回调 更新对应行并检查是否可以提前结束"""
+        self._samples_done += 1
+        samples = self._live_samples.setdefault(ip, [])
+        if delay != float('inf'):
+            samples.append(delay)
+        latency_str = f"{sum(samples) / len(samples):.1f}" if samples else "超时"
+        domains = self._ip_domains.get(ip, [])
+        for domain in domains:
+            self.view.post(domain, ip, latency=latency_str, status="测试中")
+        
+        if self._early_stop and delay < GOOD_ENOUGH_MS:
+            self._good_domains.update(domains)
+            if len(self._good_domains) == len(self.domain_ips):
+                self.ping_tester.cancel()
     
-    def _test_latency_thread(self, ips):
+    def _poll_progress(self):
+        """定时刷新进度条"""
+        if not self.testing:
+            return
+        self.progress.config(value=self._samples_done)
+        self.status_var.set(f"正在测试延迟 {self._samples_done}/{self._samples_total}")
+        self.root.after(100, self._poll_progress)
+    
+    def _test_latency_thread(self):
         """测试延迟线程"""
-        results = self.ping_tester.test_ips(ips)
+        from speed import DEFAULT_TEST_PATHS
+        self.scheduler.run(self.domain_ips, use_cache=self._use_cache, on_sample=self._on_sample)
+        if not self.ping_tester.cancelled:
+            try:
+                # 下次启动时立即显示 与命令行模式共用同一个文件 提前结束的不完整结果不保存
+                self.scheduler.store.save(os.path.join(get_data_dir(), "samples.bin"))
+            except OSError as e:
+                print(f"保存测速样本失败: {e}")
+        results = self.scheduler.results
+        stats = self.scheduler.stats
+        finished = f"延迟测试完成 {stats['unique']} 个IP 去重节省 {stats['saved']} 次"
+        if self.ping_tester.cancelled:
+            # 提前结束时只显示实际测过的IP
+            results = {ip: delay for ip, delay in results.items() if ip in self._live_samples}
+            finished = f"已提前结束 测试了 {len(results)}/{len(self._ip_domains)} 个IP"
+        
+        # 带宽测试 按下载速度而非延迟选择IP
+        preferred = {}
+        unmeasured = []
+        if self.speed_var.get():
+            for domain, domain_ips in self.domain_ips.items():
+                if domain not in DEFAULT_TEST_PATHS:
+                    continue
+                self.root.after(0, lambda d=domain: self.status_var.set(f"正在测速 {d}"))
+                latencies = {ip: results.get(ip, float('inf')) for ip in domain_ips}
+                fastest = self.speed_tester.get_fastest_ip(domain, latencies)
+                if fastest:
+                    preferred[domain] = fastest
+                else:
+                    unmeasured.append(domain)
+            if unmeasured:
+                # 没有测出速度的域名保留延迟最低的IP
+                finished += f" {len(unmeasured)} 个域名未测出下载速度"
         
-        self.root.after(0, lambda: self._update_latency_display(results))
-        self.root.after(0, lambda: self.status_var.set("延迟测试完成"))
+        self.root.after(0, lambda: self._update_latency_display(results, preferred))
+        self.root.after(0, lambda: self.status_var.set(finished))
         self.root.after(0, self._reset_ui)
+        if self._auto_apply:
+            self._auto_apply = False
+            if not self.ping_tester.cancelled:
+                self.root.after(0, self._apply_refined)
         self.root.after(0, lambda: self.apply_btn.config(state='normal'))
         self.root.after(0, lambda: self.gen_btn.config(state='normal'))
     
-    def _update_latency_display(self, results):
-        """更新延迟显示"""
+    def _update_latency_display(self, results, preferred=None):
+        """更新延迟显示 preferred为测速选出的域名到IP映射 优先于延迟"""
+        # 测速线程提交的中间状态可能还在队列中
+        self.view.discard_pending()
+        self.latency_results = dict(results)
         fastest_ips = {}
         
-        for item in self.tree.get_children():
-            values = self.tree.item(item, "values")
-            domain = values[0]
-            ip = values[1]
-            
+        for (domain, ip), values in self.view.rows():
             if ip in results:
                 latency = results[ip]
                 if latency == float('inf'):
@@ -275,51 +522,134 @@ class GitHubAccelerator:
                     if domain not in fastest_ips or latency < fastest_ips[domain][1]:
                         fastest_ips[domain] = (ip, latency)
                 
-                self.tree.set(item, "latency", latency_str)
-                self.tree.set(item, "status", status)
+                self.view.set_values((domain, ip), latency=latency_str, status=status)
         
         # 自动选择每个域名最快的IP
-        for domain, (ip, latency) in fastest_ips.items():
-            for item in self.tree.get_children():
-                values = self.tree.item(item, "values")
-                if values[0] == domain and values[1] == ip:
-                    self.tree.selection_add(item)
-                    break
+        selected = {domain: ip for domain, (ip, latency) in fastest_ips.items()}
+        selected.update(preferred or {})
+        self.view.clear_selection()
+        for domain, ip in selected.items():
+            self.view.select((domain, ip))
+        self.view.refresh()
     
     def apply_selected(self):
         """应用选中"""
-        selection = self.tree.selection()
+        selection = self.view.get_selected()
         if not selection:
             messagebox.showwarning("提示", "请先选择要应用的IP地址")
             return
         
-        self.selected_ips = {}
-        for item in selection:
-            values = self.tree.item(item, "values")
+        selected = {}
+        for values in selection:
             domain = values[0]
             ip = values[1]
-            self.selected_ips[domain] = ip
+            selected[domain] = ip
         
-        success = self.hosts_manager.update_github_hosts(self.selected_ips)
-        if success:
-            messagebox.showinfo("成功", "Hosts文件已更新")
-            self.status_var.set("Hosts文件更新成功")
+        self._apply(selected, notify=True)
+    
+    def _apply(self, selected, notify=False):
+        """在后台写入hosts并通过新IP验证 失败或变慢的域名回滚到原来的IP"""
+        self.apply_btn.config(state='disabled')
+        self.status_var.set("正在写入hosts并验证...")
+        mapping = self._dual_stack(selected)
+        threading.Thread(target=self._apply_thread, args=(mapping, notify), daemon=True).start()
+    
+    def _apply_thread(self, mapping, notify):
+        """写入并验证的线程"""
+        report = self.verifier.apply(self.hosts_manager, mapping)
+        self.root.after(0, lambda: self._on_applied(mapping, report, notify))
+    
+    def _on_applied(self, mapping, report, notify):
+        """显示验证结果 保存到当前网络并重新开始监控"""
+        self.apply_btn.config(state='normal')
+        if not report["written"]:
+            self.status_var.set("Hosts文件更新失败")
+            if notify:
+                messagebox.showerror("错误", "更新失败，请以管理员权限运行")
+            return
+        
+        for domain, entry in report["domains"].items():
+            for check in entry["checks"]:
+                if check["ok"] and not entry["reverted"]:
+                    status = f"已验证 {check['ms']:.0f}ms"
+                else:
+                    status = "已回滚" if entry["reverted"] else "验证失败"
+                if (domain, check["ip"]) in self.view.data:
+                    self.view.set_values((domain, check["ip"]), status=status)
+        self.view.refresh()
+        
+        final = report["mapping"]
+        self.selected_ips = {domain: value if isinstance(value, str) else value[0]
+                             for domain, value in final.items() if domain in mapping}
+        reverted = report["reverted"]
+        self.status_var.set(f"Hosts文件已更新 验证通过 {len(mapping) - len(reverted)} 个 "
+                            f"回滚 {len(reverted)} 个")
+        self._remember_network()
+        self._toggle_monitor()
+        if not notify:
+            return
+        if reverted:
+            details = "\n".join(f"{domain}: {report['domains'][domain]['reason']}" for domain in reverted)
+            messagebox.showwarning("部分回滚", f"以下域名验证未通过 已恢复原来的IP:\n{details}")
         else:
-            messagebox.showerror("错误", "更新失败，请以管理员权限运行")
+            messagebox.showinfo("成功", "Hosts文件已更新 所有域名验证通过")
+    
+    def _apply_refined(self):
+        """切换网络后的重新测速完成 应用新选出的IP"""
+        selected = {values[0]: values[1] for values in self.view.get_selected()}
+        if selected:
+            self._apply(selected)
+    
+    def _dual_stack(self, selected_ips: dict) -> dict:
+        """启用IPv6时为每个域名补上另一协议族中延迟最低的IP"""
+        if not self.ipv6_var.get():
+            return selected_ips
+        mapping = {}
+        for domain, ip in selected_ips.items():
+            others = [candidate for candidate in self.domain_ips.get(domain, [])
+                      if (':' in candidate) != (':' in ip)
+                      and self.latency_results.get(candidate, float('inf')) != float('inf')]
+            mapping[domain] = [ip, min(others, key=self.latency_results.get)] if others else ip
+        return mapping
+    
+    def _toggle_monitor(self, standby_count=3):
+        """根据勾选状态启动或停止后台监控"""
+        if self.monitor:
+            # 监控线程会通过root.after回调界面 在界面线程中join可能互相等待
+            self.monitor.stop(join=False)
+            self.monitor = None
+        if not self.monitor_var.get() or not self.selected_ips:
+            return
+        
+        from monitor import LatencyMonitor
+        self.monitor = LatencyMonitor(self.hosts_manager, mode=self.ping_tester.mode,
+                                      on_failover=self._on_failover)
+        for domain, ip in self.selected_ips.items():
+            ranked = sorted((candidate for candidate in self.domain_ips.get(domain, [])
+                             if self.latency_results.get(candidate, float('inf')) != float('inf')),
+                            key=self.latency_results.get)
+            self.monitor.watch(domain, ip, ranked[:standby_count + 1])
+        self.monitor.start()
+        self.status_var.set(f"正在监控 {len(self.selected_ips)} 个域名")
+    
+    def _on_failover(self, domain, old_ip, new_ip):
+        """监控线程切换IP后的回调"""
+        self.selected_ips[domain] = new_ip
+        self.root.after(0, lambda: self.status_var.set(f"{domain} 已从 {old_ip} 切换到 {new_ip}"))
+        self.root.after(0, self._remember_network)
     
     def generate_hosts(self):
         """生成Hosts内容"""
-        selection = self.tree.selection()
+        selection = self.view.get_selected()
         if not selection:
             messagebox.showwarning("提示", "请先选择IP地址")
             return
         
         selected_ips = {}
-        for item in selection:
-            values = self.tree.item(item, "values")
+        for values in selection:
             selected_ips[values[0]] = values[1]
         
-        content = self.hosts_manager.generate_hosts_content(selected_ips)
+        content = self.hosts_manager.generate_hosts_content(self._dual_stack(selected_ips))
         
         top = tk.Toplevel(self.root)
         top.title("生成的Hosts内容")
@@ -333,20 +663,65 @@ class GitHubAccelerator:
         ttk.Button(top, text="关闭", command=top.destroy).pack(pady=5)
     
     def restore_backup(self):
-        """恢复备份"""
-        if messagebox.askyesno("确认", "确定要恢复Hosts文件备份吗？"):
-            success = self.hosts_manager.restore_backup()
-            if success:
-                messagebox.showinfo("成功", "Hosts文件已恢复")
-                self.status_var.set("Hosts文件已恢复备份")
-            else:
-                messagebox.showerror("错误", "恢复备份失败")
+        """恢复备份 列出历史版本并显示与当前文件的差异"""
+        backups = self.hosts_manager.list_backups()
+        if not backups:
+            if messagebox.askyesno("确认", "确定要恢复Hosts文件备份吗？"):
+                self._do_restore(None)
+            return
+        
+        top = tk.Toplevel(self.root)
+        top.title("Hosts历史版本")
+        top.geometry("700x420")
+        
+        versions = tk.Listbox(top, width=28, font=('Consolas', 9))
+        for entry in backups:
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["time"]))
+            versions.insert(tk.END, f"{stamp}  {entry['id'][:8]}")
+        versions.pack(side=tk.LEFT, fill=tk.Y, padx=(10, 5), pady=10)
+        
+        right = ttk.Frame(top)
+        right.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(5, 10), pady=10)
+        text = scrolledtext.ScrolledText(right, wrap=tk.NONE, font=('Consolas', 9))
+        text.pack(fill=tk.BOTH, expand=True)
+        
+        def show_diff(event=None):
+            selection = versions.curselection()
+            if not selection:
+                return
+            diff = self.hosts_manager.diff_backup(backups[selection[0]]["id"])
+            text.config(state='normal')
+            text.delete('1.0', tk.END)
+            text.insert(tk.INSERT, diff or "与当前文件相同")
+            text.config(state='disabled')
+        
+        def restore():
+            selection = versions.curselection()
+            if selection and messagebox.askyesno("确认", "确定要恢复到该版本吗？", parent=top):
+                self._do_restore(backups[selection[0]]["id"])
+                top.destroy()
+        
+        versions.bind("<<ListboxSelect>>", show_diff)
+        ttk.Button(right, text="恢复此版本", command=restore).pack(pady=(5, 0))
+        versions.selection_set(0)
+        show_diff()
+    
+    def _do_restore(self, version):
+        """恢复到指定版本"""
+        success = self.hosts_manager.restore_backup(version)
+        if success:
+            messagebox.showinfo("成功", "Hosts文件已恢复")
+            self.status_var.set("Hosts文件已恢复备份")
+        else:
+            messagebox.showerror("错误", "恢复备份失败")
     
     def _reset_ui(self):
         """重置UI状态"""
         self.testing = False
         self.progress.stop()
+        self.progress.config(mode='indeterminate', value=0)
         self.get_ips_btn.config(state='normal')
+        self.test_btn.config(text="测试延迟", command=self.test_latency)
 
 if __name__ == "__main__":
     root = tk.Tk()
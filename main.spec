@@ -10,7 +10,8 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # NumPy只用于加速大量样本的统计 界面程序不需要 打包进去会明显增加每次启动时解压的体积
+    excludes=['numpy'],
     noarchive=False,
     optimize=0,
 )
@@ -26,7 +27,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # UPX压缩的DLL在每次启动时都要解压 且容易被杀毒软件反复扫描
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
@@ -0,0 +1,181 @@
+import json
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+PREFIX = "githubacce_"
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class _NullTimer:
+    """未启用时使用的空计时器"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    def __init__(self, metrics: "Metrics", name: str, labels: Dict[str, str]):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.labels["error"] = exc_type.__name__
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class Metrics:
+    """进程内的计数器和耗时统计
+
+    未启用时所有记录方法直接返回 启用后可通过Prometheus文本接口查看 或写入JSON lines追踪文件
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.counters: Dict[Key, float] = {}
+        # 名称和标签 -> [次数, 总耗时, 最大耗时]
+        self.timings: Dict[Key, List[float]] = {}
+        self._lock = threading.Lock()
+        self._trace = None
+        self._server: Optional["ThreadingHTTPServer"] = None
+
+    def enable(self, trace_path: str = None):
+        """开始记录 trace_path不为空时把每次计时和事件追加写入该文件"""
+        self.enabled = True
+        if trace_path and self._trace is None:
+            self._trace = open(trace_path, 'a', encoding='utf-8', buffering=1)
+
+    def disable(self):
+        self.enabled = False
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, object]) -> Key:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """增加计数器"""
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """记录一次耗时(秒)"""
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            timing = self.timings.setdefault(key, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+        self.event(name, seconds=round(seconds, 6), **labels)
+
+    def timer(self, name: str, **labels):
+        """计时上下文管理器 退出时记录耗时 抛出异常时带上error标签"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    def event(self, name: str, **fields):
+        """向追踪文件写入一条事件"""
+        if self._trace is None:
+            return
+        line = json.dumps({"time": round(time.time(), 6), "event": name, **fields},
+                          ensure_ascii=False, default=str)
+        with self._lock:
+            self._trace.write(line + "\n")
+
+    @staticmethod
+    def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+        if not labels:
+            return ""
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, value in labels)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+    def render(self) -> str:
+        """生成Prometheus文本格式"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            timings = sorted((key, list(value)) for key, value in self.timings.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}{name}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{self._labels(labels)} {value:g}")
+        for (name, labels), (count, total, _) in timings:
+            metric = f"{PREFIX}{name}_seconds"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} summary")
+            lines.append(f"{metric}_count{self._labels(labels)} {count:g}")
+            lines.append(f"{metric}_sum{self._labels(labels)} {total:.6f}")
+        # 最大耗时不属于summary的组成部分 单独作为gauge输出
+        for (name, labels), (_, _, peak) in timings:
+            metric = f"{PREFIX}{name}_seconds_max"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{self._labels(labels)} {peak:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, host="127.0.0.1", port=9464) -> Tuple[str, int]:
+        """在后台线程中提供 /metrics 接口 返回实际监听的地址"""
+        # 大多数运行不提供指标接口 不在导入时加载http.server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.enable()
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address[:2]
+
+
+# 全局实例 各模块直接导入使用
+metrics = Metrics()
@@ -0,0 +1,198 @@
+import threading
+from array import array
+from typing import Callable, Dict, List, Optional
+
+from host import HostsManager
+from ping import PingTester
+
+
+class RollingStats:
+    """固定大小环形缓冲区中的延迟统计 丢包记为inf"""
+
+    def __init__(self, size=32, alpha=0.3):
+        self.size = size
+        self.alpha = alpha
+        self.samples = array('d', [0.0] * size)
+        self.count = 0
+        self.index = 0
+        self.ewma: Optional[float] = None
+
+    def add(self, delay: float):
+        """记录一个样本"""
+        self.samples[self.index] = delay
+        self.index = (self.index + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        if delay != float('inf'):
+            self.ewma = delay if self.ewma is None else self.alpha * delay + (1 - self.alpha) * self.ewma
+
+    def _received(self) -> List[float]:
+        return [d for d in self.samples[:self.count] if d != float('inf')]
+
+    @property
+    def loss_rate(self) -> float:
+        if not self.count:
+            return 0.0
+        return 1 - len(self._received()) / self.count
+
+    def percentile(self, p: float) -> float:
+        """计算百分位延迟"""
+        received = sorted(self._received())
+        if not received:
+            return float('inf')
+        k = (len(received) - 1) * p / 100
+        low = int(k)
+        high = min(low + 1, len(received) - 1)
+        return received[low] + (received[high] - received[low]) * (k - low)
+
+    @property
+    def jitter(self) -> float:
+        """相邻样本差值的平均值"""
+        received = self._received()
+        if len(received) < 2:
+            return 0.0
+        return sum(abs(a - b) for a, b in zip(received, received[1:])) / (len(received) - 1)
+
+    def score(self, jitter_weight=2.0, loss_penalty=500.0) -> float:
+        """综合评分 越低越好 EWMA加上抖动和丢包惩罚"""
+        if self.ewma is None:
+            return float('inf')
+        return self.ewma + jitter_weight * self.jitter + loss_penalty * self.loss_rate
+
+    def summary(self) -> dict:
+        return {
+            "ewma": self.ewma,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "jitter": self.jitter,
+            "loss": self.loss_rate,
+            "score": self.score(),
+        }
+
+
+class LatencyMonitor:
+    """后台持续探测当前IP和备用IP 当前IP变差时自动切换hosts映射"""
+
+    def __init__(self, hosts_manager: HostsManager = None, mode="icmp", interval=5.0,
+                 window=32, margin=20.0, loss_threshold=0.5, min_samples=4, timeout=2,
+                 on_failover: Callable[[str, str, str], None] = None):
+        self.tester = PingTester(timeout=timeout, count=1, mode=mode)
+        self.hosts_manager = hosts_manager
+        self.interval = interval
+        self.window = window
+        self.margin = margin
+        self.loss_threshold = loss_threshold
+        self.min_samples = min_samples
+        self.on_failover = on_failover
+        self.active: Dict[str, str] = {}
+        self.standbys: Dict[str, List[str]] = {}
+        self.stats: Dict[str, RollingStats] = {}
+        self.lock = threading.Lock()
+        # 写入hosts期间持有 stop返回后不会再有写入
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, domain: str, active_ip: str, standbys: List[str]):
+        """监控一个域名 standbys为按优先级排列的备用IP"""
+        with self.lock:
+            self.active[domain] = active_ip
+            self.standbys[domain] = [ip for ip in standbys if ip != active_ip]
+            for ip in [active_ip] + self.standbys[domain]:
+                self.stats.setdefault(ip, RollingStats(self.window))
+
+    def unwatch(self, domain: str):
+        with self.lock:
+            self.active.pop(domain, None)
+            self.standbys.pop(domain, None)
+
+    def probe_round(self):
+        """对所有被监控的IP各探测一次"""
+        with self.lock:
+            sni = {}
+            for domain, ip in self.active.items():
+                for candidate in [ip] + self.standbys.get(domain, []):
+                    sni.setdefault(candidate, domain)
+        if not sni:
+            return
+        results = self.tester.test_ips(list(sni), sni=sni, use_cache=False)
+        with self.lock:
+            for ip, delay in results.items():
+                self.stats.setdefault(ip, RollingStats(self.window)).add(delay)
+
+    def evaluate(self) -> Dict[str, tuple]:
+        """检查各域名 返回发生切换的 域名->(旧IP, 新IP)"""
+        failovers = {}
+        with self.lock:
+            for domain, ip in self.active.items():
+                current = self.stats[ip]
+                if current.count < self.min_samples:
+                    continue
+                ready = [s for s in self.standbys.get(domain, [])
+                         if self.stats[s].count >= self.min_samples]
+                if not ready:
+                    continue
+                best = min(ready, key=lambda s: self.stats[s].score())
+                degraded = current.loss_rate >= self.loss_threshold
+                if degraded or current.score() - self.stats[best].score() > self.margin:
+                    if self.stats[best].score() == float('inf'):
+                        continue
+                    failovers[domain] = (ip, best)
+
+            for domain, (old, new) in failovers.items():
+                self.active[domain] = new
+                self.standbys[domain] = [s for s in self.standbys[domain] if s != new] + [old]
+        return failovers
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.probe_round()
+            failovers = self.evaluate()
+            if not failovers:
+                continue
+            with self._write_lock:
+                # 停止后界面可能已经写入了新的hosts 不能再覆盖
+                if self._stop.is_set():
+                    break
+                if self.hosts_manager:
+                    self._write_failovers(failovers)
+            if self.on_failover:
+                for domain, (old, new) in failovers.items():
+                    self.on_failover(domain, old, new)
+
+    def _write_failovers(self, failovers: Dict[str, tuple]):
+        """只替换配置块中发生切换的IP 其他域名和另一协议族的条目保持不变"""
+        block = self.hosts_manager.get_block()
+        changed = {}
+        for domain, (old, new) in failovers.items():
+            ips = block.get(domain, [])
+            if old in ips:
+                changed[domain] = [new if ip == old else ip for ip in ips]
+            else:
+                changed[domain] = [new] + [ip for ip in ips if (':' in ip) != (':' in new)]
+        self.hosts_manager.update_github_hosts(changed)
+
+    def start(self):
+        """启动后台监控线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, join=True):
+        """停止监控 返回时正在进行的写入已经完成 之后也不会再写入hosts
+
+        join时再等待线程退出 回调中会调用界面的线程不应在界面线程中join
+        """
+        self._stop.set()
+        self.tester.cancel()
+        with self._write_lock:
+            pass
+        thread = self._thread
+        if join and thread and thread is not threading.current_thread():
+            thread.join(self.tester.timeout + 1)
+
+    def get_summary(self) -> Dict[str, dict]:
+        """获取所有被监控IP的统计"""
+        with self.lock:
+            return {ip: stats.summary() for ip, stats in self.stats.items()}
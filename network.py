@@ -0,0 +1,231 @@
+import hashlib
+import ipaddress
+import json
+import platform
+import re
+import socket
+import struct
+import subprocess
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+# 每个网络为每个域名保存的候选IP数 每个协议族分别计算
+PROFILE_CANDIDATES = 4
+
+IPV4_PATTERN = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b")
+MAC_PATTERN = re.compile(r"\b(?:[0-9a-f]{1,2}[:-]){5}[0-9a-f]{1,2}\b", re.I)
+
+
+def _run(args: List[str]) -> str:
+    """运行系统命令并返回输出 失败时返回空字符串 Windows下不弹出控制台窗口"""
+    try:
+        return subprocess.run(args, capture_output=True, text=True, errors='replace', timeout=5,
+                              creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _linux_routes() -> List[tuple]:
+    """读取/proc/net/route 返回(网卡, 目标, 网关, 掩码)列表 地址均为点分格式"""
+    def address(value: str) -> str:
+        return socket.inet_ntoa(struct.pack("<I", int(value, 16)))
+
+    routes = []
+    for line in _read("/proc/net/route").splitlines()[1:]:
+        fields = line.split()
+        # 标志位0x1表示路由可用
+        if len(fields) >= 8 and int(fields[3], 16) & 1:
+            routes.append((fields[0], address(fields[1]), address(fields[2]), address(fields[7])))
+    return routes
+
+
+def default_gateway() -> Optional[str]:
+    """默认网关的IPv4地址"""
+    system = platform.system()
+    if system == "Linux":
+        for _, destination, gateway, mask in _linux_routes():
+            if destination == "0.0.0.0" and mask == "0.0.0.0":
+                return gateway
+        return None
+    if system == "Windows":
+        # 活动路由中目标和掩码都是0.0.0.0的行 第三列为网关
+        for line in _run(["route", "print", "-4", "0.0.0.0"]).splitlines():
+            parts = line.split()
+            if len(parts) >= 3 and parts[:2] == ["0.0.0.0", "0.0.0.0"] and IPV4_PATTERN.fullmatch(parts[2]):
+                return parts[2]
+        return None
+    match = re.search(r"gateway:\s*(\S+)", _run(["route", "-n", "get", "default"]))
+    return match.group(1) if match else None
+
+
+def gateway_mac(gateway: str) -> Optional[str]:
+    """从ARP表中查找网关的MAC地址 不同网络的网关地址常常相同 MAC可以区分它们"""
+    if not gateway:
+        return None
+    if platform.system() == "Linux":
+        for line in _read("/proc/net/arp").splitlines()[1:]:
+            fields = line.split()
+            if len(fields) >= 4 and fields[0] == gateway:
+                text = fields[3]
+                break
+        else:
+            return None
+    else:
+        text = _run(["arp", "-a" if platform.system() == "Windows" else "-n", gateway])
+    match = MAC_PATTERN.search(text)
+    if not match:
+        return None
+    mac = ':'.join(part.zfill(2) for part in re.split(r"[:-]", match.group(0).lower()))
+    return None if mac == "00:00:00:00:00:00" else mac
+
+
+def local_address() -> Optional[str]:
+    """访问外网时使用的本机IPv4地址 UDP的connect只选择路由 不发送数据"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.connect(("192.0.2.1", 53))
+            return sock.getsockname()[0]
+        except OSError:
+            return None
+
+
+def local_subnet(address: str) -> Optional[str]:
+    """本机地址所在的网段 Linux下从路由表中取掩码 其他系统按/24估计"""
+    if not address:
+        return None
+    local = ipaddress.ip_address(address)
+    if platform.system() == "Linux":
+        for _, destination, gateway, mask in _linux_routes():
+            if gateway != "0.0.0.0" or destination == "0.0.0.0":
+                continue
+            network = ipaddress.ip_network(f"{destination}/{mask}", strict=False)
+            if local in network:
+                return str(network)
+    return str(ipaddress.ip_network(f"{address}/24", strict=False))
+
+
+def system_resolvers() -> List[str]:
+    """系统配置的DNS服务器"""
+    if platform.system() == "Windows":
+        servers = []
+        collecting = False
+        for line in _run(["ipconfig", "/all"]).splitlines():
+            key, sep, value = line.partition(" : ")
+            if sep:
+                # 中英文系统中该项名称都包含DNS 后续没有名称的行是更多服务器
+                collecting = "DNS" in key
+            elif collecting and line.strip():
+                value = line
+            else:
+                collecting = False
+                continue
+            if collecting:
+                servers.extend(ip for ip in IPV4_PATTERN.findall(value) if ip not in servers)
+        return servers
+    # systemd-resolved的resolv.conf只有本地存根地址 真实的上游在另一个文件中
+    for path in ("/run/systemd/resolve/resolv.conf", "/etc/resolv.conf"):
+        servers = [parts[1] for parts in (line.split() for line in _read(path).splitlines())
+                   if len(parts) >= 2 and parts[0] == "nameserver"]
+        if servers:
+            return servers
+    return []
+
+
+def wifi_ssid() -> Optional[str]:
+    """当前连接的无线网络名称 有线网络或无法获取时返回None"""
+    system = platform.system()
+    if system == "Windows":
+        match = re.search(r"^\s*SSID\s*:\s*(.+?)\s*$", _run(["netsh", "wlan", "show", "interfaces"]),
+                          re.MULTILINE)
+        return match.group(1) if match else None
+    if system == "Linux":
+        return _run(["iwgetid", "-r"]).strip() or None
+    return None
+
+
+def fingerprint() -> Dict[str, object]:
+    """当前网络的指纹 由默认网关及其MAC、本机网段、DNS服务器和无线网络名称组成"""
+    gateway = default_gateway()
+    return {
+        "gateway": gateway,
+        "gateway_mac": gateway_mac(gateway),
+        "subnet": local_subnet(local_address()),
+        "resolvers": sorted(system_resolvers()),
+        "ssid": wifi_ssid(),
+    }
+
+
+def network_key(fields: Dict[str, object]) -> Optional[str]:
+    """指纹的摘要 没有网关也没有本机地址时视为离线 返回None"""
+    if not fields.get("gateway") and not fields.get("subnet"):
+        return None
+    return hashlib.sha1(json.dumps(fields, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def best_candidates(chosen: str, ranked: Iterable[str], keep=PROFILE_CANDIDATES) -> List[str]:
+    """保存到网络配置中的候选IP 选用的IP在首位 其余按排名每个协议族最多keep个"""
+    ips = [chosen] + [ip for ip in ranked if ip != chosen]
+    v4 = [ip for ip in ips if ':' not in ip][:keep]
+    v6 = [ip for ip in ips if ':' in ip][:keep]
+    return [chosen] + [ip for ip in v4 + v6 if ip != chosen]
+
+
+def profile_mapping(profile: Dict[str, List[str]], dual_stack=False) -> Dict[str, object]:
+    """由网络配置生成hosts映射 dual_stack时同时写入另一协议族中排名最高的IP"""
+    mapping = {}
+    for domain, ips in profile.items():
+        if not ips:
+            continue
+        other = next((ip for ip in ips if (':' in ip) != (':' in ips[0])), None)
+        mapping[domain] = [ips[0], other] if dual_stack and other else ips[0]
+    return mapping
+
+
+class NetworkWatcher:
+    """定期计算网络指纹 切换到另一个网络时回调 离线期间保持上一个网络"""
+
+    def __init__(self, interval=10.0, on_change: Callable[[str, dict], None] = None):
+        self.interval = interval
+        self.on_change = on_change
+        self.key: Optional[str] = None
+        self.fingerprint: Dict[str, object] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self) -> bool:
+        """重新计算指纹 网络发生变化时返回True"""
+        fields = fingerprint()
+        key = network_key(fields)
+        if key is None or key == self.key:
+            return False
+        self.key = key
+        self.fingerprint = fields
+        if self.on_change:
+            self.on_change(key, fields)
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"检测网络变化失败: {e}")
+
+    def start(self):
+        """启动后台检测线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
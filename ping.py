@@ -1,24 +1,60 @@
-from ping3 import ping
-from typing import Dict, List, Tuple
-import concurrent.futures
+from typing import Callable, Dict, List, Tuple
+import threading
 import time
+from cache import ResultCache
+from metrics import metrics
+
+# 探测模式: icmp=ping延迟 tcp=443端口连接耗时 tls=连接+TLS握手耗时
+PROBE_MODES = ("icmp", "tcp", "tls")
+
+
+def make_prober(mode="icmp", timeout=3, interval=0.1, port=443, rate: float = None):
+    """按探测模式创建探测引擎 rate为每秒最多发出的探测数"""
+    if mode not in PROBE_MODES:
+        raise ValueError(f"未知的探测模式: {mode}")
+    # 探测引擎依赖asyncio和ssl 创建时才导入 只引用PROBE_MODES的界面可以很快启动
+    if mode == "icmp":
+        from icmp import ICMPProber
+        return ICMPProber(timeout=timeout, interval=interval, rate=rate)
+    from tcping import TCPProber
+    return TCPProber(timeout=timeout, interval=interval, port=port, tls=(mode == "tls"), rate=rate)
+
 
 class PingTester:
-    def __init__(self, timeout=3, count=2):
+    def __init__(self, timeout=3, count=2, interval=0.1, mode="icmp", port=443,
+                 cache: ResultCache = None, rate: float = None):
         self.timeout = timeout
+        self.cache = cache
         self.count = count
+        self.interval = interval
+        self.port = port
+        self.rate = rate
         self.results: Dict[str, float] = {}
+        self.details: Dict[str, List[Dict[str, float]]] = {}
+        self._cancel = threading.Event()
+        self.set_mode(mode)
+    
+    def set_mode(self, mode: str):
+        """切换探测模式"""
+        self.prober = make_prober(mode, self.timeout, self.interval, self.port, self.rate)
+        self.mode = mode
     
     def ping_ip(self, ip: str) -> Tuple[str, float]:
         """Ping单个IP并返回平均延迟"""
+        from ping3 import ping
         delays = []
         for _ in range(self.count):
             try:
                 delay = ping(ip, timeout=self.timeout, unit='ms')
                 if delay is not None and delay is not False:
                     delays.append(delay)
+                else:
+                    # ping3超时返回None 其他错误返回False
+                    metrics.inc("probe_failures", mode="icmp",
+                                cause="timeout" if delay is None else "error")
                 time.sleep(0.1)  # 短暂间隔
-            except:
+            except Exception as e:
+                metrics.inc("probe_failures", mode="icmp", cause=type(e).__name__)
                 continue
         
         if delays:
@@ -27,16 +63,97 @@ class PingTester:
         else:
             return (ip, float('inf'))
     
-    def test_ips(self, ips: List[str], max_workers=15) -> Dict[str, float]:
-        """并发测试多个IP的延迟"""
+    def cancel(self):
+        """取消正在进行的测试 已完成的结果仍会返回"""
+        self._cancel.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+    
+    def test_ips(self, ips: List[str], max_workers=15, sni: Dict[str, str] = None,
+                 use_cache=True, on_sample: Callable[[str, float], None] = None) -> Dict[str, float]:
+        """并发测试多个IP的延迟 sni为IP到域名的映射 仅tls模式使用
+        
+        on_sample会在每次探测完成时以(ip, 延迟)调用 超时为inf 可用于实时显示进度
+        """
+        self._cancel.clear()
+        ips = list(dict.fromkeys(ips))
+        
+        # 跳过缓存中仍然新鲜的IP 只探测剩余部分
+        cached = {}
+        if self.cache and use_cache:
+            cached = self.cache.get_latencies(ips, self.mode)
+            ips = [ip for ip in ips if ip not in cached]
+            if on_sample:
+                for ip, delay in cached.items():
+                    for _ in range(self.count):
+                        on_sample(ip, delay)
+        
+        if metrics.enabled:
+            on_sample = self._count_samples(on_sample)
+        with metrics.timer("stage", stage="probe", mode=self.mode):
+            self._probe_ips(ips, max_workers, sni, on_sample)
+        if self.cache:
+            # 被取消时未测到的IP不能当作超时缓存
+            measured = {ip: delay for ip, delay in self.results.items()
+                        if not self.cancelled or delay != float('inf')}
+            self.cache.add_latencies(measured, self.mode)
+        self.results.update(cached)
+        return self.results
+    
+    def _count_samples(self, on_sample: Callable[[str, float], None] = None
+                       ) -> Callable[[str, float], None]:
+        """包装on_sample 统计发出和丢失的探测次数"""
+        mode = self.mode
+        
+        def counted(ip: str, delay: float):
+            metrics.inc("probes", mode=mode)
+            if delay == float('inf'):
+                metrics.inc("probes_lost", mode=mode)
+            if on_sample:
+                on_sample(ip, delay)
+        
+        return counted
+    
+    def _probe_ips(self, ips: List[str], max_workers=15, sni: Dict[str, str] = None,
+                   on_sample: Callable[[str, float], None] = None) -> Dict[str, float]:
+        """实际执行探测"""
         self.results = {}
+        self.details = {}
+        if not ips:
+            return self.results
+        
+        # 优先使用异步探测引擎 无法创建ICMP socket时回退到ping3线程池
+        from icmp import run_sync
+        if self.prober.open():
+            try:
+                samples = run_sync(self.prober.probe_many(ips, self.count, on_sample=on_sample,
+                                                          sni=sni, cancel=self._cancel))
+            finally:
+                self.prober.close()
+            
+            for ip, delays in samples.items():
+                self.results[ip] = sum(delays) / len(delays) if delays else float('inf')
+            if self.mode != "icmp":
+                self.details = self.prober.phases
+            return self.results
         
+        import concurrent.futures
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
             future_to_ip = {executor.submit(self.ping_ip, ip): ip for ip in ips}
             
             for future in concurrent.futures.as_completed(future_to_ip):
+                if future.cancelled():
+                    continue
                 ip, delay = future.result()
                 self.results[ip] = delay
+                if on_sample:
+                    for _ in range(self.count):
+                        on_sample(ip, delay)
+                if self.cancelled:
+                    for pending in future_to_ip:
+                        pending.cancel()
         
         return self.results
     
@@ -0,0 +1,228 @@
+import json
+import os
+from typing import Dict, Iterable, List
+
+from cache import get_data_dir
+
+# 内置的域名配置 用户配置文件中的同名配置会覆盖对应字段
+# meta为GitHub /meta 中domains的键 获取过/meta后其中的非通配域名也归入该配置
+DEFAULT_PROFILES = {
+    "core": {
+        "description": "GitHub网站、API和Git",
+        "domains": [
+            "github.com",
+            "github.global.ssl.fastly.net",
+            "gist.github.com",
+            "help.github.com",
+            "status.github.com",
+            "training.github.com",
+            "github.io",
+            "github.community",
+            "github.dev",
+            "api.github.com",
+            "collector.github.com",
+            "codeload.github.com",
+            "alive.github.com",
+            "central.github.com",
+            "live.github.com",
+            "githubapp.com",
+            "githubstatus.com",
+        ],
+        "recommended": ["github.com", "github.global.ssl.fastly.net"],
+        "meta": ["website"],
+    },
+    "assets": {
+        "description": "静态资源、头像和raw文件",
+        "domains": [
+            "github.githubassets.com",
+            "media.githubusercontent.com",
+            "cloud.githubusercontent.com",
+            "objects.githubusercontent.com",
+            "raw.githubusercontent.com",
+            "user-images.githubusercontent.com",
+            "favicons.githubusercontent.com",
+            "avatars.githubusercontent.com",
+            "avatars0.githubusercontent.com",
+            "avatars1.githubusercontent.com",
+            "avatars2.githubusercontent.com",
+            "avatars3.githubusercontent.com",
+        ],
+        "recommended": [
+            "raw.githubusercontent.com",
+            "objects.githubusercontent.com",
+            "avatars.githubusercontent.com",
+            "github.githubassets.com",
+        ],
+    },
+    "actions": {
+        "description": "GitHub Actions",
+        "domains": [
+            "pipelines.actions.githubusercontent.com",
+            "results-receiver.actions.githubusercontent.com",
+            "pkg.actions.githubusercontent.com",
+        ],
+        "meta": ["actions"],
+    },
+    "packages": {
+        "description": "GitHub Packages和容器镜像",
+        "domains": [
+            "ghcr.io",
+            "pkg.github.com",
+            "npm.pkg.github.com",
+            "maven.pkg.github.com",
+            "nuget.pkg.github.com",
+            "rubygems.pkg.github.com",
+            "pkg-containers.githubusercontent.com",
+        ],
+        "meta": ["packages"],
+    },
+    "copilot": {
+        "description": "GitHub Copilot",
+        "domains": [
+            "api.githubcopilot.com",
+            "copilot-proxy.githubusercontent.com",
+            "origin-tracker.githubusercontent.com",
+        ],
+        "meta": ["copilot"],
+    },
+}
+
+
+# 配置文件中可以覆盖的字段及其类型
+PROFILE_FIELDS = {
+    "domains": list,
+    "recommended": list,
+    "meta": list,
+    "enabled": bool,
+    "description": str,
+}
+
+
+def _valid_fields(name: str, fields) -> dict:
+    """只保留类型正确的已知字段 其余字段忽略并提示"""
+    if not isinstance(fields, dict):
+        print(f"域名配置 {name} 格式错误 已忽略")
+        return {}
+    valid = {}
+    for key, value in fields.items():
+        expected = PROFILE_FIELDS.get(key)
+        if expected is None:
+            print(f"域名配置 {name} 中的未知字段 {key} 已忽略")
+        elif not isinstance(value, expected) or (
+                expected is list and not all(isinstance(item, str) for item in value)):
+            print(f"域名配置 {name} 中的字段 {key} 类型错误 已忽略")
+        else:
+            valid[key] = value
+    return valid
+
+
+class DomainProfile:
+    """一组一起加速的域名"""
+
+    def __init__(self, name: str, domains: Iterable[str] = (), recommended: Iterable[str] = (),
+                 meta: Iterable[str] = (), enabled=True, description=""):
+        self.name = name
+        self.domains = list(domains)
+        self.recommended = list(recommended)
+        self.meta = list(meta)
+        self.enabled = enabled
+        self.description = description
+
+    def all_domains(self, meta_domains: Dict[str, List[str]] = None) -> List[str]:
+        """配置中的域名 加上/meta中对应键下的非通配域名"""
+        domains = list(self.domains)
+        for key in self.meta:
+            for domain in (meta_domains or {}).get(key, []):
+                if isinstance(domain, str) and '*' not in domain and domain not in domains:
+                    domains.append(domain)
+        return domains
+
+
+def profile_domains(profiles: Dict[str, DomainProfile], names: Iterable[str] = None,
+                    meta_domains: Dict[str, List[str]] = None) -> List[str]:
+    """指定配置中的域名 未指定时使用所有启用的配置 按配置顺序去重"""
+    if names is None:
+        selected = [profile for profile in profiles.values() if profile.enabled]
+    else:
+        selected = [profiles[name] for name in names]
+    domains = {}
+    for profile in selected:
+        domains.update(dict.fromkeys(profile.all_domains(meta_domains)))
+    return list(domains)
+
+
+def recommended_domains(profiles: Dict[str, DomainProfile]) -> List[str]:
+    """所有启用的配置中推荐加速的域名"""
+    domains = {}
+    for profile in profiles.values():
+        if profile.enabled:
+            domains.update(dict.fromkeys(profile.recommended))
+    return list(domains)
+
+
+def get_profiles_path() -> str:
+    return os.path.join(get_data_dir(), "profiles.json")
+
+
+def load_profiles(path: str = None) -> Dict[str, DomainProfile]:
+    """加载域名配置 文件中的同名配置逐字段覆盖内置配置 新名称的配置追加在后面
+
+    文件格式: {"profiles": {"名称": {"domains": [...], "recommended": [...],
+    "meta": [...], "enabled": true, "description": ""}}}
+    文件不存在或格式错误时只使用内置配置 未知字段和类型错误的字段被忽略
+    """
+    merged = {name: dict(fields) for name, fields in DEFAULT_PROFILES.items()}
+    path = path or get_profiles_path()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            custom = json.load(f).get("profiles", {})
+        if not isinstance(custom, dict):
+            raise ValueError("profiles 应为对象")
+        for name, fields in custom.items():
+            fields = _valid_fields(name, fields)
+            if fields or name in merged:
+                merged.setdefault(name, {}).update(fields)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, AttributeError, TypeError) as e:
+        print(f"读取域名配置失败: {e}")
+        merged = {name: dict(fields) for name, fields in DEFAULT_PROFILES.items()}
+    return {name: DomainProfile(name, **fields) for name, fields in merged.items()}
+
+
+def group_domains(domain_ips: Dict[str, Iterable[str]],
+                  cnames: Dict[str, List[str]] = None) -> List[List[str]]:
+    """按DNS关系把域名分组 同组的域名由同一个CDN边缘提供服务
+
+    CNAME链中有共同名称或解析出的IP集合完全相同的域名归为一组
+    组内和组间都保持domain_ips中的顺序 没有IP的域名各自单独成组
+    """
+    cnames = cnames or {}
+    parent = {domain: domain for domain in domain_ips}
+
+    def find(domain: str) -> str:
+        while parent[domain] != domain:
+            parent[domain] = parent[parent[domain]]
+            domain = parent[domain]
+        return domain
+
+    def union(a: str, b: str):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[b] = a
+
+    owners: Dict[object, str] = {}
+    for domain, ips in domain_ips.items():
+        ips = frozenset(ips)
+        if not ips:
+            continue
+        for key in [ips] + [("cname", name) for name in cnames.get(domain, [])]:
+            if key in owners:
+                union(owners[key], domain)
+            else:
+                owners[key] = domain
+
+    groups: Dict[str, List[str]] = {}
+    for domain in domain_ips:
+        groups.setdefault(find(domain), []).append(domain)
+    return list(groups.values())
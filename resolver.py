@@ -0,0 +1,307 @@
+import asyncio
+import base64
+import random
+import socket
+import ssl
+import struct
+from typing import Dict, List, Set, Tuple
+from urllib.parse import urlsplit
+
+from metrics import metrics
+
+QTYPE_A = 1
+QTYPE_CNAME = 5
+QTYPE_AAAA = 28
+
+# 默认上游: 系统解析器 公共DNS 以及一个DoH端点
+DEFAULT_RESOLVERS = ["system", "1.1.1.1", "8.8.8.8", "https://1.1.1.1/dns-query"]
+
+# 失败原因中使用的响应码名称
+RCODE_NAMES = {1: "formerr", 2: "servfail", 3: "nxdomain", 4: "notimp", 5: "refused"}
+
+
+def build_query(txid: int, domain: str, qtype=QTYPE_A) -> bytes:
+    """构造DNS查询报文"""
+    header = struct.pack('!HHHHHH', txid, 0x0100, 1, 0, 0, 0)
+    qname = b''.join(bytes([len(label)]) + label.encode('idna')
+                     for label in domain.rstrip('.').split('.')) + b'\x00'
+    return header + qname + struct.pack('!HH', qtype, 1)
+
+
+def read_name(data: bytes, offset: int) -> Tuple[str, int]:
+    """读取域名 支持压缩指针 返回(域名, 名称之后的偏移)"""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        length = data[offset]
+        if length & 0xc0 == 0xc0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3f) << 8) | data[offset + 1]
+            jumps += 1
+            if jumps > 20:
+                raise ValueError("DNS名称压缩指针循环")
+            continue
+        if length == 0:
+            offset += 1
+            break
+        labels.append(data[offset + 1:offset + 1 + length].decode('ascii', 'replace'))
+        offset += 1 + length
+    return '.'.join(labels).lower(), end if end is not None else offset
+
+
+def parse_response(data: bytes) -> Tuple[int, int, List[Tuple[str, int, int, str]]]:
+    """解析DNS响应 返回(事务ID, rcode, [(名称, 类型, TTL, 数据)])"""
+    txid, flags, qdcount, ancount, _, _ = struct.unpack('!HHHHHH', data[:12])
+    offset = 12
+    for _ in range(qdcount):
+        _, offset = read_name(data, offset)
+        offset += 4
+
+    answers = []
+    for _ in range(ancount):
+        name, offset = read_name(data, offset)
+        rtype, _, ttl, rdlength = struct.unpack('!HHIH', data[offset:offset + 10])
+        offset += 10
+        rdata = data[offset:offset + rdlength]
+        if rtype == QTYPE_A and rdlength == 4:
+            value = socket.inet_ntop(socket.AF_INET, rdata)
+        elif rtype == QTYPE_AAAA and rdlength == 16:
+            value = socket.inet_ntop(socket.AF_INET6, rdata)
+        elif rtype == QTYPE_CNAME:
+            value, _ = read_name(data, offset)
+        else:
+            value = rdata.hex()
+        answers.append((name, rtype, ttl, value))
+        offset += rdlength
+    return txid, flags & 0x000f, answers
+
+
+class _DNSProtocol(asyncio.DatagramProtocol):
+    """按事务ID分发UDP响应"""
+
+    def __init__(self):
+        self.waiters: Dict[int, asyncio.Future] = {}
+
+    def datagram_received(self, data, addr):
+        if len(data) < 12:
+            return
+        txid = struct.unpack('!H', data[:2])[0]
+        future = self.waiters.pop(txid, None)
+        if future is not None and not future.done():
+            future.set_result(data)
+
+
+class DNSResolver:
+    """并发多上游DNS解析 同时向所有上游发送全部查询并合并结果"""
+
+    def __init__(self, upstreams: List[str] = None, timeout=2, retries=1, default_ttl=300,
+                 ipv6=False):
+        self.upstreams = upstreams or DEFAULT_RESOLVERS
+        self.timeout = timeout
+        self.retries = retries
+        self.default_ttl = default_ttl
+        # 启用IPv6时A和AAAA查询同时发出 不增加总耗时
+        self.ipv6 = ipv6
+        self.qtypes = (QTYPE_A, QTYPE_AAAA) if ipv6 else (QTYPE_A,)
+        self.ssl_context = ssl.create_default_context()
+        # 域名到CNAME链的映射
+        self.cnames: Dict[str, List[str]] = {}
+        self._protocol: _DNSProtocol = None
+
+    @staticmethod
+    def _parse_server(upstream: str) -> Tuple[str, int]:
+        """解析 ip / ip:port / IPv6 / [IPv6]:port 格式的上游地址"""
+        if upstream.startswith('['):
+            host, _, port = upstream[1:].partition(']')
+            return host, int(port.lstrip(':') or 53)
+        if upstream.count(':') == 1:
+            host, port = upstream.rsplit(':', 1)
+            return host, int(port)
+        return upstream, 53
+
+    def _new_txid(self) -> int:
+        while True:
+            txid = random.randint(0, 0xffff)
+            if txid not in self._protocol.waiters:
+                return txid
+
+    @staticmethod
+    def _failed(upstream: str, cause: str):
+        """记录一次查询失败"""
+        metrics.inc("dns_failures", upstream=upstream, cause=cause)
+
+    def _collect(self, domain: str, answers) -> Tuple[Set[str], int]:
+        """从应答中提取IP和最小TTL 同时记录CNAME链"""
+        ips = set()
+        ttl = None
+        chain = []
+        for name, rtype, record_ttl, value in answers:
+            if rtype in (QTYPE_A, QTYPE_AAAA):
+                ips.add(value)
+            elif rtype == QTYPE_CNAME:
+                chain.append(value)
+            else:
+                continue
+            ttl = record_ttl if ttl is None else min(ttl, record_ttl)
+        if chain:
+            # 不同上游可能返回不同的CNAME链 合并后用于分组
+            self.cnames[domain] = list(dict.fromkeys(self.cnames.get(domain, []) + chain))
+        return ips, ttl if ttl is not None else self.default_ttl
+
+    async def _query_udp(self, transport, server: Tuple[str, int], domain: str,
+                         qtype=QTYPE_A) -> Tuple[Set[str], int]:
+        """通过UDP查询单个上游 超时重传"""
+        loop = asyncio.get_running_loop()
+        upstream = server[0] if server[1] == 53 else f"{server[0]}:{server[1]}"
+        cause = None
+        for _ in range(self.retries + 1):
+            txid = self._new_txid()
+            future = loop.create_future()
+            self._protocol.waiters[txid] = future
+            try:
+                transport.sendto(build_query(txid, domain, qtype), server)
+                data = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                cause = "timeout"
+                continue
+            except OSError:
+                cause = "network"
+                continue
+            finally:
+                self._protocol.waiters.pop(txid, None)
+            try:
+                _, rcode, answers = parse_response(data)
+            except (ValueError, IndexError, struct.error):
+                cause = "malformed"
+                continue
+            if rcode != 0:
+                self._failed(upstream, RCODE_NAMES.get(rcode, f"rcode{rcode}"))
+                return set(), self.default_ttl
+            return self._collect(domain, answers)
+        self._failed(upstream, cause)
+        return set(), self.default_ttl
+
+    async def _query_doh(self, url: str, domain: str, qtype=QTYPE_A) -> Tuple[Set[str], int]:
+        """通过DNS over HTTPS查询 (RFC 8484 GET)"""
+        parts = urlsplit(url)
+        host = parts.hostname
+        dns = base64.urlsafe_b64encode(build_query(0, domain, qtype)).rstrip(b'=').decode()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, parts.port or 443, ssl=self.ssl_context,
+                                        server_hostname=host), self.timeout)
+            request = (f"GET {parts.path or '/dns-query'}?dns={dns} HTTP/1.1\r\n"
+                       f"Host: {host}\r\n"
+                       "Accept: application/dns-message\r\n"
+                       "Connection: close\r\n\r\n")
+            writer.write(request.encode())
+            response = await asyncio.wait_for(reader.read(), self.timeout)
+            header, _, body = response.partition(b"\r\n\r\n")
+            status = header.split(b" ", 2)[1]
+            if status != b"200":
+                self._failed(url, f"http{status.decode(errors='replace')}")
+                return set(), self.default_ttl
+            if b"transfer-encoding: chunked" in header.lower():
+                body = self._dechunk(body)
+            _, rcode, answers = parse_response(body)
+            if rcode != 0:
+                self._failed(url, RCODE_NAMES.get(rcode, f"rcode{rcode}"))
+                return set(), self.default_ttl
+            return self._collect(domain, answers)
+        except asyncio.TimeoutError:
+            self._failed(url, "timeout")
+        except ssl.SSLError:
+            self._failed(url, "tls")
+        except OSError:
+            self._failed(url, "network")
+        except (ValueError, IndexError, struct.error):
+            self._failed(url, "malformed")
+        finally:
+            if writer is not None:
+                writer.transport.abort()
+        return set(), self.default_ttl
+
+    @staticmethod
+    def _dechunk(body: bytes) -> bytes:
+        """解码chunked传输编码"""
+        result = b''
+        while body:
+            size_line, _, body = body.partition(b"\r\n")
+            size = int(size_line.split(b";")[0], 16)
+            if size == 0:
+                break
+            result += body[:size]
+            body = body[size + 2:]
+        return result
+
+    async def _query_system(self, domain: str) -> Tuple[Set[str], int]:
+        """通过系统解析器查询 无法获得TTL 使用默认值"""
+        loop = asyncio.get_running_loop()
+        family = socket.AF_UNSPEC if self.ipv6 else socket.AF_INET
+        try:
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(domain, 0, family=family, type=socket.SOCK_STREAM),
+                self.timeout)
+        except asyncio.TimeoutError:
+            self._failed("system", "timeout")
+            return set(), self.default_ttl
+        except socket.gaierror as e:
+            self._failed("system", "nxdomain" if e.errno == socket.EAI_NONAME else "gaierror")
+            return set(), self.default_ttl
+        except OSError:
+            self._failed("system", "network")
+            return set(), self.default_ttl
+        return {info[4][0] for info in infos
+                if info[0] in (socket.AF_INET, socket.AF_INET6)}, self.default_ttl
+
+    async def resolve_many(self, domains: List[str]) -> Dict[str, Tuple[Set[str], int]]:
+        """同时解析全部域名 返回域名到(IP集合, TTL)的映射"""
+        loop = asyncio.get_running_loop()
+        # IPv4和IPv6上游各用一个socket 共享同一个按事务ID分发的协议对象
+        self._protocol = _DNSProtocol()
+        servers = {upstream: self._parse_server(upstream) for upstream in self.upstreams
+                   if upstream != "system" and not upstream.startswith("https://")}
+        transports = {}
+        for v6 in {':' in host for host, _ in servers.values()} or {False}:
+            try:
+                transports[v6], _ = await loop.create_datagram_endpoint(
+                    lambda: self._protocol, local_addr=('::' if v6 else '0.0.0.0', 0))
+            except OSError:
+                # 没有IPv6网络时 IPv6上游的查询记为失败
+                if not v6:
+                    raise
+        try:
+            tasks = []
+            for domain in domains:
+                for upstream in self.upstreams:
+                    if upstream == "system":
+                        # 系统解析器一次返回两种地址
+                        coros = [self._query_system(domain)]
+                    elif upstream.startswith("https://"):
+                        coros = [self._query_doh(upstream, domain, qtype) for qtype in self.qtypes]
+                    else:
+                        server = servers[upstream]
+                        transport = transports.get(':' in server[0])
+                        if transport is None:
+                            self._failed(upstream, "unsupported")
+                            continue
+                        coros = [self._query_udp(transport, server, domain, qtype)
+                                 for qtype in self.qtypes]
+                    tasks.extend((domain, coro) for coro in coros)
+                    metrics.inc("dns_queries", len(coros), upstream=upstream)
+
+            answers = await asyncio.gather(*(coro for _, coro in tasks))
+        finally:
+            for transport in transports.values():
+                transport.close()
+
+        result: Dict[str, Tuple[Set[str], int]] = {}
+        for (domain, _), (ips, ttl) in zip(tasks, answers):
+            merged, merged_ttl = result.get(domain, (set(), ttl))
+            if ips:
+                merged_ttl = min(merged_ttl, ttl)
+            result[domain] = (merged | ips, merged_ttl)
+        return result
@@ -0,0 +1,164 @@
+import threading
+from tkinter import ttk
+from typing import Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+
+Key = Tuple[str, str]
+
+
+class ResultView:
+    """虚拟化的IP结果列表
+
+    数据保存在以(域名, IP)为键的内存模型中 Treeview只保留可见数量的行并循环复用
+    其他线程通过post提交更新 按固定帧率批量刷新到界面
+    """
+
+    def __init__(self, parent, columns: Sequence[str], height=8, fps=20):
+        self.columns = list(columns)
+        self.col_index = {column: i for i, column in enumerate(self.columns)}
+        self.height = height
+        self.interval = max(int(1000 / fps), 1)
+
+        self.tree = ttk.Treeview(parent, columns=self.columns, show="headings",
+                                 height=height, selectmode="none")
+        self.tree.tag_configure("selected", background="#cce5ff")
+        self.scrollbar = ttk.Scrollbar(parent, orient="vertical", command=self._on_scrollbar)
+
+        self.keys: List[Key] = []
+        self.data: Dict[Key, list] = {}
+        self.by_domain: Dict[str, List[Key]] = {}
+        self.selected: Set[Key] = set()
+        self.offset = 0
+
+        # 固定数量的行 滚动时只替换内容
+        self.items = [self.tree.insert("", "end", values=()) for _ in range(height)]
+        self._rendered: List[tuple] = [None] * height
+        self._pending: Dict[Key, dict] = {}
+        self._lock = threading.Lock()
+
+        self.tree.bind("<Button-1>", self._on_click)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1))
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-1))
+        self.tree.bind("<Button-5>", lambda e: self.scroll(1))
+        self.tree.after(self.interval, self._flush)
+        self.refresh()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _add(self, key: Key, values: Sequence):
+        row = list(values) + [""] * (len(self.columns) - len(values))
+        row[0], row[1] = key
+        self.keys.append(key)
+        self.data[key] = row
+        self.by_domain.setdefault(key[0], []).append(key)
+
+    def set_rows(self, rows: Iterable[Sequence]):
+        """替换全部数据 每行的前两列为域名和IP"""
+        self.keys = []
+        self.data = {}
+        self.by_domain = {}
+        self.selected = set()
+        self.offset = 0
+        for values in rows:
+            key = (values[0], values[1])
+            if key not in self.data:
+                self._add(key, values)
+        self.refresh()
+
+    def set_values(self, key: Key, **fields):
+        """在主线程中修改一行 不存在时新增 需要调用refresh刷新界面"""
+        row = self.data.get(key)
+        if row is None:
+            self._add(key, ())
+            row = self.data[key]
+        for column, value in fields.items():
+            row[self.col_index[column]] = value
+
+    def post(self, domain: str, ip: str, **fields):
+        """从任意线程提交更新 在下一帧统一应用"""
+        with self._lock:
+            self._pending.setdefault((domain, ip), {}).update(fields)
+
+    def discard_pending(self):
+        """丢弃还没有应用的更新 写入最终结果前调用 避免下一帧用过时的中间状态覆盖"""
+        with self._lock:
+            self._pending = {}
+
+    def _flush(self):
+        """按帧率应用累积的更新"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            for key, fields in pending.items():
+                self.set_values(key, **fields)
+            self.refresh()
+        self.tree.after(self.interval, self._flush)
+
+    def rows(self) -> Iterator[Tuple[Key, list]]:
+        """遍历模型中的所有行"""
+        return iter(list(self.data.items()))
+
+    def select(self, key: Key):
+        """选中一行 同一域名只能选中一个IP"""
+        for other in self.by_domain.get(key[0], []):
+            self.selected.discard(other)
+        if key in self.data:
+            self.selected.add(key)
+
+    def toggle(self, key: Key):
+        if key in self.selected:
+            self.selected.discard(key)
+        else:
+            self.select(key)
+        self.refresh()
+
+    def clear_selection(self):
+        self.selected = set()
+
+    def get_selected(self) -> List[list]:
+        """获取选中行的值"""
+        return [self.data[key] for key in self.keys if key in self.selected]
+
+    def scroll(self, delta: int):
+        self.offset = max(0, min(self.offset + delta, len(self.keys) - self.height))
+        self.refresh()
+        return "break"
+
+    def _on_scrollbar(self, action, value, unit=None):
+        if action == "moveto":
+            self.offset = int(float(value) * len(self.keys))
+            self.scroll(0)
+        else:
+            self.scroll(int(value) * (self.height if unit == "pages" else 1))
+
+    def _on_click(self, event):
+        # 只接管单元格上的点击 标题和列分隔线交给Treeview处理 保留调整列宽
+        if self.tree.identify_region(event.x, event.y) != "cell":
+            return None
+        item = self.tree.identify_row(event.y)
+        if item in self.items:
+            index = self.offset + self.items.index(item)
+            if index < len(self.keys):
+                self.toggle(self.keys[index])
+        return "break"
+
+    def refresh(self):
+        """只渲染可见区域 内容未变化的行不触发Tk调用"""
+        self.offset = max(0, min(self.offset, len(self.keys) - self.height))
+        visible = self.keys[self.offset:self.offset + self.height]
+        for i, item in enumerate(self.items):
+            if i < len(visible):
+                key = visible[i]
+                state = (tuple(self.data[key]), key in self.selected)
+            else:
+                state = ((), False)
+            if state == self._rendered[i]:
+                continue
+            self._rendered[i] = state
+            self.tree.item(item, values=state[0], tags=("selected",) if state[1] else ())
+
+        total = len(self.keys)
+        if total <= self.height:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.offset / total, (self.offset + self.height) / total)
@@ -0,0 +1,194 @@
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from ping import PingTester
+from store import SampleStore
+
+
+class ProbeScheduler:
+    """按IP去重的探测调度 每个地址只探测一次 再把结果分发给所有使用它的域名"""
+
+    def __init__(self, tester: PingTester, budget: int = None):
+        self.tester = tester
+        # 每个IP的探测次数 默认使用tester.count
+        self.budget = budget
+        self.index: Dict[str, List[str]] = {}
+        self.results: Dict[str, float] = {}
+        # 每个域名延迟最低的IP
+        self.winners: Dict[str, str] = {}
+        # 本次探测的全部样本 按列存储
+        self.store = SampleStore()
+        self.stats = {"requested": 0, "unique": 0, "saved": 0, "dedup_ratio": 1.0}
+
+    def build_index(self, domain_ips: Dict[str, Iterable[str]]) -> Dict[str, List[str]]:
+        """建立IP到域名的索引"""
+        index: Dict[str, List[str]] = {}
+        requested = 0
+        for domain, ips in domain_ips.items():
+            for ip in ips:
+                requested += 1
+                domains = index.setdefault(ip, [])
+                if domain not in domains:
+                    domains.append(domain)
+
+        unique = len(index)
+        self.index = index
+        self.stats = {
+            "requested": requested,
+            "unique": unique,
+            "saved": requested - unique,
+            "dedup_ratio": requested / unique if unique else 1.0,
+        }
+        return index
+
+    def _new_store(self, domain_ips: Dict[str, Iterable[str]], width: int) -> SampleStore:
+        store = SampleStore(width=max(width, 1))
+        for domain, ips in domain_ips.items():
+            store.set_domain(domain, ips)
+        return store
+
+    def _recorder(self, on_sample: Callable[[str, float], None] = None) -> Callable[[str, float], None]:
+        """包装on_sample 把每个样本写入store"""
+        def record(ip: str, delay: float):
+            self.store.add(ip, delay)
+            if on_sample:
+                on_sample(ip, delay)
+        return record
+
+    def run(self, domain_ips: Dict[str, Iterable[str]], use_cache=True,
+            on_sample: Callable[[str, float], None] = None) -> Dict[str, Dict[str, float]]:
+        """探测所有唯一IP 返回 域名 -> {IP: 延迟}"""
+        index = self.build_index(domain_ips)
+        # TLS模式下共享IP使用第一个域名作为SNI
+        sni = {ip: domains[0] for ip, domains in index.items()}
+
+        count = self.tester.count
+        if self.budget:
+            self.tester.count = self.budget
+        self.store = self._new_store(domain_ips, self.tester.count)
+        try:
+            self.results = self.tester.test_ips(list(index), sni=sni, use_cache=use_cache,
+                                                on_sample=self._recorder(on_sample))
+        finally:
+            self.tester.count = count
+
+        per_domain: Dict[str, Dict[str, float]] = {domain: {} for domain in domain_ips}
+        for ip, domains in index.items():
+            delay = self.results.get(ip, float('inf'))
+            for domain in domains:
+                per_domain[domain][ip] = delay
+            # 不逐个回调样本的测试器只提供平均值
+            if not self.store.counts[self.store.row(ip)]:
+                self.store.add(ip, delay)
+
+        self.winners = self.store.winners()
+        return per_domain
+
+
+class RacingScheduler(ProbeScheduler):
+    """逐轮淘汰的探测调度
+
+    每轮对仍有竞争力的IP各探测一次 下界比同域名最佳上界还差的IP被淘汰
+    直到每个域名只剩一个候选、达到最大轮数或用完时间预算
+    """
+
+    def __init__(self, tester: PingTester, max_rounds=4, time_budget: float = None,
+                 z=2.0, min_spread=1.0, rel_spread=0.1, max_loss=0.5):
+        super().__init__(tester)
+        self.max_rounds = max_rounds
+        self.time_budget = time_budget
+        self.z = z
+        self.min_spread = min_spread
+        self.rel_spread = rel_spread
+        self.max_loss = max_loss
+
+    def _bounds(self, samples: List[float], sent: int) -> Optional[Tuple[float, float, float]]:
+        """估计延迟均值的(均值, 下界, 上界) 丢包过多返回None"""
+        if not samples:
+            # 只探测过一次就丢包时不能判断 保留到下一轮 多次探测都丢包视为不可达
+            return (float('inf'), 0.0, float('inf')) if sent < 2 else None
+        if sent >= 2 and 1 - len(samples) / sent > self.max_loss:
+            return None
+        n = len(samples)
+        mean = sum(samples) / n
+        sd = math.sqrt(sum((x - mean) ** 2 for x in samples) / (n - 1)) if n > 1 else 0.0
+        # 样本太少时标准差不可靠 使用最小离散度兜底
+        spread = max(sd, self.min_spread, self.rel_spread * mean)
+        half = self.z * spread / math.sqrt(n)
+        return mean, mean - half, mean + half
+
+    def _prune(self, candidates: List[str], samples: Dict[str, List[float]],
+               sent: Dict[str, int]) -> List[str]:
+        """淘汰下界差于最佳上界的候选"""
+        bounds = {ip: self._bounds(samples[ip], sent[ip]) for ip in candidates}
+        alive = [ip for ip in candidates if bounds[ip] is not None]
+        if not alive:
+            return []
+        best_upper = min(bounds[ip][2] for ip in alive)
+        return [ip for ip in alive if bounds[ip][1] <= best_upper]
+
+    def run(self, domain_ips: Dict[str, Iterable[str]], use_cache=True,
+            on_sample: Callable[[str, float], None] = None) -> Dict[str, Dict[str, float]]:
+        """逐轮探测 返回 域名 -> {IP: 平均延迟}"""
+        index = self.build_index(domain_ips)
+        samples: Dict[str, List[float]] = {ip: [] for ip in index}
+        sent: Dict[str, int] = {ip: 0 for ip in index}
+        contenders = {domain: list(dict.fromkeys(ips)) for domain, ips in domain_ips.items()}
+
+        count = self.tester.count
+        self.tester.count = 1
+        self.store = self._new_store(domain_ips, self.max_rounds)
+        started = time.monotonic()
+        probes = 0
+        rounds = 0
+        try:
+            while rounds < self.max_rounds:
+                # 只剩一个候选的域名也要探测满两次 第一次丢包时才能判断是否可用
+                ips = list(dict.fromkeys(ip for candidates in contenders.values()
+                                         for ip in candidates
+                                         if len(candidates) > 1 or sent[ip] < 2))
+                if not ips:
+                    break
+                elapsed = time.monotonic() - started
+                if rounds and self.time_budget and elapsed + self.tester.timeout > self.time_budget:
+                    break
+
+                sni = {ip: index[ip][0] for ip in ips}
+                results = self.tester.test_ips(ips, sni=sni, use_cache=use_cache and rounds == 0,
+                                               on_sample=on_sample)
+                probes += len(ips)
+                rounds += 1
+                for ip in ips:
+                    sent[ip] += 1
+                    delay = results.get(ip, float('inf'))
+                    self.store.add(ip, delay)
+                    if delay != float('inf'):
+                        samples[ip].append(delay)
+
+                if getattr(self.tester, "cancelled", False):
+                    break
+                for domain, candidates in contenders.items():
+                    contenders[domain] = self._prune(candidates, samples, sent)
+        finally:
+            self.tester.count = count
+
+        self.results = {ip: sum(values) / len(values) if values else float('inf')
+                        for ip, values in samples.items()}
+        self.stats.update({
+            "probes": probes,
+            "rounds": rounds,
+            "exhaustive_probes": len(index) * self.max_rounds,
+        })
+
+        # 仍未淘汰且有样本的候选中均值最小者为胜出者 被淘汰的IP保留已有的均值
+        per_domain: Dict[str, Dict[str, float]] = {domain: {} for domain in domain_ips}
+        for ip, domains in index.items():
+            for domain in domains:
+                per_domain[domain][ip] = self.results[ip]
+        self.winners = {}
+        for domain, candidates in contenders.items():
+            finite = [ip for ip in candidates if self.results[ip] != float('inf')]
+            if finite:
+                self.winners[domain] = min(finite, key=self.results.get)
+        return per_domain
@@ -0,0 +1,30 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import requests
+
+USER_AGENT = "GitHubAcce"
+# 可重试的状态码 429和5xx通常是暂时性的
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def create_session(retries=3, backoff=0.5, pool_size=10) -> "requests.Session":
+    """创建复用连接的HTTP会话
+
+    连接、读取失败和可重试的状态码最多重试retries次 间隔按backoff指数增长
+    服务端返回Retry-After时按其等待
+    """
+    # requests和urllib3导入较慢 在第一次发起请求时才导入
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                  backoff_factor=backoff, status_forcelist=RETRY_STATUS,
+                  respect_retry_after_header=True, raise_on_status=False)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
@@ -0,0 +1,157 @@
+import multiprocessing
+import os
+import time
+from array import array
+from multiprocessing.connection import wait as wait_connections
+from typing import Callable, Dict, List
+
+from icmp import run_sync
+from metrics import metrics
+from ping import PingTester, make_prober
+
+# 子进程每积累这么多样本或超过这么久就回传一批
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 0.05
+
+
+def _worker(conn, ips: List[str], count: int, sni: Dict[str, str], config: dict,
+            cancel, factory: Callable):
+    """子进程入口 使用独立的事件循环和socket探测一个分片
+
+    样本以(分片内序号, 延迟)的数组按批发送 结束时发送各IP的分阶段耗时
+    """
+    positions = {ip: i for i, ip in enumerate(ips)}
+    indexes = array('I')
+    delays = array('d')
+    flushed = time.monotonic()
+
+    def flush():
+        nonlocal indexes, delays, flushed
+        if indexes:
+            conn.send(("samples", indexes, delays))
+            indexes, delays = array('I'), array('d')
+        flushed = time.monotonic()
+
+    def on_sample(ip: str, delay: float):
+        indexes.append(positions[ip])
+        delays.append(delay)
+        if len(indexes) >= BATCH_SIZE or time.monotonic() - flushed >= FLUSH_INTERVAL:
+            flush()
+
+    started = time.perf_counter()
+    try:
+        prober = factory(**config)
+        if not prober.open():
+            conn.send(("error", "无法创建探测socket"))
+            return
+        try:
+            run_sync(prober.probe_many(ips, count, on_sample=on_sample, sni=sni, cancel=cancel))
+        finally:
+            prober.close()
+        flush()
+        conn.send(("done", getattr(prober, "phases", {}), time.perf_counter() - started))
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+    finally:
+        conn.close()
+
+
+class ShardedPingTester(PingTester):
+    """把候选IP分片到多个进程中探测
+
+    每个进程使用独立的事件循环和socket 样本按批通过管道流式回传 在主进程中合并为一份结果
+    rate为所有进程合计的每秒探测次数 平均分给各进程 IP较少时直接在当前进程中探测
+    """
+
+    def __init__(self, timeout=3, count=2, interval=0.1, mode="icmp", port=443,
+                 cache=None, rate: float = None, workers: int = None, min_shard=256,
+                 prober_factory: Callable = None):
+        super().__init__(timeout=timeout, count=count, interval=interval, mode=mode, port=port,
+                         cache=cache, rate=rate)
+        self.workers = workers or os.cpu_count() or 1
+        # 每个分片至少包含的IP数 分片太小时进程启动的开销大于收益
+        self.min_shard = min_shard
+        # 在子进程中创建探测引擎 参数与make_prober相同 必须可以被pickle
+        self.prober_factory = prober_factory or make_prober
+        # 最近一次探测各分片的IP数和耗时(秒)
+        self.shard_stats: List[Dict[str, float]] = []
+
+    def _probe_ips(self, ips: List[str], max_workers=15, sni: Dict[str, str] = None,
+                   on_sample: Callable[[str, float], None] = None) -> Dict[str, float]:
+        shards = min(self.workers, len(ips) // max(self.min_shard, 1))
+        self.shard_stats = []
+        if shards < 2:
+            return super()._probe_ips(ips, max_workers, sni, on_sample)
+        # 当前进程都无法创建socket时子进程也不能 直接回退
+        if not self.prober.open():
+            return super()._probe_ips(ips, max_workers, sni, on_sample)
+        self.prober.close()
+
+        config = {"mode": self.mode, "timeout": self.timeout, "interval": self.interval,
+                  "port": self.port, "rate": self.rate / shards if self.rate else None}
+        context = multiprocessing.get_context()
+        cancel = context.Event()
+        processes = []
+        pending = {}
+        for i in range(shards):
+            # 交错分片 相邻网段的地址分散到不同进程
+            shard = ips[i::shards]
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_worker, daemon=True,
+                args=(sender, shard, self.count, {ip: sni[ip] for ip in shard if ip in sni}
+                      if sni else None, config, cancel, self.prober_factory))
+            process.start()
+            sender.close()
+            processes.append(process)
+            pending[receiver] = shard
+
+        samples: Dict[str, List[float]] = {ip: [] for ip in ips}
+        details: Dict[str, List[Dict[str, float]]] = {}
+        failed: List[str] = []
+        metrics.inc("shards", shards, mode=self.mode)
+        try:
+            while pending:
+                if self.cancelled:
+                    cancel.set()
+                for receiver in wait_connections(list(pending), timeout=0.1):
+                    shard = pending[receiver]
+                    try:
+                        message = receiver.recv()
+                    except EOFError:
+                        message = ("error", "子进程意外退出")
+                    if message[0] == "samples":
+                        for index, delay in zip(message[1], message[2]):
+                            ip = shard[index]
+                            if delay != float('inf'):
+                                samples[ip].append(delay)
+                            if on_sample:
+                                on_sample(ip, delay)
+                        continue
+                    del pending[receiver]
+                    receiver.close()
+                    if message[0] == "done":
+                        details.update(message[1])
+                        self.shard_stats.append({"ips": len(shard),
+                                                 "seconds": round(message[2], 3)})
+                    else:
+                        print(f"分片探测失败: {message[1]}")
+                        metrics.inc("shard_failures", mode=self.mode)
+                        # 已经回传的样本保留 只重新探测还没有样本的IP
+                        failed.extend(ip for ip in shard if not samples[ip])
+        finally:
+            if pending:
+                cancel.set()
+            for process in processes:
+                process.join(self.timeout + 1)
+                if process.is_alive():
+                    process.terminate()
+
+        results = {ip: sum(delays) / len(delays) if delays else float('inf')
+                   for ip, delays in samples.items()}
+        if failed and not self.cancelled:
+            results.update(super()._probe_ips(failed, max_workers, sni, on_sample))
+            details.update(self.details)
+        self.results = results
+        self.details = details if self.mode != "icmp" else {}
+        return self.results
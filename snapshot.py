@@ -0,0 +1,85 @@
+import difflib
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+
+class SnapshotStore:
+    """按内容寻址的hosts文件版本库 相同内容只保存一份"""
+
+    def __init__(self, directory: str, keep=30):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.index_path = os.path.join(directory, "index.json")
+        self.keep = keep
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _load_index(self) -> List[Dict]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _save_index(self, index: List[Dict]):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, self.index_path)
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest)
+
+    def save(self, content: str, note: str = "") -> Optional[str]:
+        """保存一个版本 与最新版本内容相同时不保存 返回版本ID"""
+        data = content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        index = self._load_index()
+        if index and index[-1]["id"] == digest:
+            return None
+
+        path = self._object_path(digest)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(data)
+
+        index.append({"id": digest, "time": time.time(), "size": len(data), "note": note})
+        self._prune(index)
+        self._save_index(index)
+        return digest
+
+    def _prune(self, index: List[Dict]):
+        """只保留最近keep个版本 删除不再被引用的对象"""
+        if len(index) <= self.keep:
+            return
+        removed = index[:len(index) - self.keep]
+        del index[:len(index) - self.keep]
+        referenced = {entry["id"] for entry in index}
+        for entry in removed:
+            if entry["id"] not in referenced and os.path.exists(self._object_path(entry["id"])):
+                os.remove(self._object_path(entry["id"]))
+
+    def list(self) -> List[Dict]:
+        """列出所有版本 最新的在前"""
+        return list(reversed(self._load_index()))
+
+    def resolve(self, version: str) -> Optional[str]:
+        """将版本ID前缀解析为完整ID"""
+        matches = {entry["id"] for entry in self._load_index() if entry["id"].startswith(version)}
+        return matches.pop() if len(matches) == 1 else None
+
+    def read(self, version: str) -> Optional[str]:
+        """读取指定版本的内容"""
+        digest = self.resolve(version)
+        if digest is None:
+            return None
+        with open(self._object_path(digest), 'rb') as f:
+            return f.read().decode('utf-8')
+
+    def diff(self, old: str, new: str, old_name="old", new_name="new") -> str:
+        """生成两段内容的统一diff"""
+        return ''.join(difflib.unified_diff(old.splitlines(keepends=True),
+                                            new.splitlines(keepends=True),
+                                            fromfile=old_name, tofile=new_name))
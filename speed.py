@@ -0,0 +1,133 @@
+import asyncio
+import ssl
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from icmp import run_sync
+
+# 各域名用于测速的资源路径 都由该域名直接返回200或206 未列出的域名请求根路径
+# objects.githubusercontent.com只提供带签名的临时链接 没有固定可用的资源 不参与测速
+DEFAULT_TEST_PATHS = {
+    "github.com": "/git/git/blob/master/Makefile",
+    "codeload.github.com": "/git/git/tar.gz/refs/tags/v2.40.0",
+    "raw.githubusercontent.com": "/git/git/master/Documentation/RelNotes/2.40.0.txt",
+    "github.githubassets.com": "/favicons/favicon.png",
+}
+
+REDIRECT_STATUS = (b"301", b"302", b"303", b"307", b"308")
+
+
+def _same_host_location(headers: bytes, host: str) -> Optional[str]:
+    """重定向到同一域名时返回新的路径 跳转到其他域名时返回None"""
+    for line in headers.split(b"\r\n"):
+        name, _, value = line.partition(b":")
+        if name.strip().lower() != b"location":
+            continue
+        location = urlsplit(value.strip().decode('latin-1'))
+        if location.netloc and location.netloc.lower() not in (host, f"{host}:443"):
+            return None
+        return (location.path or "/") + (f"?{location.query}" if location.query else "")
+    return None
+
+
+class SpeedTester:
+    """下载速度测试 将连接固定到指定IP 使用正确的Host/SNI获取有限字节范围"""
+
+    def __init__(self, max_bytes=1024 * 1024, max_time=5.0, port=443,
+                 concurrency=4, ssl_context: ssl.SSLContext = None):
+        self.max_bytes = max_bytes
+        self.max_time = max_time
+        self.port = port
+        self.concurrency = concurrency
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self.results: Dict[str, float] = {}
+
+    async def _measure(self, ip: str, host: str, path: str, redirects=1) -> float:
+        """测量单个IP的下载速度 返回字节/秒 未测出时返回0
+
+        同一域名内的重定向最多跟随redirects次 仍通过同一个IP请求
+        """
+        loop = asyncio.get_running_loop()
+        writer = None
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, self.port, ssl=self.ssl_context, server_hostname=host),
+                self.max_time)
+
+            request = (f"GET {path} HTTP/1.1\r\n"
+                       f"Host: {host}\r\n"
+                       f"Range: bytes=0-{self.max_bytes - 1}\r\n"
+                       "User-Agent: GitHubAcce\r\n"
+                       "Connection: close\r\n\r\n")
+            writer.write(request.encode())
+            await writer.drain()
+
+            header = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.max_time)
+            status_line, _, headers = header.partition(b"\r\n")
+            status = status_line.split(b" ", 2)[1]
+            if status in REDIRECT_STATUS and redirects > 0:
+                location = _same_host_location(headers, host)
+                if location is None:
+                    return 0.0
+                writer.transport.abort()
+                writer = None
+                return await self._measure(ip, host, location, redirects - 1)
+            if status not in (b"200", b"206"):
+                return 0.0
+
+            # 从收到响应头开始计时 只统计响应体的持续传输速度
+            start = loop.time()
+            deadline = start + self.max_time
+            received = 0
+            while received < self.max_bytes:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    chunk = await asyncio.wait_for(reader.read(65536), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if not chunk:
+                    break
+                received += len(chunk)
+
+            elapsed = loop.time() - start
+            if received == 0 or elapsed <= 0:
+                return 0.0
+            return received / elapsed
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError, IndexError):
+            return 0.0
+        finally:
+            if writer is not None:
+                writer.transport.abort()
+
+    async def measure_many(self, ips: List[str], host: str, path: str = None) -> Dict[str, float]:
+        """并发测量多个IP的下载速度"""
+        path = path or DEFAULT_TEST_PATHS.get(host, "/")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(ip: str) -> Tuple[str, float]:
+            async with semaphore:
+                return ip, await self._measure(ip, host, path)
+
+        return dict(await asyncio.gather(*(run(ip) for ip in ips)))
+
+    def rank(self, host: str, latencies: Dict[str, float], top_n=3,
+             path: str = None) -> List[Tuple[str, float]]:
+        """取延迟最低的top_n个IP测速 按速度从高到低返回(ip, 字节/秒)"""
+        candidates = sorted((ip for ip, delay in latencies.items() if delay != float('inf')),
+                            key=latencies.get)[:top_n]
+        if not candidates:
+            return []
+
+        speeds = run_sync(self.measure_many(candidates, host, path))
+        # 速度为0表示没有测出 不是最慢 不记录也不参与排序
+        valid = [(ip, speed) for ip, speed in speeds.items() if speed > 0]
+        self.results.update(valid)
+        return sorted(valid, key=lambda x: x[1], reverse=True)
+
+    def get_fastest_ip(self, host: str, latencies: Dict[str, float], top_n=3) -> Optional[str]:
+        """获取下载速度最快的IP 都没有测出速度时返回None"""
+        ranked = self.rank(host, latencies, top_n)
+        return ranked[0][0] if ranked else None
@@ -0,0 +1,301 @@
+import json
+import math
+import mmap
+import os
+import socket
+import struct
+import sys
+import warnings
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# None表示未安装 False表示还没有尝试导入
+_np = False
+
+MAGIC = b"GASTORE2"
+# 魔数, 字节序, IP数量, 每个IP的样本数, 域名数量, 成员总数, IPv6地址数量, 域名表长度
+HEADER = struct.Struct("<8sBIIIIII")
+STATS = ("mean", "min", "p50", "p95", "loss")
+# IP数量少于该值时纯Python更快 也省去导入NumPy的时间
+NUMPY_MIN_ROWS = 2048
+
+
+def pack_ip(ip: str) -> int:
+    """IPv4地址转换为32位整数"""
+    return struct.unpack("!I", socket.inet_aton(ip))[0]
+
+
+def unpack_ip(value: int) -> str:
+    """32位整数转换为IPv4地址"""
+    return socket.inet_ntoa(struct.pack("!I", value))
+
+
+def get_numpy():
+    """第一次计算统计值时才导入NumPy 导入本身需要上百毫秒 不拖慢启动
+
+    NumPy是可选依赖 没有安装时返回None 使用纯Python实现
+    """
+    global _np
+    if _np is False:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:
+            _np = None
+    return _np
+
+
+def _percentile(values: List[float], p: float) -> float:
+    """线性插值百分位 与monitor.RollingStats.percentile一致"""
+    if not values:
+        return float('inf')
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+class SampleStore:
+    """按列存储的延迟样本
+
+    IPv4地址以32位整数保存在array('I')中 IPv6地址较少 该列记为0 地址另存在wide中
+    每个IP占用固定width个float32样本槽位(环形写入)
+    丢包记为inf 未写入的槽位为NaN 域名到IP的关系保存为行号数组
+    可保存为单个文件 load通过mmap直接映射 不需要解析 首次修改时才复制到内存
+    """
+
+    def __init__(self, width=8):
+        self.width = width
+        self.ips = array('I')
+        self.counts = array('I')
+        self.samples = array('f')
+        self.members: Dict[str, Sequence[int]] = {}
+        # IPv6地址所在行 -> 16字节地址
+        self.wide: Dict[int, bytes] = {}
+        # IPv4为整数键 IPv6为16字节键
+        self._rows: Optional[Dict[object, int]] = {}
+        self._mmap: Optional[mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.ips)
+
+    def _writable(self):
+        """mmap加载的只读视图在首次修改时复制为array"""
+        if self._mmap is None:
+            return
+        self.ips = array('I', self.ips)
+        self.counts = array('I', self.counts)
+        self.samples = array('f', self.samples)
+        self.members = {domain: array('I', rows) for domain, rows in self.members.items()}
+        self._release()
+
+    def _release(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # 仍有外部引用的视图时交给垃圾回收释放
+            pass
+        self._mmap = None
+
+    def _index(self) -> Dict[object, int]:
+        if self._rows is None:
+            self._rows = {value: row for row, value in enumerate(self.ips)}
+            for row, packed in self.wide.items():
+                self._rows[packed] = row
+        return self._rows
+
+    def _address(self, row: int, value: int) -> str:
+        if not value and row in self.wide:
+            return socket.inet_ntop(socket.AF_INET6, self.wide[row])
+        return unpack_ip(value)
+
+    def row(self, ip: str, create=True) -> Optional[int]:
+        """IP所在的行号 不存在时新增一行"""
+        if ':' in ip:
+            key = socket.inet_pton(socket.AF_INET6, ip)
+            value = 0
+        else:
+            key = value = pack_ip(ip)
+        rows = self._index()
+        row = rows.get(key)
+        if row is None and create:
+            self._writable()
+            row = rows[key] = len(self.ips)
+            if not value:
+                self.wide[row] = key
+            self.ips.append(value)
+            self.counts.append(0)
+            self.samples.extend([math.nan] * self.width)
+        return row
+
+    def add(self, ip: str, delay: float):
+        """追加一个样本 超过width后覆盖最早的样本"""
+        row = self.row(ip)
+        self._writable()
+        self.samples[row * self.width + self.counts[row] % self.width] = delay
+        self.counts[row] += 1
+
+    def add_many(self, results: Dict[str, float]):
+        for ip, delay in results.items():
+            self.add(ip, delay)
+
+    def set_domain(self, domain: str, ips: Iterable[str]):
+        """设置域名的候选IP"""
+        rows = array('I', dict.fromkeys(self.row(ip) for ip in ips))
+        self._writable()
+        self.members[domain] = rows
+
+    def domain_ips(self, domain: str) -> List[str]:
+        return [self._address(row, self.ips[row]) for row in self.members.get(domain, ())]
+
+    def column(self, stat="mean") -> Sequence[float]:
+        """计算所有IP的统计值 没有有效样本的IP为inf loss为丢包率"""
+        if stat not in STATS:
+            raise ValueError(f"未知的统计量: {stat}")
+        np = get_numpy() if len(self.ips) >= NUMPY_MIN_ROWS else None
+        if np is not None:
+            return self._column_numpy(np, stat)
+        return array('d', (self._row_stat(row, stat) for row in range(len(self.ips))))
+
+    def _row_stat(self, row: int, stat: str) -> float:
+        values = self.samples[row * self.width:(row + 1) * self.width]
+        # NaN与自身不相等 x == x 过滤掉空槽位
+        received = [x for x in values if x == x and x != math.inf]
+        if stat == "loss":
+            filled = sum(1 for x in values if x == x)
+            return 1 - len(received) / filled if filled else 0.0
+        if not received:
+            return float('inf')
+        if stat == "mean":
+            return sum(received) / len(received)
+        if stat == "min":
+            return min(received)
+        return _percentile(received, 50 if stat == "p50" else 95)
+
+    def _column_numpy(self, np, stat: str):
+        matrix = np.frombuffer(self.samples, dtype=np.float32).reshape(-1, self.width)
+        if stat == "loss":
+            filled = (~np.isnan(matrix)).sum(axis=1)
+            lost = np.isinf(matrix).sum(axis=1)
+            return np.divide(lost, filled, out=np.zeros(len(matrix)), where=filled > 0)
+
+        received = np.where(np.isfinite(matrix), matrix, np.nan).astype(np.float64)
+        with warnings.catch_warnings():
+            # 没有有效样本的行会产生全NaN警告 结果在下面统一换成inf
+            warnings.simplefilter("ignore", RuntimeWarning)
+            if stat == "mean":
+                values = np.nanmean(received, axis=1)
+            elif stat == "min":
+                values = np.nanmin(received, axis=1)
+            else:
+                values = np.nanpercentile(received, 50 if stat == "p50" else 95, axis=1)
+        return np.nan_to_num(values, nan=np.inf)
+
+    def rank(self, domain: str, stat="mean", column: Sequence[float] = None) -> List[Tuple[str, float]]:
+        """域名的可用IP及统计值 按从低到高排列
+
+        对多个域名排序时可传入预先计算的column 避免重复计算
+        """
+        rows = self.members.get(domain, ())
+        if column is None:
+            column = self.column(stat)
+        np = get_numpy() if len(self.ips) >= NUMPY_MIN_ROWS else None
+        if np is not None:
+            rows = np.frombuffer(rows, dtype=np.uint32) if len(rows) else np.zeros(0, dtype=np.uint32)
+            values = np.asarray(column)[rows]
+            valid = np.isfinite(values)
+            rows, values = rows[valid], values[valid]
+            order = np.argsort(values, kind="stable")
+            rows = rows[order]
+            ips = np.frombuffer(self.ips, dtype=np.uint32)[rows]
+            return [(self._address(row, ip), value)
+                    for row, ip, value in zip(rows.tolist(), ips.tolist(), values[order].tolist())]
+        ranked = sorted((column[row], row) for row in rows if column[row] != float('inf'))
+        return [(self._address(row, self.ips[row]), value) for value, row in ranked]
+
+    def winners(self, stat="mean") -> Dict[str, str]:
+        """每个域名统计值最低的IP"""
+        column = self.column(stat)
+        winners = {}
+        for domain in self.members:
+            ranked = self.rank(domain, column=column)
+            if ranked:
+                winners[domain] = ranked[0][0]
+        return winners
+
+    def results(self, stat="mean") -> Dict[str, float]:
+        """转换为IP到统计值的字典 兼容PingTester.results"""
+        return {self._address(row, value): float(delay)
+                for row, (value, delay) in enumerate(zip(self.ips, self.column(stat)))}
+
+    def save(self, path: str):
+        """保存为单个二进制文件 先写临时文件再替换"""
+        # Windows下不能替换仍被映射的文件
+        self._writable()
+        domains = list(self.members)
+        names = json.dumps(domains).encode('utf-8')
+        members = array('I')
+        offsets = array('I', [0])
+        for domain in domains:
+            members.extend(self.members[domain])
+            offsets.append(len(members))
+        wide_rows = array('I', self.wide)
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, sys.byteorder == "little", len(self.ips), self.width,
+                                len(domains), len(members), len(wide_rows), len(names)))
+            # 头部为33字节 补齐到4字节对齐 之后的数组都可以直接映射
+            f.write(b'\x00' * (-HEADER.size % 4))
+            for data in (self.ips, self.counts, self.samples, offsets, members, wide_rows):
+                f.write(memoryview(data).cast('B'))
+            f.write(b''.join(self.wide[row] for row in wide_rows))
+            f.write(names)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["SampleStore"]:
+        """通过mmap加载 文件不存在或格式不符时返回None"""
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        try:
+            magic, little, count, width, domains, total, wide, names_size = HEADER.unpack_from(mapped)
+        except struct.error:
+            mapped.close()
+            return None
+        if magic != MAGIC or bool(little) != (sys.byteorder == "little"):
+            mapped.close()
+            return None
+
+        view = memoryview(mapped)
+        offset = HEADER.size + (-HEADER.size % 4)
+        sections = []
+        for fmt, length in (('I', count), ('I', count), ('f', count * width),
+                            ('I', domains + 1), ('I', total), ('I', wide)):
+            sections.append(view[offset:offset + length * 4].cast(fmt))
+            offset += length * 4
+        ips, counts, samples, offsets, members, wide_rows = sections
+        # IPv6地址通常很少 直接复制
+        packed = bytes(view[offset:offset + wide * 16])
+        offset += wide * 16
+        names = json.loads(bytes(view[offset:offset + names_size]).decode('utf-8'))
+
+        store = cls(width)
+        store.ips, store.counts, store.samples = ips, counts, samples
+        store.members = {domain: members[offsets[i]:offsets[i + 1]] for i, domain in enumerate(names)}
+        store.wide = {row: packed[i * 16:(i + 1) * 16] for i, row in enumerate(wide_rows)}
+        # IP到行号的索引在第一次查找时才建立
+        store._rows = None
+        store._mmap = mapped
+        return store
+
+    def close(self):
+        """释放mmap 之后不能再访问加载的数据"""
+        if self._mmap is not None:
+            self.ips = self.counts = self.samples = None
+            self.members = {}
+            self._release()
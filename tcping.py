@@ -0,0 +1,106 @@
+import asyncio
+import socket
+import ssl
+import threading
+from typing import Callable, Dict, List, Optional
+
+from icmp import RateLimiter, wait_any
+from metrics import metrics
+
+
+class TCPProber:
+    """TCP连接/TLS握手延迟探测 使用非阻塞socket并发执行"""
+
+    def __init__(self, timeout=3, interval=0.1, port=443, tls=False,
+                 server_hostname="github.com", concurrency=256, rate: float = None):
+        self.timeout = timeout
+        self.interval = interval
+        self.port = port
+        self.tls = tls
+        self.server_hostname = server_hostname
+        self.concurrency = concurrency
+        # 每秒最多发起的连接数 为空时不限制
+        self.rate = rate
+        self.ssl_context = ssl.create_default_context()
+        # 每个IP每次探测的分阶段耗时(ms) connect/tls/total
+        self.phases: Dict[str, List[Dict[str, float]]] = {}
+
+    def open(self) -> bool:
+        """TCP探测不需要预先创建socket"""
+        return True
+
+    def close(self):
+        pass
+
+    async def _probe_once(self, ip: str, sni: str) -> Optional[Dict[str, float]]:
+        """对单个IP进行一次连接 成功返回各阶段耗时 失败返回None"""
+        loop = asyncio.get_running_loop()
+        family = socket.AF_INET6 if ':' in ip else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        phases = {}
+        start = loop.time()
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (ip, self.port)), self.timeout)
+            phases['connect'] = (loop.time() - start) * 1000
+
+            if self.tls:
+                handshake_start = loop.time()
+                remaining = max(self.timeout - (handshake_start - start), 0.001)
+                _, writer = await asyncio.wait_for(
+                    asyncio.open_connection(sock=sock, ssl=self.ssl_context, server_hostname=sni),
+                    remaining)
+                phases['tls'] = (loop.time() - handshake_start) * 1000
+                writer.transport.abort()
+
+            phases['total'] = (loop.time() - start) * 1000
+            return phases
+        except asyncio.TimeoutError:
+            self._failed("timeout")
+        except ConnectionRefusedError:
+            self._failed("refused")
+        except ssl.SSLError:
+            self._failed("tls")
+        except OSError:
+            self._failed("network")
+        finally:
+            sock.close()
+        return None
+
+    def _failed(self, cause: str):
+        """记录一次失败的探测 区分超时、拒绝连接、TLS错误和其他网络错误"""
+        metrics.inc("probe_failures", mode="tls" if self.tls else "tcp", cause=cause)
+
+    async def probe_many(self, ips: List[str], count=1,
+                         on_sample: Callable[[str, float], None] = None,
+                         sni: Dict[str, str] = None,
+                         cancel: threading.Event = None) -> Dict[str, List[float]]:
+        """并发探测所有IP 返回每个IP的总耗时样本列表(ms)
+
+        sni为IP到域名的映射 用于TLS握手时的SNI和证书校验 cancel被设置后尽快停止
+        """
+        sni = sni or {}
+        samples: Dict[str, List[float]] = {ip: [] for ip in ips}
+        self.phases = {ip: [] for ip in ips}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        limiter = RateLimiter(self.rate)
+
+        async def run(ip: str):
+            host = sni.get(ip, self.server_hostname)
+            for i in range(count):
+                async with semaphore:
+                    await limiter.wait()
+                    phases = await self._probe_once(ip, host)
+                if phases is None:
+                    delay = float('inf')
+                else:
+                    delay = phases['total']
+                    samples[ip].append(delay)
+                    self.phases[ip].append(phases)
+                if on_sample:
+                    on_sample(ip, delay)
+                if i < count - 1:
+                    await asyncio.sleep(self.interval)
+
+        await wait_any([asyncio.gather(*(run(ip) for ip in ips))], cancel=cancel)
+        return samples
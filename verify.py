@@ -0,0 +1,170 @@
+import asyncio
+import ssl
+import time
+from typing import Dict, List, Optional, Union
+
+from host import HostsManager
+from icmp import run_sync
+from metrics import metrics
+
+Mapping = Dict[str, Union[str, List[str]]]
+
+
+def _ips(value: Union[str, List[str]]) -> List[str]:
+    return [value] if isinstance(value, str) else list(value)
+
+
+class HostsVerifier:
+    """写入hosts后直接连接新IP发起HTTPS HEAD请求 校验证书与域名匹配并计时
+
+    直接连接IP而不是按域名访问 不受系统DNS缓存影响
+    失败的条目或比原来的IP慢margin毫秒以上的条目回滚到原来的映射 原来没有映射时从配置块中移除
+    """
+
+    def __init__(self, timeout=5.0, port=443, path="/", margin=150.0, attempts=2,
+                 concurrency=32, cafile: str = None):
+        self.timeout = timeout
+        self.port = port
+        self.path = path
+        self.margin = margin
+        # 每个IP请求几次 取最快的一次 单次请求的耗时波动较大
+        self.attempts = attempts
+        self.concurrency = concurrency
+        self.ssl_context = ssl.create_default_context(cafile=cafile)
+
+    async def _head_once(self, domain: str, ip: str) -> dict:
+        """通过指定IP请求一次 返回状态码和耗时(ms) 失败时返回错误原因"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        writer = None
+        try:
+            reader, writer = await asyncio.open_connection(
+                ip, self.port, ssl=self.ssl_context, server_hostname=domain)
+            writer.write(f"HEAD {self.path} HTTP/1.1\r\nHost: {domain}\r\n"
+                         f"User-Agent: GitHubAcce\r\nConnection: close\r\n\r\n".encode('ascii'))
+            parts = (await reader.readline()).decode('latin-1').split()
+            if len(parts) < 2 or not parts[0].startswith("HTTP/") or not parts[1].isdigit():
+                return {"error": "无效的HTTP响应", "cause": "http"}
+            status = int(parts[1])
+            result = {"status": status, "ms": round((loop.time() - start) * 1000, 1)}
+            if status >= 500:
+                result.update(error=f"HTTP {status}", cause="http")
+            return result
+        except ssl.SSLCertVerificationError as e:
+            return {"error": f"证书不匹配: {e.verify_message}", "cause": "certificate"}
+        except ssl.SSLError as e:
+            return {"error": f"TLS错误: {e.reason or e}", "cause": "tls"}
+        except ConnectionRefusedError:
+            return {"error": "连接被拒绝", "cause": "refused"}
+        except OSError as e:
+            return {"error": f"网络错误: {e.strerror or e}", "cause": "network"}
+        finally:
+            if writer is not None:
+                writer.transport.abort()
+
+    async def _head(self, domain: str, ip: str, semaphore: asyncio.Semaphore) -> dict:
+        """请求attempts次 有一次成功即视为可用 耗时取最快的一次"""
+        results = []
+        for _ in range(self.attempts):
+            async with semaphore:
+                try:
+                    result = await asyncio.wait_for(self._head_once(domain, ip), self.timeout)
+                except asyncio.TimeoutError:
+                    result = {"error": "超时", "cause": "timeout"}
+            results.append(result)
+            if "error" in result and result["cause"] in ("certificate", "refused"):
+                # 证书错误和拒绝连接重试也不会改变
+                break
+        passed = [result for result in results if "error" not in result]
+        if passed:
+            best = min(passed, key=lambda result: result["ms"])
+            return {"ip": ip, "ok": True, "status": best["status"], "ms": best["ms"]}
+        failed = results[-1]
+        metrics.inc("verify_failures", cause=failed["cause"])
+        return {"ip": ip, "ok": False, "status": failed.get("status"), "ms": None,
+                "error": failed["error"]}
+
+    async def _check(self, targets: List[tuple]) -> List[dict]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._head(domain, ip, semaphore) for domain, ip in targets))
+
+    def check(self, targets: List[tuple]) -> Dict[tuple, dict]:
+        """并发验证一组(域名, IP) 返回每一组的结果"""
+        targets = list(dict.fromkeys(targets))
+        if not targets:
+            return {}
+        with metrics.timer("stage", stage="verify"):
+            return dict(zip(targets, run_sync(self._check(targets))))
+
+    def _regressed(self, new: dict, old: Optional[dict]) -> bool:
+        return bool(old and old["ok"] and new["ms"] - old["ms"] > self.margin)
+
+    def verify(self, mapping: Mapping, previous: Mapping = None) -> Dict[str, dict]:
+        """验证新映射中的每个IP 与原来的IP不同时同时验证原来的IP作比较
+
+        返回 域名->结果 ok为新映射的所有IP都可用 revert为需要回滚
+        """
+        previous = previous or {}
+        targets = []
+        for domain, value in mapping.items():
+            new_ips = _ips(value)
+            targets.extend((domain, ip) for ip in new_ips)
+            old_ips = _ips(previous.get(domain, []))
+            if old_ips and old_ips != new_ips:
+                targets.extend((domain, ip) for ip in old_ips)
+        results = self.check(targets)
+
+        report = {}
+        for domain, value in mapping.items():
+            new_ips = _ips(value)
+            old_ips = _ips(previous.get(domain, []))
+            checks = [results[(domain, ip)] for ip in new_ips]
+            failed = [check for check in checks if not check["ok"]]
+            entry = {"ips": new_ips, "ok": not failed, "checks": checks,
+                     "previous": old_ips or None, "revert": False, "reason": None}
+            if old_ips != new_ips:
+                # 同一协议族的新旧IP对比耗时
+                old_checks = {':' in ip: results[(domain, ip)] for ip in old_ips}
+                if failed:
+                    entry.update(revert=True, reason=failed[0]["error"])
+                else:
+                    for check in checks:
+                        old = old_checks.get(':' in check["ip"])
+                        if self._regressed(check, old):
+                            entry.update(revert=True,
+                                         reason=f"比原来的IP慢 {check['ms'] - old['ms']:.0f}ms")
+                            break
+            report[domain] = entry
+        return report
+
+    def apply(self, hosts_manager: HostsManager, mapping: Mapping, previous: Mapping = None) -> dict:
+        """写入hosts 验证后回滚失败或变慢的条目 返回最终的映射和每个域名的验证结果
+
+        previous为写入前的映射 不指定时从hosts文件中读取
+        """
+        if previous is None:
+            previous = hosts_manager.get_entries(list(mapping))
+        started = time.time()
+        if not hosts_manager.update_github_hosts(mapping):
+            return {"written": False, "mapping": previous, "domains": {}, "reverted": []}
+        domains = self.verify(mapping, previous)
+        reverted = [domain for domain, entry in domains.items() if entry["revert"]]
+        final = dict(mapping)
+        removed = []
+        for domain in reverted:
+            if previous.get(domain):
+                final[domain] = previous[domain]
+            else:
+                del final[domain]
+                removed.append(domain)
+        if reverted:
+            metrics.inc("hosts_reverted", len(reverted))
+            if not hosts_manager.update_github_hosts(
+                    {domain: final[domain] for domain in reverted if domain in final}, remove=removed):
+                # 回滚失败时hosts中仍是新映射
+                final = dict(mapping)
+                reverted = []
+        for domain, entry in domains.items():
+            entry["reverted"] = domain in reverted
+        return {"written": True, "mapping": final, "domains": domains, "reverted": reverted,
+                "duration": round(time.time() - started, 3)}